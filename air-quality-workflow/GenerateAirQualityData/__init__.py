@@ -1,53 +1,334 @@
+import asyncio
 import datetime
 import logging
 import os
-import random
+import threading
+import time
 
 import azure.functions as func
+import numpy as np
 
-from azure_sql import get_sql_connection
+from async_ingest import ingest_async
+from azure_sql import pooled_connection
+from bulk_insert import DEFAULT_CHUNK_SIZE, write_readings
+from parallel_writer import DEFAULT_RETRIES, write_sharded
+from reading_generator import generate_batch
+from spool import DEFAULT_FLUSH_MAX_ROWS, DEFAULT_SEGMENT_BYTES, Spool, flush, flush_due
+from streaming_ingest import stream_ingest
+from workload_profiles import WorkloadGenerator, get_profile
+
+
+_seeded_rngs = {}
+_seeded_rngs_lock = threading.Lock()
+
+
+def _get_rng():
+    """A fresh generator, or with GENERATOR_SEED the module-level one for that seed.
+
+    The seeded generator lives as long as the worker process, so a seeded run
+    is reproducible as a whole instead of every timer tick repeating the
+    first tick's stations and values.
+    """
+    seed = os.getenv("GENERATOR_SEED")
+    if not seed:
+        return np.random.default_rng()
+    with _seeded_rngs_lock:
+        if seed not in _seeded_rngs:
+            _seeded_rngs[seed] = np.random.default_rng(int(seed))
+        return _seeded_rngs[seed]
+
+
+_workloads = {}
+_workloads_lock = threading.Lock()
+
+
+def _workload_profile() -> str:
+    return os.getenv("WORKLOAD_PROFILE", "uniform")
+
+
+def _get_workload(profile: str, station_count: int) -> WorkloadGenerator:
+    """Return the module-level generator for ``profile``; it carries windows and late readings across calls."""
+    period = os.getenv("WORKLOAD_PERIOD_SECONDS")
+    key = (profile, station_count, period)
+    with _workloads_lock:
+        if key not in _workloads:
+            _workloads[key] = WorkloadGenerator(
+                get_profile(profile, float(period) if period else None), station_count, rng=_get_rng()
+            )
+        return _workloads[key]
 
 
 def _generate_readings(batch_size: int, station_count: int):
-    readings = []
-    now = datetime.datetime.utcnow()
-    for _ in range(batch_size):
-        station_id = f"station-{random.randint(1, station_count)}"
-        pm25 = round(random.uniform(5, 120), 2)
-        pm10 = round(random.uniform(10, 150), 2)
-        o3 = round(random.uniform(5, 120), 2)
-        aqi = int((pm25 + pm10 + o3) / 3)
-        readings.append(
-            (station_id, now, pm25, pm10, o3, aqi),
-        )
-    return readings
+    profile = _workload_profile()
+    if profile == "uniform":
+        return generate_batch(batch_size, station_count, rng=_get_rng())
+    return _get_workload(profile, station_count).next_batch(batch_size)
+
+
+def _bulk_settings():
+    strategy = os.getenv("BULK_INSERT_STRATEGY", "auto")
+    chunk_size = int(os.getenv("BULK_INSERT_CHUNK_SIZE", str(DEFAULT_CHUNK_SIZE)))
+    return strategy, chunk_size
+
+
+def _commit_rows(rows):
+    strategy, chunk_size = _bulk_settings()
+    with pooled_connection() as conn:
+        result = write_readings(conn, rows, strategy=strategy, chunk_size=chunk_size)
+        conn.commit()
+    return result
+
+
+def _writer_settings():
+    # Each connection is a pooled connection; keep WRITER_CONNECTIONS at or below SQL_POOL_SIZE.
+    connections = int(os.getenv("WRITER_CONNECTIONS", "1"))
+    min_shard_rows = int(os.getenv("WRITER_MIN_SHARD_ROWS", "10000"))
+    retries = int(os.getenv("WRITER_SHARD_RETRIES", str(DEFAULT_RETRIES)))
+    return connections, min_shard_rows, retries
 
 
 def _write_batch(readings):
-    query = """
-    INSERT INTO air_quality_data (station_id, recorded_at, pm25, pm10, o3, aqi)
-    VALUES (?, ?, ?, ?, ?, ?)
+    connections, min_shard_rows, retries = _writer_settings()
+    # Small batches stay a single transaction on one connection.
+    connections = min(connections, len(readings) // max(1, min_shard_rows))
+    if connections > 1:
+        return write_sharded(readings, connections, _commit_rows, retries=retries)
+    return _commit_rows(readings)
+
+
+_spool = None
+_spool_lock = threading.Lock()
+_flush_failures = 0
+
+
+def _spool_directory() -> str:
+    """SPOOL_DIRECTORY, else ``air_quality_spool`` under HOME, the persisted share on Azure.
+
+    Under run-from-package the working directory is read-only and not kept,
+    so the relative default is only a fallback for local runs without HOME.
+    """
+    directory = os.getenv("SPOOL_DIRECTORY")
+    if directory:
+        return directory
+    home = os.getenv("HOME")
+    return os.path.join(home, "air_quality_spool") if home else "air_quality_spool"
+
+
+def _get_spool() -> Spool:
+    """Return the module-level spool, opening it from environment settings on first use."""
+    global _spool  # pylint: disable=global-statement
+    with _spool_lock:
+        if _spool is None:
+            _spool = Spool(
+                _spool_directory(),
+                segment_bytes=int(os.getenv("SPOOL_SEGMENT_BYTES", str(DEFAULT_SEGMENT_BYTES))),
+                fsync=os.getenv("SPOOL_FSYNC", "always"),
+                fsync_interval_sec=float(os.getenv("SPOOL_FSYNC_INTERVAL_SECONDS", "1")),
+            )
+        return _spool
+
+
+def _spool_batch(batch_size: int, station_count: int):
+    """Append the batch to the spool; returns the rows and bytes written."""
+    rows = _generate_readings(batch_size, station_count).rows()
+    return len(rows), _get_spool().append(rows)
+
+
+def _flush_spool():
+    """Drain the spool if a flush is due; returns the ``FlushResult`` or ``None``.
+
+    A failed flush is logged and the readings stay in the spool for the next
+    invocation. Failures in a row are counted together with the spool's
+    backlog; from SPOOL_FLUSH_FAILURE_THRESHOLD on they are logged as errors,
+    since a batch that can never be written blocks every reading behind it.
     """
-    with get_sql_connection() as conn:
-        with conn.cursor() as cursor:
-            cursor.executemany(query, readings)
+    global _flush_failures  # pylint: disable=global-statement
+    spool = _get_spool()
+    min_rows = int(os.getenv("SPOOL_FLUSH_ROWS", "1000"))
+    max_age = float(os.getenv("SPOOL_FLUSH_SECONDS", "300"))
+    if not flush_due(spool, min_rows, max_age):
+        return None
+    strategy, chunk_size = _bulk_settings()
+    deadline = time.monotonic() + float(os.getenv("SPOOL_FLUSH_TIME_BUDGET_SECONDS", "40"))
+    try:
+        with pooled_connection() as conn:
+            result = flush(
+                conn,
+                spool,
+                os.getenv("SPOOL_ID", "default"),
+                max_rows=int(os.getenv("SPOOL_FLUSH_MAX_ROWS", str(DEFAULT_FLUSH_MAX_ROWS))),
+                strategy=strategy,
+                chunk_size=chunk_size,
+                deadline=deadline,
+            )
+    except Exception as exc:  # pylint: disable=broad-except
+        with _spool_lock:
+            _flush_failures += 1
+            failures = _flush_failures
+        threshold = int(os.getenv("SPOOL_FLUSH_FAILURE_THRESHOLD", "5"))
+        logging.log(
+            logging.ERROR if failures >= threshold else logging.WARNING,
+            "Spool flush failed %d times in a row; %d segments stay spooled until the next run: %s",
+            failures,
+            len(spool.segments()),
+            exc,
+            exc_info=True,
+        )
+        return None
+    with _spool_lock:
+        _flush_failures = 0
+    return result
+
+
+def _stream_batch(batch_size: int, station_count: int):
+    strategy, chunk_size = _bulk_settings()
+    stream_chunk_size = int(os.getenv("STREAM_CHUNK_SIZE", "5000"))
+    queue_depth = int(os.getenv("STREAM_QUEUE_DEPTH", "2"))
+    rng = _get_rng()
+    recorded_at = datetime.datetime.utcnow()
+    produced = 0
+    # Other profiles spread one window over the whole batch, so it is generated up front
+    # (columnar, a few dozen bytes per row) and only the row tuples are streamed.
+    readings = None if _workload_profile() == "uniform" else _generate_readings(batch_size, station_count)
+
+    def make_chunk(size):
+        # Start each chunk past every timestamp the earlier chunks could have used,
+        # so (station_id, recorded_at) stays unique across the whole batch.
+        nonlocal produced
+        if readings is not None:
+            chunk = readings[produced:produced + size]
+        else:
+            chunk = generate_batch(
+                size, station_count, rng=rng, recorded_at=recorded_at + datetime.timedelta(microseconds=produced)
+            )
+        produced += size
+        return chunk
+
+    with pooled_connection() as conn:
+        stats = stream_ingest(
+            batch_size if readings is None else len(readings),
+            stream_chunk_size,
+            queue_depth,
+            make_chunk=make_chunk,
+            write_chunk=lambda chunk: write_readings(conn, chunk, strategy=strategy, chunk_size=chunk_size),
+            # Tracing every allocation slows ingest down; only for profiling.
+            trace_memory=os.getenv("STREAM_TRACE_MEMORY", "0") == "1",
+        )
         conn.commit()
+    return stats
 
 
-def main(mytimer: func.TimerRequest) -> None:
-    batch_size = int(os.getenv("BATCH_SIZE", "20"))
-    station_count = int(os.getenv("STATION_COUNT", "8"))
-    start = datetime.datetime.utcnow()
+def _log_commit(sub_batches: int):
+    def log(result):
+        logging.info(
+            "Committed sub-batch %d/%d (%d rows, %.3fs, at %.3fs)",
+            result.index + 1,
+            sub_batches,
+            result.rows,
+            result.write_sec,
+            result.committed_at_sec,
+        )
+    return log
+
+
+async def _ingest_concurrently(batch_size: int, station_count: int):
+    sub_batch_size = int(os.getenv("ASYNC_SUB_BATCH_SIZE", "5000"))
+    # Each sub-batch holds a pooled connection; keep this at or below SQL_POOL_SIZE.
+    in_flight = int(os.getenv("ASYNC_IN_FLIGHT", "4"))
     readings = _generate_readings(batch_size, station_count)
-    try:
-        _write_batch(readings)
+    return await ingest_async(
+        readings,
+        sub_batch_size,
+        in_flight,
+        write_sub_batch=_commit_rows,
+        on_commit=_log_commit(-(-len(readings) // sub_batch_size)),
+    )
+
+
+def _ingest(batch_size: int, station_count: int, mode: str, start: datetime.datetime):
+    if mode == "spool":
+        rows, appended = _spool_batch(batch_size, station_count)
+        logging.info(
+            "Spooled %d air-quality records from %d stations (%d bytes) in %.3fs",
+            rows,
+            station_count,
+            appended,
+            (datetime.datetime.utcnow() - start).total_seconds(),
+        )
+        result = _flush_spool()
+        if result is not None:
+            logging.info(
+                "Flushed %d spooled records in %d transactions in %.2fs (%.0f rows/s, %d segments removed)",
+                result.rows,
+                result.transactions,
+                result.duration_sec,
+                result.rows_per_sec,
+                result.segments_deleted,
+            )
+        return
+
+    if mode == "streaming":
+        stats = _stream_batch(batch_size, station_count)
         duration = (datetime.datetime.utcnow() - start).total_seconds()
         logging.info(
-            "Inserted %d air-quality records from %d stations in %.2fs",
-            batch_size,
+            "Streamed %d air-quality records from %d stations in %.2fs "
+            "(%d chunks, peak RSS %s, traced peak %s, overlap efficiency %.0f%%)",
+            stats.rows,
             station_count,
             duration,
+            stats.chunks,
+            "n/a" if stats.peak_rss_mb is None else f"{stats.peak_rss_mb:.1f} MB",
+            "n/a" if stats.peak_traced_mb is None else f"{stats.peak_traced_mb:.2f} MB",
+            stats.overlap_efficiency * 100,
+        )
+        return
+
+    readings = _generate_readings(batch_size, station_count)
+    result = _write_batch(readings)
+    duration = (datetime.datetime.utcnow() - start).total_seconds()
+    logging.info(
+        "Inserted %d air-quality records from %d stations in %.2fs "
+        "(%s, %d round trips, %.0f rows/s)",
+        len(readings),
+        station_count,
+        duration,
+        result.strategy,
+        result.round_trips,
+        result.rows_per_sec,
+    )
+    for shard in getattr(result, "shards", ()):
+        logging.info(
+            "Shard %d/%d: %d rows in %.3fs (%d attempts)",
+            shard.index + 1,
+            result.connections,
+            shard.rows,
+            shard.latency_sec,
+            shard.attempts,
         )
+
+
+async def main(mytimer: func.TimerRequest) -> None:
+    batch_size = int(os.getenv("BATCH_SIZE", "20"))
+    station_count = int(os.getenv("STATION_COUNT", "8"))
+    mode = os.getenv("INGEST_MODE", "batch")
+    start = datetime.datetime.utcnow()
+    try:
+        if mode == "async":
+            stats = await _ingest_concurrently(batch_size, station_count)
+            logging.info(
+                "Inserted %d air-quality records from %d stations in %.2fs "
+                "(%d sub-batches, %d in flight at peak, %.0f rows/s)",
+                stats.rows,
+                station_count,
+                stats.wall_sec,
+                stats.sub_batches,
+                stats.peak_in_flight,
+                stats.rows_per_sec,
+            )
+            return
+
+        # The batch and streaming paths block on the driver; keep them off the event loop.
+        await asyncio.get_running_loop().run_in_executor(None, _ingest, batch_size, station_count, mode, start)
     except Exception as exc:  # pragma: no cover
         logging.error("Failed to insert air-quality data: %s", exc, exc_info=True)
         raise
@@ -1,10 +1,36 @@
+import concurrent.futures
 import datetime
 import logging
-from typing import List, Tuple
+import os
+import time
+from typing import Dict, List, NamedTuple, Tuple
 
 import azure.functions as func
 
-from azure_sql import get_sql_connection
+from azure_sql import get_connection_pool, pooled_connection
+from summary_aggregator import (
+    DEFAULT_FETCH_SIZE,
+    DEFAULT_WINDOW_SECONDS,
+    SummaryAccumulator,
+    base_bucket_seconds,
+    bucket_index,
+    bucket_start,
+    consume_changes,
+    merge_all,
+    rollup_windows,
+)
+from summary_leases import DEFAULT_LEASE_SECONDS, LeaseLost, claim, new_owner, read_checkpoint, release, save_checkpoint
+from summary_partitions import DEFAULT_PARTITION_COUNT, SINGLE, Partition, ensure_checkpoints, partitions_for
+from summary_recovery import DEFAULT_PARTITIONS, DEFAULT_WORKERS, record_recovered_contributions, scan_gap
+
+DEFAULT_SLICE_ROWS = 50000
+DEFAULT_TIME_BUDGET_SECONDS = 90
+DEFAULT_DEADLOCK_RETRIES = 3
+
+
+def _is_deadlock(exc: Exception) -> bool:
+    """SQL Server error 1205 (SQLSTATE 40001): the transaction was chosen as a deadlock victim."""
+    return (bool(exc.args) and exc.args[0] == "40001") or "(1205)" in str(exc)
 
 
 def _ensure_sync_state(cursor):
@@ -32,37 +58,399 @@ def _update_sync_state(cursor, version: int):
         )
 
 
-def _collect_changes(cursor, last_version: int) -> Tuple[int, List[Tuple]]:
+def _read_versions(cursor) -> Tuple[int, int]:
+    """Return (current_version, min_valid_version) for air_quality_data."""
     cursor.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()")
-    current_version = cursor.fetchone()[0]
+    current_version = cursor.fetchone()[0] or 0
 
     cursor.execute("SELECT CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID('air_quality_data'))")
     min_valid = cursor.fetchone()[0] or 0
-    if last_version < min_valid:
-        last_version = min_valid
+    return current_version, min_valid
+
+
+def _window_sizes() -> List[int]:
+    """Tumbling window widths in seconds from SUMMARY_WINDOW_SECONDS (empty disables)."""
+    raw = os.getenv("SUMMARY_WINDOW_SECONDS", ",".join(str(s) for s in DEFAULT_WINDOW_SECONDS))
+    sizes = sorted({int(part) for part in raw.split(",") if part.strip()})
+    if any(size <= 0 for size in sizes):
+        raise ValueError(f"SUMMARY_WINDOW_SECONDS must be positive, got {raw!r}")
+    return sizes
 
-    query = """
+
+def _collect_changes(
+    cursor,
+    last_version: int,
+    current_version: int,
+    fetch_size: int = DEFAULT_FETCH_SIZE,
+    bucket_seconds: int = None,
+    partition: Partition = SINGLE,
+) -> Tuple[Dict[str, SummaryAccumulator], Dict[int, SummaryAccumulator]]:
+    # Bounded by current_version so rows committed after it are left for the next run.
+    # Rows that already contributed are corrected by _correction_deltas instead.
+    partition_sql, partition_params = partition.filter("a.station_id")
+    query = f"""
     SELECT a.station_id, a.recorded_at, a.pm25, a.pm10, a.o3, a.aqi
     FROM CHANGETABLE(CHANGES air_quality_data, ?) AS ct
     INNER JOIN air_quality_data AS a ON ct.id = a.id
+    LEFT JOIN air_quality_contribution AS l ON l.row_id = ct.id
     WHERE ct.SYS_CHANGE_OPERATION IN ('I','U')
+      AND ct.SYS_CHANGE_VERSION <= ?
+      AND l.row_id IS NULL
+      {partition_sql}
+    """
+    cursor.execute(query, last_version, current_version, *partition_params)
+    return consume_changes(cursor, fetch_size, bucket_seconds)
+
+
+def _summarize_server_side(
+    cursor, last_version: int, current_version: int, partition: Partition = SINGLE
+) -> SummaryAccumulator:
+    """Aggregate per station over the change set and return the rollup of the rows just written.
+
+    The changed rows are scanned once. The per-station rows come back through
+    ``OUTPUT``, so the rollup covers exactly this slice even when other
+    partitions, or an earlier partitioning, wrote rows with the same
+    ``sync_version``.
+    """
+    partition_sql, partition_params = partition.filter("a.station_id")
+    cursor.execute(
+        f"""
+        INSERT INTO air_quality_station_summary
+            (station_id, sync_version, window_start, window_end, avg_aqi, max_pm25, min_o3, record_count)
+        OUTPUT inserted.window_start, inserted.window_end, inserted.avg_aqi, inserted.max_pm25,
+               inserted.min_o3, inserted.record_count
+        SELECT a.station_id, ?, MIN(a.recorded_at), MAX(a.recorded_at), AVG(CAST(a.aqi AS FLOAT)),
+               MAX(a.pm25), MIN(a.o3), COUNT(*)
+        FROM CHANGETABLE(CHANGES air_quality_data, ?) AS ct
+        INNER JOIN air_quality_data AS a ON ct.id = a.id
+        LEFT JOIN air_quality_contribution AS l ON l.row_id = ct.id
+        WHERE ct.SYS_CHANGE_OPERATION IN ('I','U')
+          AND ct.SYS_CHANGE_VERSION <= ?
+          AND l.row_id IS NULL
+          {partition_sql}
+        GROUP BY a.station_id
+        """,
+        current_version,
+        last_version,
+        current_version,
+        *partition_params,
+    )
+    # air_quality_summary keeps no spread, so the sum of squares is not needed.
+    return merge_all(
+        SummaryAccumulator.from_partial(count, avg_aqi * count, 0.0, max_pm25, min_o3, window_start, window_end)
+        for window_start, window_end, avg_aqi, max_pm25, min_o3, count in cursor.fetchall()
+    )
+
+
+def _bucket_changes_server_side(
+    cursor, last_version: int, current_version: int, bucket_seconds: int, partition: Partition = SINGLE
+) -> Dict[int, SummaryAccumulator]:
+    """Partial aggregates of the change set per ``recorded_at`` bucket; one row per bucket comes back."""
+    partition_sql, partition_params = partition.filter("a.station_id")
+    cursor.execute(
+        f"""
+        SELECT b.bucket, COUNT(*), SUM(CAST(b.aqi AS FLOAT)), SUM(CAST(b.aqi AS FLOAT) * b.aqi),
+               MAX(b.pm25), MIN(b.o3)
+        FROM (
+            SELECT DATEDIFF_BIG(SECOND, '1970-01-01', a.recorded_at) / ? AS bucket, a.aqi, a.pm25, a.o3
+            FROM CHANGETABLE(CHANGES air_quality_data, ?) AS ct
+            INNER JOIN air_quality_data AS a ON ct.id = a.id
+            LEFT JOIN air_quality_contribution AS l ON l.row_id = ct.id
+            WHERE ct.SYS_CHANGE_OPERATION IN ('I','U')
+              AND ct.SYS_CHANGE_VERSION <= ?
+              AND l.row_id IS NULL
+              {partition_sql}
+        ) AS b
+        GROUP BY b.bucket
+        """,
+        bucket_seconds,
+        last_version,
+        current_version,
+        *partition_params,
+    )
+    # Only the bucket bounds are known here, which is all rollup_windows needs.
+    return {
+        bucket: SummaryAccumulator.from_partial(
+            count,
+            sum_aqi,
+            sum_sq_aqi,
+            max_pm25,
+            min_o3,
+            bucket_start(bucket, bucket_seconds),
+            bucket_start(bucket + 1, bucket_seconds),
+        )
+        for bucket, count, sum_aqi, sum_sq_aqi, max_pm25, min_o3 in cursor.fetchall()
+    }
+
+
+def _apply_window_deltas(
+    cursor, removed: Dict[Tuple[int, int], List[Tuple]], added: Dict[Tuple[int, int], SummaryAccumulator]
+) -> int:
+    """Write every window change of a transaction in one pass, in ``(size, index)`` order.
+
+    Window rows are shared by every partition and each write locks its row
+    until commit. Corrections and merges go through the same sorted loop, so
+    concurrent partitions always lock windows in the same order and cannot
+    deadlock on them. Returns the number of windows written.
+    """
+    written = 0
+    for key in sorted(set(removed) | set(added)):
+        size, index = key
+        if key in removed:
+            _correct_window(cursor, size, index, removed[key], added.get(key))
+        elif added[key].count:
+            _merge_window(cursor, size, index, added[key])
+        else:
+            continue
+        written += 1
+    return written
+
+
+def _add_windows(added: Dict[Tuple[int, int], SummaryAccumulator], windows: Dict[Tuple[int, int], SummaryAccumulator]):
+    """Fold partial window aggregates into the ``added`` deltas of the same transaction."""
+    for key, acc in windows.items():
+        added.setdefault(key, SummaryAccumulator()).merge(acc)
+    return added
+
+
+def _merge_window(cursor, size: int, index: int, acc: SummaryAccumulator):
+    """Fold a partial aggregate into one window row, inserting the row if it is new.
+
+    UPDLOCK + HOLDLOCK keeps the key range locked when the UPDATE finds no
+    row, so two partitions that open the same window cannot both fall
+    through to the INSERT.
+    """
+    window_start = bucket_start(index, size)
+    cursor.execute(
+        """
+        UPDATE air_quality_window_summary WITH (UPDLOCK, HOLDLOCK)
+        SET record_count = record_count + ?,
+            sum_aqi = sum_aqi + ?,
+            sum_sq_aqi = sum_sq_aqi + ?,
+            avg_aqi = (sum_aqi + ?) / (record_count + ?),
+            max_pm25 = CASE WHEN max_pm25 >= ? THEN max_pm25 ELSE ? END,
+            min_o3 = CASE WHEN min_o3 <= ? THEN min_o3 ELSE ? END,
+            updated_at = SYSUTCDATETIME()
+        WHERE window_seconds = ? AND window_start = ?
+        """,
+        acc.count,
+        acc.sum_aqi,
+        acc.sum_sq_aqi,
+        acc.sum_aqi,
+        acc.count,
+        acc.max_pm25,
+        acc.max_pm25,
+        acc.min_o3,
+        acc.min_o3,
+        size,
+        window_start,
+    )
+    if cursor.rowcount == 0:
+        _insert_window(cursor, size, index, acc)
+
+
+def _insert_window(cursor, size: int, index: int, acc: SummaryAccumulator):
+    cursor.execute(
+        """
+        INSERT INTO air_quality_window_summary
+            (window_seconds, window_start, window_end, record_count, sum_aqi, sum_sq_aqi, avg_aqi,
+             max_pm25, min_o3, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, SYSUTCDATETIME())
+        """,
+        size,
+        bucket_start(index, size),
+        bucket_start(index + 1, size),
+        acc.count,
+        acc.sum_aqi,
+        acc.sum_sq_aqi,
+        acc.avg_aqi,
+        acc.max_pm25,
+        acc.min_o3,
+    )
+
+
+def _record_contributions(cursor, last_version: int, current_version: int, partition: Partition = SINGLE):
+    """Remember the values each newly summarized row contributed, keyed by row id."""
+    partition_sql, partition_params = partition.filter("a.station_id")
+    cursor.execute(
+        f"""
+        INSERT INTO air_quality_contribution (row_id, row_version, station_id, recorded_at, pm25, o3, aqi)
+        SELECT ct.id, ct.SYS_CHANGE_VERSION, a.station_id, a.recorded_at, a.pm25, a.o3, a.aqi
+        FROM CHANGETABLE(CHANGES air_quality_data, ?) AS ct
+        INNER JOIN air_quality_data AS a ON ct.id = a.id
+        LEFT JOIN air_quality_contribution AS l ON l.row_id = ct.id
+        WHERE ct.SYS_CHANGE_OPERATION IN ('I','U')
+          AND ct.SYS_CHANGE_VERSION <= ?
+          AND l.row_id IS NULL
+          {partition_sql}
+        """,
+        last_version,
+        current_version,
+        *partition_params,
+    )
+
+
+def _fetch_corrections(cursor, last_version: int, current_version: int, partition: Partition = SINGLE) -> List[Tuple]:
+    """Updates and deletes of already-summarized rows, with their old and new values.
+
+    Routed by the station recorded in the contribution, so every correction of
+    a row lands in the same partition even if its station_id is changed.
     """
-    cursor.execute(query, last_version)
-    rows = cursor.fetchall()
-    return current_version, rows
+    partition_sql, partition_params = partition.filter("l.station_id")
+    cursor.execute(
+        f"""
+        SELECT ct.id, ct.SYS_CHANGE_OPERATION, ct.SYS_CHANGE_VERSION,
+               l.recorded_at, l.pm25, l.o3, l.aqi,
+               a.recorded_at, a.pm25, a.o3, a.aqi
+        FROM CHANGETABLE(CHANGES air_quality_data, ?) AS ct
+        INNER JOIN air_quality_contribution AS l ON l.row_id = ct.id
+        LEFT JOIN air_quality_data AS a ON a.id = ct.id
+        WHERE ct.SYS_CHANGE_VERSION <= ?
+          AND ct.SYS_CHANGE_VERSION > l.row_version
+          {partition_sql}
+        """,
+        last_version,
+        current_version,
+        *partition_params,
+    )
+    return cursor.fetchall()
+
+
+def _correction_deltas(cursor, changes: List[Tuple], window_sizes: List[int]):
+    """Turn updates and deletes of already-summarized rows into per-window deltas.
+
+    Each changed row's previous contribution (from air_quality_contribution)
+    is to be subtracted from the windows it was counted in and its new values
+    added, so the cost is per changed row rather than per window. The
+    contribution rows are updated here; the windows are left to
+    :func:`_apply_window_deltas`. Returns ``(corrected_rows, removed, added)``.
+    """
+    removed: Dict[Tuple[int, int], List[Tuple]] = {}
+    added: Dict[Tuple[int, int], SummaryAccumulator] = {}
+    updated, deleted = [], []
+    for row_id, operation, version, old_at, old_pm25, old_o3, old_aqi, new_at, new_pm25, new_o3, new_aqi in changes:
+        old_row = (None, old_at, old_pm25, None, old_o3, old_aqi)
+        for size in window_sizes:
+            removed.setdefault((size, bucket_index(old_at, size)), []).append(old_row)
+        if operation == "D":
+            deleted.append((row_id,))
+            continue
+        new_row = (None, new_at, new_pm25, None, new_o3, new_aqi)
+        for size in window_sizes:
+            added.setdefault((size, bucket_index(new_at, size)), SummaryAccumulator()).add(new_row)
+        updated.append((version, new_at, new_pm25, new_o3, new_aqi, row_id))
+
+    # The contribution rows are updated first so that a MAX/MIN recompute sees the new values.
+    if not changes:
+        return 0, removed, added
+    cursor.fast_executemany = True
+    if updated:
+        cursor.executemany(
+            """
+            UPDATE air_quality_contribution
+            SET row_version = ?, recorded_at = ?, pm25 = ?, o3 = ?, aqi = ?
+            WHERE row_id = ?
+            """,
+            updated,
+        )
+    if deleted:
+        cursor.executemany("DELETE FROM air_quality_contribution WHERE row_id = ?", deleted)
+    return len(changes), removed, added
+
+
+def _correct_window(cursor, size: int, index: int, removed_rows, added: SummaryAccumulator):
+    """Apply one window's correction, which writes back absolute values.
+
+    The row is read with UPDLOCK + HOLDLOCK so no other partition can merge
+    into it (or insert it) between the read and the write; a plain read under
+    READ_COMMITTED_SNAPSHOT would not block and the write would undo their
+    merge. Once the lock is held every committed merge into the window is
+    also visible in air_quality_contribution, so the MAX/MIN recompute agrees
+    with the row.
+    """
+    window_start = bucket_start(index, size)
+    cursor.execute(
+        """
+        SELECT record_count, sum_aqi, sum_sq_aqi, max_pm25, min_o3
+        FROM air_quality_window_summary WITH (UPDLOCK, HOLDLOCK)
+        WHERE window_seconds = ? AND window_start = ?
+        """,
+        size,
+        window_start,
+    )
+    row = cursor.fetchone()
+    acc = SummaryAccumulator()
+    if row:
+        acc = SummaryAccumulator.from_partial(*row, window_start, bucket_start(index + 1, size))
+        stale = False
+        for removed_row in removed_rows:
+            stale = acc.subtract(removed_row) or stale
+        if stale and acc.count:
+            # The old value was the window's MAX or MIN: only those two are
+            # recomputed, from the contribution index on recorded_at.
+            cursor.execute(
+                """
+                SELECT MAX(pm25), MIN(o3)
+                FROM air_quality_contribution
+                WHERE recorded_at >= ? AND recorded_at < ?
+                """,
+                window_start,
+                bucket_start(index + 1, size),
+            )
+            acc.max_pm25, acc.min_o3 = cursor.fetchone()
+    if added is not None:
+        acc.merge(added)
 
+    if not row:
+        if acc.count:
+            _insert_window(cursor, size, index, acc)
+    elif not acc.count:
+        cursor.execute(
+            "DELETE FROM air_quality_window_summary WHERE window_seconds = ? AND window_start = ?",
+            size,
+            window_start,
+        )
+    else:
+        cursor.execute(
+            """
+            UPDATE air_quality_window_summary
+            SET record_count = ?, sum_aqi = ?, sum_sq_aqi = ?, avg_aqi = ?,
+                max_pm25 = ?, min_o3 = ?, updated_at = SYSUTCDATETIME()
+            WHERE window_seconds = ? AND window_start = ?
+            """,
+            acc.count,
+            acc.sum_aqi,
+            acc.sum_sq_aqi,
+            acc.avg_aqi,
+            acc.max_pm25,
+            acc.min_o3,
+            size,
+            window_start,
+        )
 
-def _write_summary(cursor, records):
-    record_count = len(records)
-    if record_count == 0:
+
+def _write_station_summaries(cursor, by_station: Dict[str, SummaryAccumulator], version: int):
+    rows = [
+        (station_id, version, acc.window_start, acc.window_end, acc.avg_aqi, acc.max_pm25, acc.min_o3, acc.count)
+        for station_id, acc in sorted(by_station.items())
+        if acc.count
+    ]
+    if not rows:
         return
+    cursor.fast_executemany = True
+    cursor.executemany(
+        """
+        INSERT INTO air_quality_station_summary
+            (station_id, sync_version, window_start, window_end, avg_aqi, max_pm25, min_o3, record_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
 
-    avg_aqi = sum(r[5] for r in records) / record_count
-    max_pm25 = max(r[2] for r in records)
-    min_o3 = min(r[4] for r in records)
-    timestamps = [r[1] for r in records]
-    window_start = min(timestamps)
-    window_end = max(timestamps)
+
+def _write_summary(cursor, summary: SummaryAccumulator):
+    if summary.count == 0:
+        return
 
     cursor.execute(
         """
@@ -70,33 +458,389 @@ def _write_summary(cursor, records):
             (window_start, window_end, avg_aqi, max_pm25, min_o3, record_count)
         VALUES (?, ?, ?, ?, ?, ?)
         """,
-        window_start,
-        window_end,
-        avg_aqi,
-        max_pm25,
-        min_o3,
-        record_count,
+        summary.window_start,
+        summary.window_end,
+        summary.avg_aqi,
+        summary.max_pm25,
+        summary.min_o3,
+        summary.count,
     )
 
 
-def main(mytimer: func.TimerRequest) -> None:  # pylint: disable=unused-argument
+def _recover(cursor, last_version, min_valid, current_version, window_sizes, bucket_seconds):
+    """Rebuild what retention cleanup took away by scanning air_quality_data in parallel partitions."""
+    logging.warning(
+        "Change Tracking history lost: last_version %d < min_valid_version %d; re-scanning air_quality_data",
+        last_version,
+        min_valid,
+    )
+    scan = scan_gap(
+        pooled_connection,
+        current_version,
+        bucket_seconds,
+        partitions=int(os.getenv("SUMMARY_RECOVERY_PARTITIONS", str(DEFAULT_PARTITIONS))),
+        # The caller already holds one pooled connection.
+        workers=min(
+            int(os.getenv("SUMMARY_RECOVERY_WORKERS", str(DEFAULT_WORKERS))),
+            max(1, get_connection_pool().max_size - 1),
+        ),
+    )
+    corrected, removed, added = _correction_deltas(cursor, scan.corrections, window_sizes)
+    summary = merge_all(scan.by_station.values())
+    _write_station_summaries(cursor, scan.by_station, current_version)
+    record_recovered_contributions(cursor, current_version)
+    if scan.by_bucket:
+        _add_windows(added, rollup_windows(scan.by_bucket, bucket_seconds, window_sizes))
+    window_count = _apply_window_deltas(cursor, removed, added)
+    logging.info(
+        "Recovered %d records and %d corrections from %d partitions in %.2f s (%.0f records/s)",
+        summary.count,
+        corrected,
+        scan.partitions,
+        scan.duration_sec,
+        summary.count / scan.duration_sec if scan.duration_sec > 0 else 0.0,
+    )
+    return summary, corrected, window_count
+
+
+def _slice_end(cursor, last_version: int, current_version: int, max_rows: int) -> int:
+    """Last version of a slice starting after ``last_version`` that holds about ``max_rows`` changes.
+
+    A version is never split, so one very large transaction still ends up in
+    a single slice.
+    """
+    cursor.execute(
+        """
+        SELECT ct.SYS_CHANGE_VERSION
+        FROM CHANGETABLE(CHANGES air_quality_data, ?) AS ct
+        WHERE ct.SYS_CHANGE_VERSION <= ?
+        ORDER BY ct.SYS_CHANGE_VERSION
+        OFFSET ? ROWS FETCH NEXT 1 ROWS ONLY
+        """,
+        last_version,
+        current_version,
+        max_rows - 1,
+    )
+    row = cursor.fetchone()
+    return row[0] if row else current_version
+
+
+def _process_slice(
+    cursor, last_version, slice_version, mode, fetch_size, window_sizes, bucket_seconds, partition=SINGLE
+):
+    """Summarize the changes in (last_version, slice_version]; returns (summary, corrected, windows).
+
+    Only the per-station rows are written here; the returned rollup goes into
+    the run's single global summary row.
+    """
+    corrected, removed, added = _correction_deltas(
+        cursor, _fetch_corrections(cursor, last_version, slice_version, partition), window_sizes
+    )
+    buckets = {}
+    if mode == "server":
+        summary = _summarize_server_side(cursor, last_version, slice_version, partition)
+        if summary.count and bucket_seconds:
+            buckets = _bucket_changes_server_side(cursor, last_version, slice_version, bucket_seconds, partition)
+    else:
+        by_station, buckets = _collect_changes(
+            cursor, last_version, slice_version, fetch_size, bucket_seconds, partition
+        )
+        summary = merge_all(by_station.values())
+        _write_station_summaries(cursor, by_station, slice_version)
+    _record_contributions(cursor, last_version, slice_version, partition)
+    if buckets:
+        _add_windows(added, rollup_windows(buckets, bucket_seconds, window_sizes))
+    # A MAX/MIN recompute now also sees this slice's new contributions; merging
+    # them in again does not change a MAX or MIN.
+    window_count = _apply_window_deltas(cursor, removed, added)
+    return summary, corrected, window_count
+
+
+class PartitionResult(NamedTuple):
+    partition: Partition
+    summary: SummaryAccumulator
+    corrected: int
+    windows: int
+    slices: int
+    from_version: int
+    to_version: int
+    lease_lost: bool
+
+
+class RunReport(NamedTuple):
+    """Outcome of one :func:`process_changes` call."""
+
+    owner: str
+    partitions: int
+    contended: int
+    records: int
+    slices: int
+    leases_lost: int
+
+
+class _Settings(NamedTuple):
+    mode: str
+    fetch_size: int
+    slice_rows: int
+    window_sizes: List[int]
+    bucket_seconds: int
+    lease_seconds: int
+
+
+def _settings_from_env() -> _Settings:
+    window_sizes = _window_sizes()
+    return _Settings(
+        os.getenv("SUMMARY_MODE", "server"),
+        int(os.getenv("SUMMARY_FETCH_SIZE", str(DEFAULT_FETCH_SIZE))),
+        int(os.getenv("SUMMARY_SLICE_ROWS", str(DEFAULT_SLICE_ROWS))),
+        window_sizes,
+        base_bucket_seconds(window_sizes),
+        int(os.getenv("SUMMARY_LEASE_SECONDS", str(DEFAULT_LEASE_SECONDS))),
+    )
+
+
+def _process_partition(
+    partition, last_version, current_version, settings: _Settings, deadline, owner: str
+) -> PartitionResult:
+    """Drain one partition's backlog on its own connection, committing slice by slice.
+
+    Each slice commits its summaries together with its checkpoint, so a
+    backlog that outlasts the time budget drains over later runs. The
+    checkpoint write is fenced on the lease; if another runner has taken the
+    partition over, the slice is rolled back and the partition is left to it.
+    A slice chosen as a deadlock victim is rolled back and retried.
+    """
+    from_version = last_version
+    summary = SummaryAccumulator()
+    corrected = windows = slices = deadlocks = 0
+    lease_lost = False
+    with pooled_connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                while last_version < current_version and (slices == 0 or time.monotonic() < deadline):
+                    # Slices are sized on the whole change stream; a partition sees about 1/count of it.
+                    slice_version = _slice_end(
+                        cursor, last_version, current_version, settings.slice_rows * partition.count
+                    )
+                    try:
+                        slice_summary, slice_corrected, slice_windows = _process_slice(
+                            cursor,
+                            last_version,
+                            slice_version,
+                            settings.mode,
+                            settings.fetch_size,
+                            settings.window_sizes,
+                            settings.bucket_seconds,
+                            partition,
+                        )
+                        save_checkpoint(cursor, partition, slice_version, owner, settings.lease_seconds)
+                        conn.commit()
+                    except Exception as exc:  # pylint: disable=broad-except
+                        if not _is_deadlock(exc) or deadlocks >= DEFAULT_DEADLOCK_RETRIES:
+                            raise
+                        conn.rollback()
+                        deadlocks += 1
+                        logging.warning(
+                            "Partition %d chosen as deadlock victim after version %d; retrying the slice (%d/%d)",
+                            partition.index,
+                            last_version,
+                            deadlocks,
+                            DEFAULT_DEADLOCK_RETRIES,
+                        )
+                        continue
+                    summary.merge(slice_summary)
+                    corrected += slice_corrected
+                    windows += slice_windows
+                    slices += 1
+                    last_version = slice_version
+            except LeaseLost as exc:
+                conn.rollback()
+                lease_lost = True
+                logging.warning("%s; rolled back the slice after version %d", exc, last_version)
+        conn.commit()
+    return PartitionResult(
+        partition, summary, corrected, windows, slices, from_version, last_version, lease_lost
+    )
+
+
+def _partition_ids():
+    """SUMMARY_PARTITION_IDS limits this instance to some partitions (e.g. ``0,2``); unset means all."""
+    raw = os.getenv("SUMMARY_PARTITION_IDS", "").strip()
+    return [int(part) for part in raw.split(",") if part.strip()] if raw else None
+
+
+def _claim_partitions(partitions, partition_count, owner, lease_seconds):
+    """Lease as many of ``partitions`` as are free; returns (claimed, contended)."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cursor:
+            watermark = _ensure_sync_state(cursor)
+            if partition_count > 1:
+                ensure_checkpoints(cursor, partition_count, watermark)
+        conn.commit()
+        with conn.cursor() as cursor:
+            claimed, contended = claim(cursor, partitions, owner, lease_seconds)
+        conn.commit()
+    return claimed, contended
+
+
+def _release_partitions(partitions, owner):
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                release(cursor, partitions, owner)
+            conn.commit()
+    except Exception as exc:  # pylint: disable=broad-except
+        # The leases expire on their own.
+        logging.warning("Could not release leases: %s", exc)
+
+
+def process_changes() -> RunReport:
+    """One processing pass over the partitions this runner can lease."""
+    settings = _settings_from_env()
+    window_sizes, bucket_seconds = settings.window_sizes, settings.bucket_seconds
+    time_budget = float(os.getenv("SUMMARY_TIME_BUDGET_SECONDS", str(DEFAULT_TIME_BUDGET_SECONDS)))
+    partition_count = int(os.getenv("SUMMARY_PARTITIONS", str(DEFAULT_PARTITION_COUNT)))
+    wanted = partitions_for(partition_count, _partition_ids())
+    owner = new_owner()
     start = datetime.datetime.utcnow()
+    deadline = time.monotonic() + time_budget
+
+    claimed, contended = _claim_partitions(wanted, partition_count, owner, settings.lease_seconds)
+    # Logged on every run so that contention can be charted as a metric.
+    logging.info(
+        "Lease contention: %d of %d partitions held by other runners (owner %s)",
+        len(contended),
+        len(wanted),
+        owner,
+    )
+    if not claimed:
+        logging.info("Another runner is processing every partition; skipping this run")
+        return RunReport(owner, 0, len(contended), 0, 0, 0)
+
     try:
-        with get_sql_connection() as conn:
+        recovered = SummaryAccumulator()
+        corrected = window_count = 0
+        with pooled_connection() as conn:
             with conn.cursor() as cursor:
-                last_version = _ensure_sync_state(cursor)
-                current_version, records = _collect_changes(cursor, last_version)
-                _write_summary(cursor, records)
-                _update_sync_state(cursor, current_version)
+                current_version, min_valid = _read_versions(cursor)
+                checkpoints = {partition.index: read_checkpoint(cursor, partition) for partition in claimed}
             conn.commit()
-        duration = (datetime.datetime.utcnow() - start).total_seconds()
-        logging.info(
-            "Processed %d records; window %.2f s (versions %d → %d)",
-            len(records),
-            duration,
-            last_version,
-            current_version,
-        )
+            watermark = min(checkpoints.values())
+            if watermark < min_valid:
+                # Recovery rewrites every partition's checkpoint, so it needs all of them.
+                with conn.cursor() as cursor:
+                    others = [p for p in partitions_for(partition_count) if p not in claimed]
+                    extra, busy = claim(cursor, others, owner, settings.lease_seconds)
+                conn.commit()
+                claimed += extra
+                if busy:
+                    logging.warning(
+                        "Recovery needs all %d partitions but %d are held by other runners; retrying next run",
+                        partition_count,
+                        len(busy),
+                    )
+                    return RunReport(owner, 0, len(contended) + len(busy), 0, 0, 0)
+                with conn.cursor() as cursor:
+                    recovered, corrected, window_count = _recover(
+                        cursor, watermark, min_valid, current_version, window_sizes, bucket_seconds
+                    )
+                    if partition_count > 1:
+                        _update_sync_state(cursor, current_version)
+                    for partition in claimed:
+                        save_checkpoint(cursor, partition, current_version, owner, settings.lease_seconds)
+                conn.commit()
+                checkpoints = dict.fromkeys(checkpoints, current_version)
+                # Hand back the partitions borrowed from other instances' share.
+                claimed = [p for p in claimed if p not in extra]
+                _release_partitions(extra, owner)
+
+        if len(claimed) == 1:
+            results = [
+                _process_partition(
+                    claimed[0], checkpoints[claimed[0].index], current_version, settings, deadline, owner
+                )
+            ]
+        else:
+            # Threads are enough: the work happens in the database and the driver releases the GIL.
+            workers = min(
+                int(os.getenv("SUMMARY_PARTITION_WORKERS", str(len(claimed)))),
+                get_connection_pool().max_size,
+            )
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                futures = [
+                    executor.submit(
+                        _process_partition,
+                        partition,
+                        checkpoints[partition.index],
+                        current_version,
+                        settings,
+                        deadline,
+                        owner,
+                    )
+                    for partition in claimed
+                ]
+                results = [future.result() for future in futures]
+
+        # One global row per run, rolled up from every slice the claimed partitions committed.
+        summary = merge_all([recovered] + [r.summary for r in results])
+        if summary.count or partition_count > 1:
+            with pooled_connection() as conn:
+                with conn.cursor() as cursor:
+                    _write_summary(cursor, summary)
+                    if partition_count > 1:
+                        # Keep air_quality_sync_state as the low watermark of all partitions.
+                        cursor.execute(
+                            "SELECT MIN(last_version) FROM air_quality_partition_state WHERE partition_count = ?",
+                            partition_count,
+                        )
+                        _update_sync_state(cursor, cursor.fetchone()[0])
+                conn.commit()
+    finally:
+        _release_partitions(claimed, owner)
+
+    duration = (datetime.datetime.utcnow() - start).total_seconds()
+    for result in results:
+        if partition_count > 1:
+            logging.info(
+                "Partition %d/%d: %d records in %d slices (versions %d → %d)",
+                result.partition.index,
+                partition_count,
+                result.summary.count,
+                result.slices,
+                result.from_version,
+                result.to_version,
+            )
+        if result.to_version < current_version and not result.lease_lost:
+            logging.warning(
+                "Time budget of %.0f s used up with backlog remaining: partition %d checkpoint at version %d of %d",
+                time_budget,
+                result.partition.index,
+                result.to_version,
+                current_version,
+            )
+    records = summary.count
+    slices = sum(r.slices for r in results)
+    logging.info(
+        "Processed %d records in %d slices over %d partitions (%s aggregation, %d corrected, "
+        "%d time windows merged); window %.2f s (versions %d → %d)",
+        records,
+        slices,
+        len(results),
+        settings.mode,
+        corrected + sum(r.corrected for r in results),
+        window_count + sum(r.windows for r in results),
+        duration,
+        watermark,
+        min(r.to_version for r in results),
+    )
+    return RunReport(
+        owner, len(results), len(contended), records, slices, sum(1 for r in results if r.lease_lost)
+    )
+
+
+def main(mytimer: func.TimerRequest) -> None:  # pylint: disable=unused-argument
+    try:
+        process_changes()
     except Exception as exc:  # pragma: no cover
         logging.error("Error while processing air-quality changes: %s", exc, exc_info=True)
         raise
@@ -0,0 +1,58 @@
+import datetime
+import logging
+import os
+import time
+
+import azure.functions as func
+
+from azure_sql import get_backend, pooled_connection
+from retention import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_DAYS_AHEAD,
+    DEFAULT_RETENTION_DAYS,
+    maintain_partitions,
+    purge_expired,
+    retention_cutoff,
+)
+
+DEFAULT_TIME_BUDGET_SECONDS = 240
+
+
+def main(mytimer: func.TimerRequest) -> None:  # pylint: disable=unused-argument
+    retention_days = int(os.getenv("RETENTION_DAYS", str(DEFAULT_RETENTION_DAYS)))
+    batch_size = int(os.getenv("RETENTION_BATCH_SIZE", str(DEFAULT_BATCH_SIZE)))
+    pause_sec = float(os.getenv("RETENTION_BATCH_PAUSE_MS", "20")) / 1000
+    time_budget = float(os.getenv("RETENTION_TIME_BUDGET_SECONDS", str(DEFAULT_TIME_BUDGET_SECONDS)))
+    now = datetime.datetime.utcnow()
+    cutoff = retention_cutoff(now, retention_days)
+    try:
+        with pooled_connection() as conn:
+            result = purge_expired(conn, cutoff, batch_size, time.monotonic() + time_budget, pause_sec)
+            logging.info(
+                "Purged %d readings recorded before %s (%d contribution entries) in %d batches "
+                "in %.2fs (%.0f rows/s)",
+                result.rows,
+                cutoff.isoformat(timespec="seconds"),
+                result.ledger_rows,
+                result.batches,
+                result.duration_sec,
+                result.rows_per_sec,
+            )
+            if not result.complete:
+                logging.warning(
+                    "Time budget of %.0f s used up; expired readings remain for the next run", time_budget
+                )
+            if get_backend() == "azure":
+                try:
+                    merged, added = maintain_partitions(
+                        conn, cutoff, now.date(), int(os.getenv("RETENTION_DAYS_AHEAD", str(DEFAULT_DAYS_AHEAD)))
+                    )
+                except Exception as exc:  # pylint: disable=broad-except
+                    # Usually the lock timeout: the ingest was busy. The next run tries again.
+                    logging.warning("Partition maintenance skipped: %s", exc)
+                else:
+                    if merged or added:
+                        logging.info("Merged %d emptied daily partitions and added %d ahead", merged, added)
+    except Exception as exc:  # pragma: no cover
+        logging.error("Error while purging expired air-quality data: %s", exc, exc_info=True)
+        raise
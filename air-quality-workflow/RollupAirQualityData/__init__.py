@@ -0,0 +1,60 @@
+import datetime
+import logging
+import os
+import time
+
+import azure.functions as func
+
+from azure_sql import pooled_connection
+from rollup import DEFAULT_GRACE_MINUTES, DEFAULT_MAX_DAYS, DEFAULT_MAX_HOURS, run_daily, run_hourly
+
+DEFAULT_TIME_BUDGET_SECONDS = 240
+
+
+def _drain(conn, step, limit: int, deadline: float):
+    """Repeat ``step`` until it covers fewer than ``limit`` periods or time runs out.
+
+    Each chunk commits together with its watermark, so a long backlog
+    drains over several runs. Returns (periods, rows, watermark).
+    """
+    periods = rows = 0
+    while True:
+        with conn.cursor() as cursor:
+            result = step(cursor)
+        conn.commit()
+        periods += result.periods
+        rows += result.rows
+        if result.periods < limit or time.monotonic() >= deadline:
+            return periods, rows, result.watermark
+
+
+def main(mytimer: func.TimerRequest) -> None:  # pylint: disable=unused-argument
+    grace = datetime.timedelta(minutes=int(os.getenv("ROLLUP_GRACE_MINUTES", str(DEFAULT_GRACE_MINUTES))))
+    max_hours = int(os.getenv("ROLLUP_MAX_HOURS", str(DEFAULT_MAX_HOURS)))
+    max_days = int(os.getenv("ROLLUP_MAX_DAYS", str(DEFAULT_MAX_DAYS)))
+    time_budget = float(os.getenv("ROLLUP_TIME_BUDGET_SECONDS", str(DEFAULT_TIME_BUDGET_SECONDS)))
+    start = time.perf_counter()
+    deadline = time.monotonic() + time_budget
+    now = datetime.datetime.utcnow()
+    try:
+        with pooled_connection() as conn:
+            hours, hourly_rows, hourly_mark = _drain(
+                conn, lambda cursor: run_hourly(cursor, now, grace, max_hours), max_hours, deadline
+            )
+            days, daily_rows, daily_mark = _drain(conn, lambda cursor: run_daily(cursor, max_days), max_days, deadline)
+        logging.info(
+            "Rolled up %d hours (%d station-hour rows) and %d days (%d station-day rows) in %.2fs; "
+            "watermarks hourly %s, daily %s",
+            hours,
+            hourly_rows,
+            days,
+            daily_rows,
+            time.perf_counter() - start,
+            hourly_mark,
+            daily_mark,
+        )
+        if hourly_mark is not None and hourly_mark < now - grace - datetime.timedelta(hours=1):
+            logging.warning("Time budget of %.0f s used up; hourly rollup is behind at %s", time_budget, hourly_mark)
+    except Exception as exc:  # pragma: no cover
+        logging.error("Error while rolling up air-quality data: %s", exc, exc_info=True)
+        raise
@@ -0,0 +1,157 @@
+"""Keep several sub-batch inserts in flight from an asyncio event loop.
+
+A batch is cut into sub-batches of ``sub_batch_size`` rows. Each sub-batch is
+written and committed by a blocking ``write_sub_batch`` call that runs on a
+``ThreadPoolExecutor`` of ``in_flight`` workers, on its own connection, so up
+to ``in_flight`` round trips wait on the network at the same time while the
+event loop stays free.
+
+Sub-batches finish in any order, but commits are reported strictly in
+sub-batch order: ``on_commit`` sees sub-batch ``n`` only after ``0 .. n-1``,
+and the returned results are ordered the same way. Because every sub-batch
+is its own transaction, a failure leaves the earlier commits in place; no
+new sub-batch starts once one has failed, the ones already running are
+allowed to finish, and :class:`SubBatchFailed` lists exactly what committed.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple, Optional, Sequence, Tuple
+
+
+class SubBatchResult(NamedTuple):
+    index: int
+    rows: int
+    round_trips: int
+    write_sec: float
+    committed_at_sec: float
+
+
+class AsyncIngestStats(NamedTuple):
+    rows: int
+    sub_batches: int
+    in_flight: int
+    peak_in_flight: int
+    round_trips: int
+    wall_sec: float
+    write_sec: float
+    results: Tuple[SubBatchResult, ...]
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.wall_sec if self.wall_sec > 0 else 0.0
+
+    @property
+    def overlap(self) -> float:
+        """Average number of sub-batches on the wire at once (1 = serial)."""
+        return self.write_sec / self.wall_sec if self.wall_sec > 0 else 0.0
+
+
+class SubBatchFailed(Exception):
+    """A sub-batch failed; ``committed`` holds the sub-batches that did commit, in order."""
+
+    def __init__(self, index: int, committed: Tuple[SubBatchResult, ...], cause: BaseException):
+        super().__init__(f"Sub-batch {index} failed after {len(committed)} sub-batches committed: {cause}")
+        self.index = index
+        self.committed = committed
+
+
+class _OrderedReporter:
+    """Hands completed sub-batches to ``on_commit`` in index order."""
+
+    def __init__(self, on_commit):
+        self._on_commit = on_commit
+        self._pending = {}
+        self.reported = []
+
+    def complete(self, result: SubBatchResult):
+        self._pending[result.index] = result
+        while len(self.reported) in self._pending:
+            ready = self._pending.pop(len(self.reported))
+            self.reported.append(ready)
+            if self._on_commit is not None:
+                self._on_commit(ready)
+
+    def committed(self) -> Tuple[SubBatchResult, ...]:
+        # Sub-batches that committed after an earlier one failed are still committed.
+        return tuple(self.reported) + tuple(self._pending[index] for index in sorted(self._pending))
+
+
+async def ingest_async(
+    readings: Sequence,
+    sub_batch_size: int,
+    in_flight: int,
+    write_sub_batch: Callable[[Sequence], object],
+    on_commit: Optional[Callable[[SubBatchResult], None]] = None,
+    executor: Optional[ThreadPoolExecutor] = None,
+) -> AsyncIngestStats:
+    """Write ``readings`` in sub-batches with at most ``in_flight`` running at once.
+
+    ``write_sub_batch(rows)`` must write *and commit* ``rows`` on a connection
+    of its own; it may return a ``BulkWriteResult`` whose round trips are
+    accumulated. A caller-supplied ``executor`` is used as is and left
+    running; otherwise one with ``in_flight`` workers is created and shut
+    down afterwards.
+    """
+    if sub_batch_size < 1 or in_flight < 1:
+        raise ValueError("sub_batch_size and in_flight must be at least 1")
+
+    loop = asyncio.get_running_loop()
+    owns_executor = executor is None
+    if owns_executor:
+        executor = ThreadPoolExecutor(max_workers=in_flight, thread_name_prefix="ingest-writer")
+    slots = asyncio.Semaphore(in_flight)
+    reporter = _OrderedReporter(on_commit)
+    failures = []
+    running = {"now": 0, "peak": 0}
+    start = time.perf_counter()
+
+    async def run(index: int, offset: int):
+        async with slots:
+            if failures:
+                return
+            rows = readings[offset:offset + sub_batch_size]
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            write_start = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(executor, write_sub_batch, rows)
+            except Exception as exc:  # pylint: disable=broad-except
+                failures.append((index, exc))
+                return
+            finally:
+                running["now"] -= 1
+            now = time.perf_counter()
+            reporter.complete(SubBatchResult(
+                index=index,
+                rows=len(rows),
+                round_trips=getattr(result, "round_trips", 1),
+                write_sec=now - write_start,
+                committed_at_sec=now - start,
+            ))
+
+    try:
+        offsets = range(0, len(readings), sub_batch_size)
+        await asyncio.gather(*(run(index, offset) for index, offset in enumerate(offsets)))
+    finally:
+        if owns_executor:
+            # Every write has returned unless the caller was cancelled; do not block the loop on stragglers.
+            executor.shutdown(wait=False)
+    wall_sec = time.perf_counter() - start
+
+    if failures:
+        index, exc = min(failures, key=lambda failure: failure[0])
+        raise SubBatchFailed(index, reporter.committed(), exc) from exc
+
+    results = tuple(reporter.reported)
+    return AsyncIngestStats(
+        rows=sum(result.rows for result in results),
+        sub_batches=len(results),
+        in_flight=in_flight,
+        peak_in_flight=running["peak"],
+        round_trips=sum(result.round_trips for result in results),
+        wall_sec=wall_sec,
+        write_sec=sum(result.write_sec for result in results),
+        results=results,
+    )
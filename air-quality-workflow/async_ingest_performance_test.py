@@ -0,0 +1,118 @@
+"""
+异步写入性能测试 - 比较 GenerateAirQualityData 异步写入（INGEST_MODE=async）在不同并发深度
+（同时在途的子批次数）下的总耗时与吞吐量
+
+每个子批次在独立的池化连接上写入并提交；同时检查提交按子批次顺序上报、写入条数与批次大小一致。
+本地 SQLite 没有网络往返，写入会在数据库锁上串行化，因此在 SQLite 后端给每个子批次加上
+SIMULATED_RTT_MS 的等待来模拟到 Azure SQL 的往返延迟；Azure SQL 后端不加。
+"""
+import asyncio
+import csv
+import datetime
+import json
+import os
+import time
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+# --- 配置 --- #
+BATCH_SIZES = [2000, 20000]
+SUB_BATCH_SIZE = 1000
+IN_FLIGHT_DEPTHS = [1, 2, 4, 8]
+STATION_COUNT = 15
+REPEATS = 3
+SIMULATED_RTT_MS = 50
+OUTPUT_FILE = "async_ingest_results.csv"
+# --- END 配置 --- #
+
+# 每个在途子批次占用一个池化连接
+os.environ["SQL_POOL_SIZE"] = str(max(IN_FLIGHT_DEPTHS))
+
+from GenerateAirQualityData import _commit_rows, _generate_readings
+from async_ingest import ingest_async
+from azure_sql import get_backend, get_sql_connection
+
+RTT_SEC = SIMULATED_RTT_MS / 1000 if get_backend() == "sqlite" else 0.0
+
+
+def write_sub_batch(rows):
+    if RTT_SEC:
+        time.sleep(RTT_SEC)
+    return _commit_rows(rows)
+
+
+def count_rows(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM air_quality_data")
+    count = cur.fetchone()[0]
+    cur.close()
+    return count
+
+
+def run_single(conn, batch_size, in_flight):
+    readings = _generate_readings(batch_size, STATION_COUNT)
+    reported = []
+    before = count_rows(conn)
+    stats = asyncio.run(ingest_async(
+        readings,
+        SUB_BATCH_SIZE,
+        in_flight,
+        write_sub_batch=write_sub_batch,
+        on_commit=lambda result: reported.append(result.index),
+    ))
+    written = count_rows(conn) - before
+    return stats, reported == list(range(stats.sub_batches)) and written == batch_size
+
+
+def main():
+    print("=" * 80)
+    print(f"异步写入性能测试 ({get_backend()} 后端, 子批次 {SUB_BATCH_SIZE} 条"
+          + (f", 模拟往返 {SIMULATED_RTT_MS}ms" if RTT_SEC else "") + ")")
+    print("=" * 80)
+
+    conn = get_sql_connection()
+    results = []
+    try:
+        for batch_size in BATCH_SIZES:
+            print(f"\n批次大小 {batch_size:,}")
+            baseline = None
+            for in_flight in IN_FLIGHT_DEPTHS:
+                runs = [run_single(conn, batch_size, in_flight) for _ in range(REPEATS)]
+                wall = sorted(stats.wall_sec for stats, _ in runs)[len(runs) // 2]
+                stats = runs[-1][0]
+                ok = all(ok for _, ok in runs)
+                baseline = baseline or wall
+                results.append({
+                    'batch_size': batch_size,
+                    'sub_batch_size': SUB_BATCH_SIZE,
+                    'in_flight': in_flight,
+                    'sub_batches': stats.sub_batches,
+                    'peak_in_flight': stats.peak_in_flight,
+                    'wall_sec': wall,
+                    'rows_per_sec': batch_size / wall if wall > 0 else 0,
+                    'overlap': stats.overlap,
+                    'speedup': baseline / wall if wall > 0 else 0,
+                    'simulated_rtt_ms': SIMULATED_RTT_MS if RTT_SEC else 0,
+                    'ordered_and_complete': ok,
+                    'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                })
+                row = results[-1]
+                print(f"  {'✓' if ok else '✗'} 在途 {in_flight}  {wall:>7.3f}s  "
+                      f"({row['rows_per_sec']:>9,.0f} 条/秒, 平均重叠 {stats.overlap:.1f}, 加速 {row['speedup']:.2f}x)")
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM air_quality_data")
+        conn.commit()
+    finally:
+        conn.close()
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Helpers for acquiring Azure SQL connections.
+
+``SQL_BACKEND`` selects the storage engine: ``azure`` (default) connects with
+pyodbc using ``SQL_CONNECTION_STRING``; ``sqlite`` opens the local file named by
+``SQLITE_DATABASE_PATH`` through :mod:`azure_sql.sqlite_backend`, which accepts
+the same T-SQL the functions issue, including Change Tracking queries.
+"""
+
+import contextlib
+import logging
+import os
+import threading
+
+from azure_sql.pool import ConnectionPool
+
+BACKENDS = ("azure", "sqlite")
+
+
+def get_backend() -> str:
+    """Return the configured backend name."""
+    backend = os.getenv("SQL_BACKEND", "azure").strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown SQL_BACKEND {backend!r}; expected one of {BACKENDS}")
+    return backend
+
+
+def get_sql_connection():
+    """Return a new connection to the configured backend."""
+    if get_backend() == "sqlite":
+        from azure_sql import sqlite_backend
+
+        return sqlite_backend.connect(os.getenv("SQLITE_DATABASE_PATH", "air_quality_local.db"))
+
+    import pyodbc
+
+    conn_str = os.environ["SQL_CONNECTION_STRING"]
+    logging.info("Attempting connection with pyodbc...")
+    return pyodbc.connect(conn_str, timeout=30)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """Return the module-level pool, creating it from environment settings on first use."""
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                get_sql_connection,
+                max_size=int(os.getenv("SQL_POOL_SIZE", "4")),
+                idle_timeout=float(os.getenv("SQL_POOL_IDLE_SECONDS", "300")),
+                ping_after=float(os.getenv("SQL_POOL_PING_AFTER_SECONDS", "5")),
+                acquire_timeout=float(os.getenv("SQL_POOL_ACQUIRE_TIMEOUT", "30")),
+            )
+        return _pool
+
+
+@contextlib.contextmanager
+def pooled_connection():
+    """Borrow a warm connection for the duration of a ``with`` block.
+
+    Callers commit explicitly. Whatever is left uncommitted when the block
+    ends, normally or by an exception, is rolled back, so no open transaction
+    or lock stays on an idle connection; after a commit the rollback is a
+    no-op. A connection that cannot even roll back is treated as broken and
+    discarded rather than returned to the pool.
+    """
+    pool = get_connection_pool()
+    conn, wait = pool.acquire()
+    logging.info("Acquired pooled SQL connection in %.3fs", wait)
+    try:
+        yield conn
+    finally:
+        try:
+            conn.rollback()
+        except Exception:  # pylint: disable=broad-except
+            pool.discard(conn)
+        else:
+            pool.release(conn)
@@ -0,0 +1,165 @@
+"""Connection pool shared across function invocations on a warm worker."""
+
+import threading
+import time
+
+
+class ConnectionPool:
+    """Thread-safe pool of warm connections that outlives a single invocation.
+
+    Idle connections older than ``idle_timeout`` seconds are closed, and a
+    connection that has been idle longer than ``ping_after`` seconds is checked
+    with ``SELECT 1`` before it is handed out again.
+    """
+
+    def __init__(self, factory, max_size=4, idle_timeout=300.0, ping_after=5.0, acquire_timeout=30.0):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self.acquire_timeout = acquire_timeout
+        self._idle = []  # (connection, released_at), most recently used last
+        self._in_use = 0
+        # close_all() starts a new generation; connections lent out before it are closed on release.
+        self._generation = 0
+        self._lent = {}  # id(connection) -> generation it was lent out in
+        self._cond = threading.Condition()
+        self._stats = {
+            "acquired": 0,
+            "created": 0,
+            "reused": 0,
+            "discarded": 0,
+            "evicted": 0,
+            "failed_pings": 0,
+            "total_wait_sec": 0.0,
+            "max_wait_sec": 0.0,
+        }
+
+    def acquire(self):
+        """Return ``(connection, wait_seconds)``, reusing a live idle connection if possible."""
+        start = time.monotonic()
+        deadline = start + self.acquire_timeout
+        with self._cond:
+            while True:
+                self._evict_idle_locked()
+                if self._idle or self._in_use + len(self._idle) < self.max_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"Timed out after {self.acquire_timeout:.1f}s waiting for a pooled SQL connection"
+                    )
+                self._cond.wait(remaining)
+            self._in_use += 1
+            entry = self._idle.pop() if self._idle else None
+
+        conn = None
+        reused = False
+        try:
+            # Liveness checks run outside the lock so other threads are not blocked on the network.
+            while entry is not None:
+                candidate, released_at = entry
+                if self._is_alive(candidate, released_at):
+                    conn = candidate
+                    reused = True
+                    break
+                self._close(candidate)
+                with self._cond:
+                    self._stats["failed_pings"] += 1
+                    entry = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._factory()
+                with self._cond:
+                    self._stats["created"] += 1
+        except BaseException:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        wait = time.monotonic() - start
+        with self._cond:
+            self._lent[id(conn)] = self._generation
+            self._stats["acquired"] += 1
+            self._stats["reused"] += int(reused)
+            self._stats["total_wait_sec"] += wait
+            self._stats["max_wait_sec"] = max(self._stats["max_wait_sec"], wait)
+        return conn, wait
+
+    def release(self, conn):
+        """Return a healthy connection to the pool, or close it if :meth:`close_all` ran since it was lent out."""
+        with self._cond:
+            self._in_use -= 1
+            stale = self._lent.pop(id(conn), self._generation) != self._generation
+            if not stale:
+                self._idle.append((conn, time.monotonic()))
+            self._evict_idle_locked()
+            self._cond.notify()
+        if stale:
+            self._close(conn)
+
+    def discard(self, conn):
+        """Close a broken connection instead of returning it to the pool."""
+        self._close(conn)
+        with self._cond:
+            self._lent.pop(id(conn), None)
+            self._in_use -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection; connections in use are closed on release.
+
+        The pool stays usable: later acquires open new connections.
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._generation += 1
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        """Return a snapshot of pool counters, including acquire-wait time."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot["idle"] = len(self._idle)
+            snapshot["in_use"] = self._in_use
+        acquired = snapshot["acquired"]
+        snapshot["avg_wait_sec"] = snapshot["total_wait_sec"] / acquired if acquired else 0.0
+        return snapshot
+
+    def _is_alive(self, conn, released_at):
+        if getattr(conn, "closed", False):
+            return False
+        if time.monotonic() - released_at < self.ping_after:
+            return True
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            return True
+        except Exception:  # pylint: disable=broad-except
+            return False
+
+    def _evict_idle_locked(self):
+        now = time.monotonic()
+        keep = []
+        for conn, released_at in self._idle:
+            if now - released_at > self.idle_timeout:
+                self._close(conn)
+                self._stats["evicted"] += 1
+            else:
+                keep.append((conn, released_at))
+        self._idle = keep
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:  # pylint: disable=broad-except
+            pass
@@ -0,0 +1,607 @@
+"""Local SQLite engine that speaks enough T-SQL to run the workflow offline.
+
+Connections returned by :func:`connect` behave like pyodbc connections
+(``cursor.execute(sql, *params)``, cursors and connections commit when their
+``with`` block exits cleanly, ``autocommit``, ``fast_executemany``) and
+rewrite the SQL Server constructs used in this repository:
+
+- ``CHANGE_TRACKING_CURRENT_VERSION()`` and
+  ``CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID('air_quality_data'))``
+- ``CHANGETABLE(CHANGES air_quality_data, <version>)``
+- ``SELECT TOP n``, ``OFFSET ... ROWS FETCH NEXT n ROWS ONLY``,
+  ``INSERT ... OUTPUT inserted.col``, ``DELETE TOP (n) ... OUTPUT deleted.col``,
+  ``sys.tables``,
+  ``WITH (UPDLOCK, HOLDLOCK)`` (the transaction takes the write lock up
+  front, see :meth:`SqliteCursor.execute`),
+  ``ISNULL``, ``NEWID()``, ``SYSUTCDATETIME()`` / ``GETUTCDATE()``
+- ``DATEDIFF`` / ``DATEDIFF_BIG`` / ``DATEADD`` with a ``SECOND``, ``MINUTE``,
+  ``HOUR`` or ``DAY`` datepart, and ``CHECKSUM(value)``
+- ``{CALL dbo.usp_insert_air_quality_batch (?)}`` and
+  ``{CALL dbo.usp_upsert_air_quality_batch (?)}`` with a list of rows as the
+  table-valued parameter
+
+Change Tracking is emulated with triggers on ``air_quality_data`` that write
+a version log. Every transaction that touches the table takes the next value
+of a single version clock, so all rows written by one commit share a
+version, exactly like SQL Server. ``_ct_changes`` keeps the latest version,
+creation version and operation per row, which is all ``CHANGETABLE(CHANGES)``
+needs, and :func:`cleanup_change_tracking` plays the part of retention-based
+auto cleanup by advancing the minimum valid version.
+"""
+
+import datetime
+import functools
+import itertools
+import logging
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+TRACKED_TABLE = "air_quality_data"
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS air_quality_data (
+    id TEXT PRIMARY KEY DEFAULT (NEWSEQUENTIALID()),
+    station_id NVARCHAR(50),
+    recorded_at DATETIME2,
+    pm25 FLOAT,
+    pm10 FLOAT,
+    o3 FLOAT,
+    aqi INT
+);
+CREATE INDEX IF NOT EXISTS ix_air_quality_data_recorded_at ON air_quality_data (recorded_at);
+-- SQLite has no INCLUDE; the pollutant columns are trailing key columns instead.
+CREATE INDEX IF NOT EXISTS ix_air_quality_data_station_time
+    ON air_quality_data (station_id, recorded_at, pm25, pm10, o3, aqi);
+
+CREATE TABLE IF NOT EXISTS air_quality_summary (
+    id TEXT PRIMARY KEY DEFAULT (lower(hex(randomblob(16)))),
+    window_start DATETIME2,
+    window_end DATETIME2,
+    avg_aqi FLOAT,
+    max_pm25 FLOAT,
+    min_o3 FLOAT,
+    record_count INT
+);
+
+CREATE TABLE IF NOT EXISTS air_quality_station_summary (
+    id TEXT PRIMARY KEY DEFAULT (lower(hex(randomblob(16)))),
+    station_id NVARCHAR(50) NOT NULL,
+    sync_version BIGINT NOT NULL,
+    window_start DATETIME2,
+    window_end DATETIME2,
+    avg_aqi FLOAT,
+    max_pm25 FLOAT,
+    min_o3 FLOAT,
+    record_count INT
+);
+CREATE INDEX IF NOT EXISTS ix_station_summary_station_window
+    ON air_quality_station_summary (station_id, window_end);
+CREATE INDEX IF NOT EXISTS ix_station_summary_sync_version
+    ON air_quality_station_summary (sync_version);
+
+CREATE TABLE IF NOT EXISTS air_quality_sync_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_version BIGINT,
+    lease_owner NVARCHAR(64),
+    lease_expires_at DATETIME2
+);
+INSERT OR IGNORE INTO air_quality_sync_state (id, last_version) VALUES (1, 0);
+
+CREATE TABLE IF NOT EXISTS air_quality_window_summary (
+    window_seconds INT NOT NULL,
+    window_start DATETIME2 NOT NULL,
+    window_end DATETIME2 NOT NULL,
+    record_count INT NOT NULL,
+    sum_aqi FLOAT NOT NULL,
+    sum_sq_aqi FLOAT NOT NULL,
+    avg_aqi FLOAT,
+    max_pm25 FLOAT,
+    min_o3 FLOAT,
+    updated_at DATETIME2,
+    PRIMARY KEY (window_seconds, window_start)
+);
+
+CREATE TABLE IF NOT EXISTS air_quality_contribution (
+    row_id TEXT PRIMARY KEY,
+    row_version BIGINT NOT NULL,
+    station_id NVARCHAR(50),
+    recorded_at DATETIME2,
+    pm25 FLOAT,
+    o3 FLOAT,
+    aqi INT
+);
+CREATE INDEX IF NOT EXISTS ix_contribution_recorded_at
+    ON air_quality_contribution (recorded_at, pm25, o3);
+
+CREATE TABLE IF NOT EXISTS air_quality_partition_state (
+    partition_count INT NOT NULL,
+    partition_id INT NOT NULL,
+    last_version BIGINT NOT NULL,
+    updated_at DATETIME2,
+    lease_owner NVARCHAR(64),
+    lease_expires_at DATETIME2,
+    PRIMARY KEY (partition_count, partition_id)
+);
+
+CREATE TABLE IF NOT EXISTS air_quality_hourly (
+    station_id NVARCHAR(50) NOT NULL,
+    hour_start DATETIME2 NOT NULL,
+    record_count INT NOT NULL,
+    sum_aqi FLOAT,
+    avg_aqi FLOAT,
+    max_pm25 FLOAT,
+    min_o3 FLOAT,
+    PRIMARY KEY (station_id, hour_start)
+);
+CREATE INDEX IF NOT EXISTS ix_air_quality_hourly_hour_start ON air_quality_hourly (hour_start);
+
+CREATE TABLE IF NOT EXISTS air_quality_daily (
+    station_id NVARCHAR(50) NOT NULL,
+    day_start DATETIME2 NOT NULL,
+    record_count INT NOT NULL,
+    sum_aqi FLOAT,
+    avg_aqi FLOAT,
+    max_pm25 FLOAT,
+    min_o3 FLOAT,
+    PRIMARY KEY (station_id, day_start)
+);
+CREATE INDEX IF NOT EXISTS ix_air_quality_daily_day_start ON air_quality_daily (day_start);
+
+CREATE TABLE IF NOT EXISTS air_quality_rollup_state (
+    level NVARCHAR(10) PRIMARY KEY,
+    watermark DATETIME2 NOT NULL,
+    updated_at DATETIME2
+);
+
+CREATE TABLE IF NOT EXISTS air_quality_spool_state (
+    spool_id NVARCHAR(100) PRIMARY KEY,
+    segment BIGINT NOT NULL,
+    position BIGINT NOT NULL,
+    updated_at DATETIME2
+);
+
+CREATE TABLE IF NOT EXISTS _ct_clock (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    current_version INTEGER NOT NULL,
+    min_valid_version INTEGER NOT NULL,
+    txn TEXT
+);
+INSERT OR IGNORE INTO _ct_clock (id, current_version, min_valid_version) VALUES (1, 0, 0);
+
+CREATE TABLE IF NOT EXISTS _ct_versions (
+    version INTEGER PRIMARY KEY,
+    committed_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS _ct_changes (
+    row_id PRIMARY KEY,
+    version INTEGER NOT NULL,
+    creation_version INTEGER NOT NULL,
+    operation TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_ct_changes_version ON _ct_changes (version);
+"""
+
+# (station_id, recorded_at) identifies a reading; kept out of SCHEMA_SQL so
+# that files holding duplicates from before the key existed still open.
+NATURAL_KEY_SQL = """
+CREATE UNIQUE INDEX IF NOT EXISTS ux_air_quality_data_natural_key ON air_quality_data (station_id, recorded_at)
+"""
+
+# Takes the next clock value once per transaction (ct_txn() is a per-connection
+# token that changes on commit/rollback) and records when that version was made.
+_BUMP_VERSION = """
+    UPDATE _ct_clock SET current_version = current_version + 1, txn = ct_txn()
+    WHERE id = 1 AND txn IS NOT ct_txn();
+    INSERT OR IGNORE INTO _ct_versions (version, committed_at)
+    SELECT current_version, strftime('%Y-%m-%d %H:%M:%f', 'now') FROM _ct_clock WHERE id = 1;
+"""
+
+TRIGGERS_SQL = f"""
+CREATE TRIGGER IF NOT EXISTS _ct_{TRACKED_TABLE}_insert AFTER INSERT ON {TRACKED_TABLE}
+BEGIN
+    {_BUMP_VERSION}
+    INSERT INTO _ct_changes (row_id, version, creation_version, operation)
+    SELECT NEW.id, current_version, current_version, 'I' FROM _ct_clock WHERE id = 1
+    ON CONFLICT (row_id) DO UPDATE SET
+        version = excluded.version,
+        creation_version = excluded.creation_version,
+        operation = 'I';
+END;
+
+CREATE TRIGGER IF NOT EXISTS _ct_{TRACKED_TABLE}_update AFTER UPDATE ON {TRACKED_TABLE}
+BEGIN
+    {_BUMP_VERSION}
+    INSERT INTO _ct_changes (row_id, version, creation_version, operation)
+    SELECT NEW.id, current_version, 0, 'U' FROM _ct_clock WHERE id = 1
+    ON CONFLICT (row_id) DO UPDATE SET version = excluded.version, operation = 'U';
+END;
+
+CREATE TRIGGER IF NOT EXISTS _ct_{TRACKED_TABLE}_delete AFTER DELETE ON {TRACKED_TABLE}
+BEGIN
+    {_BUMP_VERSION}
+    INSERT INTO _ct_changes (row_id, version, creation_version, operation)
+    SELECT OLD.id, current_version, 0, 'D' FROM _ct_clock WHERE id = 1
+    ON CONFLICT (row_id) DO UPDATE SET version = excluded.version, operation = 'D';
+END;
+"""
+
+_CHANGETABLE = re.compile(
+    rf"CHANGETABLE\s*\(\s*CHANGES\s+(?:dbo\.)?{TRACKED_TABLE}\s*,\s*([^()]+?)\s*\)",
+    re.IGNORECASE,
+)
+_CURRENT_VERSION = re.compile(r"CHANGE_TRACKING_CURRENT_VERSION\s*\(\s*\)", re.IGNORECASE)
+_MIN_VALID_VERSION = re.compile(
+    rf"CHANGE_TRACKING_MIN_VALID_VERSION\s*\(\s*OBJECT_ID\s*\(\s*'(?:dbo\.)?{TRACKED_TABLE}'\s*\)\s*\)",
+    re.IGNORECASE,
+)
+_SELECT_TOP = re.compile(r"^(\s*SELECT\s+)TOP\s*\(?\s*(\d+)\s*\)?\s+", re.IGNORECASE)
+_OFFSET_FETCH = re.compile(
+    r"\bOFFSET\s+(\?\d*|\d+)\s+ROWS?\s+FETCH\s+(?:NEXT|FIRST)\s+(\?\d*|\d+)\s+ROWS?\s+ONLY\b", re.IGNORECASE
+)
+_LOCK_HINTS = re.compile(
+    r"\s+WITH\s*\(\s*(?:UPDLOCK|HOLDLOCK|ROWLOCK)(?:\s*,\s*(?:UPDLOCK|HOLDLOCK|ROWLOCK))*\s*\)", re.IGNORECASE
+)
+_SYS_TABLES = re.compile(r"\bsys\.tables\b", re.IGNORECASE)
+_ISNULL = re.compile(r"\bISNULL\s*\(", re.IGNORECASE)
+_OUTPUT_INSERTED = re.compile(
+    r"^(\s*INSERT\s+INTO\s+\w+\s*\([^)]*\))\s*OUTPUT\s+(inserted\.\w+(?:\s*,\s*inserted\.\w+)*)\s",
+    re.IGNORECASE,
+)
+_DELETE_TOP = re.compile(
+    r"^\s*DELETE\s+TOP\s*\(\s*(\?\d*|\d+)\s*\)\s+FROM\s+(\w+)\s+"
+    r"(?:OUTPUT\s+(deleted\.\w+(?:\s*,\s*deleted\.\w+)*)\s+)?WHERE\s+(.*?);?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_DATEPART = re.compile(
+    r"\b(DATEDIFF_BIG|DATEDIFF|DATEADD)\s*\(\s*(SECOND|MINUTE|HOUR|DAY)\s*,", re.IGNORECASE
+)
+_DATEPART_SECONDS = {"SECOND": 1, "MINUTE": 60, "HOUR": 3600, "DAY": 86400}
+_EPOCH = datetime.datetime(1970, 1, 1)
+_PLACEHOLDER = re.compile(r"'(?:[^']|'')*'|\?")
+_CALL = re.compile(r"^\s*\{\s*CALL\s+(?:dbo\.)?(\w+)\s*(?:\(([^)]*)\))?\s*\}\s*$", re.IGNORECASE)
+
+_schema_lock = threading.Lock()
+_initialised_paths = set()
+_sequential_lock = threading.Lock()
+_last_sequential = 0
+
+
+def _adapt_datetime(value: datetime.datetime) -> str:
+    return value.isoformat(" ", timespec="microseconds")
+
+
+def _convert_datetime2(value: bytes) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value.decode())
+
+
+def _parse_datetime(value) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(value)
+
+
+def _datediff(datepart: str, start, end) -> int:
+    """``DATEDIFF``: the number of ``datepart`` boundaries crossed, as in SQL Server."""
+    if start is None or end is None:
+        return None
+    unit = _DATEPART_SECONDS[datepart.upper()]
+    second = datetime.timedelta(seconds=1)
+    start_sec = (_parse_datetime(start) - _EPOCH) // second
+    end_sec = (_parse_datetime(end) - _EPOCH) // second
+    return end_sec // unit - start_sec // unit
+
+
+def _dateadd(datepart: str, number, value) -> str:
+    if number is None or value is None:
+        return None
+    delta = datetime.timedelta(seconds=number * _DATEPART_SECONDS[datepart.upper()])
+    return _adapt_datetime(_parse_datetime(value) + delta)
+
+
+def _newsequentialid() -> str:
+    """Stand-in for ``NEWSEQUENTIALID()``: GUID strings that increase in text order.
+
+    The high 64 bits are a microsecond clock with a 12-bit counter, so keys
+    are appended to the end of the primary key index; the low 64 bits are
+    random so that separate processes never collide.
+    """
+    global _last_sequential  # pylint: disable=global-statement
+    with _sequential_lock:
+        _last_sequential = max(time.time_ns() // 1000 << 12, _last_sequential + 1)
+        high = _last_sequential
+    return str(uuid.UUID(int=high << 64 | uuid.uuid4().int >> 64))
+
+
+def _checksum(value) -> int:
+    """Stand-in for ``CHECKSUM``: a signed 32-bit hash (not bit-compatible with SQL Server)."""
+    if value is None:
+        return None
+    crc = zlib.crc32(str(value).encode("utf-8"))
+    return crc - (1 << 32) if crc >= 1 << 31 else crc
+
+
+sqlite3.register_adapter(datetime.datetime, _adapt_datetime)
+sqlite3.register_converter("DATETIME2", _convert_datetime2)
+
+
+def _number_placeholders(sql: str) -> str:
+    """Rewrite ``?`` as ``?1, ?2, ...`` so a parameter can be referenced twice."""
+    counter = itertools.count(1)
+    return _PLACEHOLDER.sub(lambda m: f"?{next(counter)}" if m.group(0) == "?" else m.group(0), sql)
+
+
+def _changetable_subquery(match) -> str:
+    since = match.group(1)
+    return (
+        "(SELECT row_id AS id, version AS SYS_CHANGE_VERSION, "
+        "creation_version AS SYS_CHANGE_CREATION_VERSION, "
+        f"CASE WHEN operation = 'D' THEN 'D' WHEN creation_version > {since} THEN 'I' ELSE 'U' END "
+        "AS SYS_CHANGE_OPERATION "
+        f"FROM _ct_changes WHERE version > {since})"
+    )
+
+
+@functools.lru_cache(maxsize=512)
+def translate(sql: str) -> str:
+    """Rewrite the T-SQL constructs used by this repository into SQLite."""
+    if _CHANGETABLE.search(sql) or _OFFSET_FETCH.search(sql) or _DELETE_TOP.match(sql):
+        sql = _number_placeholders(sql)
+    sql = _CHANGETABLE.sub(_changetable_subquery, sql)
+    # LIMIT comes before OFFSET in SQLite; numbered placeholders keep their values.
+    sql = _OFFSET_FETCH.sub(lambda m: f"LIMIT {m.group(2)} OFFSET {m.group(1)}", sql)
+    sql = _CURRENT_VERSION.sub("(SELECT current_version FROM _ct_clock WHERE id = 1)", sql)
+    sql = _MIN_VALID_VERSION.sub("(SELECT min_valid_version FROM _ct_clock WHERE id = 1)", sql)
+    sql = _SYS_TABLES.sub(
+        "(SELECT name FROM sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite%' AND name NOT LIKE '\\_ct\\_%' ESCAPE '\\')",
+        sql,
+    )
+    sql = _LOCK_HINTS.sub("", sql)
+    sql = _ISNULL.sub("IFNULL(", sql)
+    sql = _DATEPART.sub(lambda m: f"{m.group(1)}('{m.group(2).upper()}',", sql)
+    output = _OUTPUT_INSERTED.match(sql)
+    if output:
+        returning = re.sub(r"inserted\.", "", output.group(2), flags=re.IGNORECASE)
+        sql = f"{output.group(1)} {sql[output.end():].rstrip().rstrip(';')} RETURNING {returning}"
+    delete = _DELETE_TOP.match(sql)
+    if delete:
+        limit, table, output, where = delete.groups()
+        sql = f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT {limit})"
+        if output:
+            sql += " RETURNING " + re.sub(r"deleted\.", "", output, flags=re.IGNORECASE)
+    top = _SELECT_TOP.match(sql)
+    if top:
+        sql = f"{top.group(1)}{sql[top.end():].rstrip().rstrip(';')} LIMIT {top.group(2)}"
+    return sql
+
+
+def _insert_air_quality_batch(cursor, rows):
+    cursor.executemany(
+        "INSERT INTO air_quality_data (station_id, recorded_at, pm25, pm10, o3, aqi) VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def _upsert_air_quality_batch(cursor, rows):
+    # Same shape as the T-SQL procedure: stage the rows, then one UPDATE and one INSERT.
+    cursor.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS _upsert_staging "
+        "(station_id TEXT, recorded_at DATETIME2, pm25 FLOAT, pm10 FLOAT, o3 FLOAT, aqi INT)"
+    )
+    cursor.execute("DELETE FROM _upsert_staging")
+    cursor.executemany("INSERT INTO _upsert_staging VALUES (?, ?, ?, ?, ?, ?)", rows)
+    cursor.execute(
+        """
+        UPDATE air_quality_data AS d
+        SET pm25 = s.pm25, pm10 = s.pm10, o3 = s.o3, aqi = s.aqi
+        FROM _upsert_staging AS s
+        WHERE d.station_id = s.station_id AND d.recorded_at = s.recorded_at
+          AND (d.pm25 IS NOT s.pm25 OR d.pm10 IS NOT s.pm10 OR d.o3 IS NOT s.o3 OR d.aqi IS NOT s.aqi)
+        """
+    )
+    cursor.execute(
+        """
+        INSERT INTO air_quality_data (station_id, recorded_at, pm25, pm10, o3, aqi)
+        SELECT station_id, recorded_at, pm25, pm10, o3, aqi FROM _upsert_staging AS s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM air_quality_data AS d WHERE d.station_id = s.station_id AND d.recorded_at = s.recorded_at
+        )
+        """
+    )
+
+
+# Stored procedures created by init_database.py, emulated in Python.
+PROCEDURES = {
+    "usp_insert_air_quality_batch": _insert_air_quality_batch,
+    "usp_upsert_air_quality_batch": _upsert_air_quality_batch,
+}
+
+
+class SqliteCursor:
+    """pyodbc-style cursor over a :class:`sqlite3.Cursor`."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._raw.cursor()
+        self.fast_executemany = False
+        self.arraysize = 1
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        call = _CALL.match(sql)
+        if call:
+            procedure = PROCEDURES.get(call.group(1).lower())
+            if procedure is None:
+                raise sqlite3.OperationalError(f"Unknown stored procedure {call.group(1)}")
+            procedure(self._cursor, *params)
+        else:
+            if _LOCK_HINTS.search(sql) and not self.connection.autocommit and not self.connection._raw.in_transaction:
+                # sqlite3 runs a SELECT outside any transaction, so a read-then-write
+                # would lose a concurrent update. SQLite has a single writer: the
+                # nearest thing to UPDLOCK + HOLDLOCK is to take that lock now.
+                self._cursor.execute("BEGIN IMMEDIATE")
+            self._cursor.execute(translate(sql), params)
+        self.connection._statement_done()
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate(sql), seq_of_params)
+        self.connection._statement_done()
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Like pyodbc, leaving the block without an error commits the transaction.
+        if exc_type is None and not self.connection.autocommit:
+            self.connection.commit()
+
+
+class SqliteConnection:
+    """pyodbc-style connection over a :class:`sqlite3.Connection`."""
+
+    def __init__(self, raw: sqlite3.Connection):
+        self._raw = raw
+        self._txn_token = None
+        self.closed = False
+        raw.create_function("ct_txn", 0, self._current_txn)
+        raw.create_function("NEWID", 0, lambda: str(uuid.uuid4()))
+        raw.create_function("NEWSEQUENTIALID", 0, _newsequentialid)
+        raw.create_function("SYSUTCDATETIME", 0, lambda: _adapt_datetime(datetime.datetime.utcnow()))
+        raw.create_function("GETUTCDATE", 0, lambda: _adapt_datetime(datetime.datetime.utcnow()))
+        raw.create_function("DATEDIFF", 3, _datediff, deterministic=True)
+        raw.create_function("DATEDIFF_BIG", 3, _datediff, deterministic=True)
+        raw.create_function("DATEADD", 3, _dateadd, deterministic=True)
+        raw.create_function("CHECKSUM", 1, _checksum, deterministic=True)
+
+    def _current_txn(self):
+        if self._txn_token is None:
+            self._txn_token = uuid.uuid4().hex
+        return self._txn_token
+
+    def _statement_done(self):
+        if self.autocommit:
+            self._txn_token = None
+
+    @property
+    def autocommit(self) -> bool:
+        return self._raw.isolation_level is None
+
+    @autocommit.setter
+    def autocommit(self, value: bool):
+        self._raw.isolation_level = None if value else ""
+        self._txn_token = None
+
+    def cursor(self) -> SqliteCursor:
+        return SqliteCursor(self)
+
+    def execute(self, sql, *params) -> SqliteCursor:
+        return self.cursor().execute(sql, *params)
+
+    def commit(self):
+        self._raw.commit()
+        self._txn_token = None
+
+    def rollback(self):
+        self._raw.rollback()
+        self._txn_token = None
+
+    def close(self):
+        if not self.closed:
+            self._raw.close()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and not self.autocommit:
+            self.commit()
+
+
+def ensure_schema(conn: SqliteConnection):
+    """Create the workflow tables and the Change Tracking emulation if missing.
+
+    A database file written before readings had a unique natural key may
+    hold duplicates; it still opens, without the unique index, until
+    ``migrate_natural_key.py`` re-stamps them.
+    """
+    conn.commit()
+    conn._raw.executescript(SCHEMA_SQL + TRIGGERS_SQL)
+    try:
+        conn._raw.execute(NATURAL_KEY_SQL)
+    except sqlite3.IntegrityError:
+        logging.warning("air_quality_data has duplicate (station_id, recorded_at) readings; run migrate_natural_key.py")
+
+
+def connect(path: str) -> SqliteConnection:
+    """Open ``path`` (creating the schema on first use in this process)."""
+    raw = sqlite3.connect(
+        path,
+        timeout=30,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,
+    )
+    raw.execute("PRAGMA journal_mode=WAL")
+    raw.execute("PRAGMA synchronous=NORMAL")
+    conn = SqliteConnection(raw)
+    with _schema_lock:
+        if path not in _initialised_paths:
+            ensure_schema(conn)
+            _initialised_paths.add(path)
+    return conn
+
+
+def cleanup_change_tracking(conn: SqliteConnection, retention: datetime.timedelta = None, min_valid_version: int = None) -> int:
+    """Drop change history the way SQL Server auto cleanup does and return the new minimum valid version.
+
+    Pass either a ``retention`` period (versions committed before ``now -
+    retention`` are removed) or an explicit ``min_valid_version``.
+    """
+    cursor = conn.cursor()
+    if min_valid_version is None:
+        if retention is None:
+            raise ValueError("Pass retention or min_valid_version")
+        cutoff = _adapt_datetime(datetime.datetime.utcnow() - retention)
+        cursor.execute("SELECT MAX(version) FROM _ct_versions WHERE committed_at < ?", cutoff)
+        min_valid_version = cursor.fetchone()[0] or 0
+    cursor.execute(
+        "UPDATE _ct_clock SET min_valid_version = MAX(min_valid_version, ?) WHERE id = 1",
+        min_valid_version,
+    )
+    cursor.execute("SELECT min_valid_version FROM _ct_clock WHERE id = 1")
+    min_valid_version = cursor.fetchone()[0]
+    cursor.execute("DELETE FROM _ct_changes WHERE version <= ?", min_valid_version)
+    cursor.execute("DELETE FROM _ct_versions WHERE version < ?", min_valid_version)
+    conn.commit()
+    return min_valid_version
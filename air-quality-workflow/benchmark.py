@@ -0,0 +1,257 @@
+"""Repeatable benchmark runs with percentiles and machine-readable reports.
+
+A :class:`Scenario` is a ``run(state)`` callable returning the rows it
+handled. It may have a ``setup()`` that prepares ``state`` outside the timed
+region. :func:`run_scenario` first runs ``warmup`` untimed repetitions and
+then ``repetitions`` timed ones with ``time.perf_counter``. Each repetition
+gets a fresh setup and nothing sleeps between them.
+
+:func:`write_report` stores every sample, not just the summary
+percentiles. Later runs can therefore be compared statistically. Each
+report is tagged with :func:`environment_metadata`, so results from
+different machines, backends or commits are never mixed up.
+
+:func:`compare_reports` compares two reports scenario by scenario. It
+gives the change in median latency with a bootstrap confidence interval,
+and the two-sided Mann-Whitney U p-value of the latency samples. A change
+is a regression only if it is significant both ways and at least
+``min_change_pct`` large, so noise on a busy host is not flagged.
+"""
+
+import datetime
+import json
+import math
+import os
+import platform
+import subprocess
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+REPORT_VERSION = 1
+PERCENTILES = (50, 95, 99)
+DEFAULT_ALPHA = 0.05
+DEFAULT_MIN_CHANGE_PCT = 5.0
+DEFAULT_BOOTSTRAP_RESAMPLES = 5000
+
+# Settings that change what a benchmark measures; recorded with every report.
+SETTINGS = (
+    "SQL_BACKEND",
+    "SQL_POOL_SIZE",
+    "BULK_INSERT_STRATEGY",
+    "BULK_INSERT_CHUNK_SIZE",
+    "INGEST_MODE",
+    "WRITER_CONNECTIONS",
+    "WORKLOAD_PROFILE",
+    "SUMMARY_MODE",
+    "SUMMARY_WINDOW_SECONDS",
+    "SUMMARY_PARTITIONS",
+)
+
+
+class Scenario(NamedTuple):
+    name: str
+    run: Callable[[object], int]
+    setup: Optional[Callable[[], object]] = None
+
+
+class ScenarioResult(NamedTuple):
+    name: str
+    warmup: int
+    samples_sec: List[float]
+    rows: List[int]
+
+    @property
+    def rows_per_sec(self) -> List[float]:
+        return [rows / sec if sec > 0 else 0.0 for rows, sec in zip(self.rows, self.samples_sec)]
+
+    def latency_percentile(self, pct: float) -> float:
+        return float(np.percentile(self.samples_sec, pct))
+
+    def rows_per_sec_percentile(self, pct: float) -> float:
+        # The p95 of throughput is its slow tail, matching the p95 of latency.
+        return float(np.percentile(self.rows_per_sec, 100 - pct))
+
+    def to_dict(self) -> Dict:
+        return {
+            "warmup": self.warmup,
+            "repetitions": len(self.samples_sec),
+            "latency_sec": {
+                **{f"p{pct}": self.latency_percentile(pct) for pct in PERCENTILES},
+                "mean": float(np.mean(self.samples_sec)),
+                "min": min(self.samples_sec),
+                "max": max(self.samples_sec),
+            },
+            "rows_per_sec": {f"p{pct}": self.rows_per_sec_percentile(pct) for pct in PERCENTILES},
+            "samples_sec": self.samples_sec,
+            "rows": self.rows,
+        }
+
+
+def run_scenario(scenario: Scenario, warmup: int, repetitions: int) -> ScenarioResult:
+    if repetitions < 1:
+        raise ValueError("repetitions must be at least 1")
+    samples, rows = [], []
+    for index in range(warmup + repetitions):
+        state = scenario.setup() if scenario.setup is not None else None
+        start = time.perf_counter()
+        handled = scenario.run(state)
+        elapsed = time.perf_counter() - start
+        if index >= warmup:
+            samples.append(elapsed)
+            rows.append(int(handled))
+    return ScenarioResult(scenario.name, warmup, samples, rows)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment_metadata(backend: str, database_version: Optional[str] = None) -> Dict:
+    return {
+        "backend": backend,
+        "database_version": database_version,
+        "git_commit": _git_commit(),
+        "hostname": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "settings": {name: os.environ[name] for name in SETTINGS if name in os.environ},
+    }
+
+
+def write_report(path: str, results: List[ScenarioResult], environment: Dict, config: Dict):
+    report = {
+        "version": REPORT_VERSION,
+        "created_at": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "environment": environment,
+        "config": config,
+        "scenarios": {result.name: result.to_dict() for result in results},
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+
+
+def load_report(path: str) -> Dict:
+    with open(path, encoding="utf-8") as handle:
+        report = json.load(handle)
+    if report.get("version") != REPORT_VERSION:
+        raise ValueError(f"{path}: unsupported benchmark report version {report.get('version')!r}")
+    return report
+
+
+class ScenarioComparison(NamedTuple):
+    name: str
+    baseline_p50_sec: float
+    candidate_p50_sec: float
+    change_pct: float
+    ci_low_pct: float
+    ci_high_pct: float
+    p_value: float
+    alpha: float
+    min_change_pct: float
+
+    @property
+    def significant(self) -> bool:
+        return self.p_value < self.alpha and (self.ci_low_pct > 0 or self.ci_high_pct < 0)
+
+    @property
+    def regression(self) -> bool:
+        return self.significant and self.change_pct >= self.min_change_pct
+
+    @property
+    def improvement(self) -> bool:
+        return self.significant and self.change_pct <= -self.min_change_pct
+
+
+def mann_whitney_p(baseline: List[float], candidate: List[float]) -> float:
+    """Two-sided Mann-Whitney U p-value, normal approximation with tie and continuity correction.
+
+    The approximation is adequate from about eight samples per side, which
+    the default repetitions exceed.
+    """
+    n1, n2 = len(baseline), len(candidate)
+    combined = np.concatenate([baseline, candidate])
+    _, inverse, counts = np.unique(combined, return_inverse=True, return_counts=True)
+    # Average rank of each distinct value, so tied samples share their rank.
+    upper = np.cumsum(counts)
+    ranks = (upper - (counts - 1) / 2)[inverse]
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    ties = float(np.sum(counts ** 3 - counts))
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = max(abs(u - n1 * n2 / 2) - 0.5, 0.0) / math.sqrt(variance)
+    return math.erfc(z / math.sqrt(2))
+
+
+def bootstrap_change_ci(
+    baseline: List[float],
+    candidate: List[float],
+    confidence: float = 0.95,
+    resamples: int = DEFAULT_BOOTSTRAP_RESAMPLES,
+    rng: Optional[np.random.Generator] = None,
+):
+    """Percentile bootstrap interval, in percent, for the change of the median from ``baseline`` to ``candidate``."""
+    if rng is None:
+        rng = np.random.default_rng(0)
+    base = np.median(rng.choice(baseline, size=(resamples, len(baseline))), axis=1)
+    cand = np.median(rng.choice(candidate, size=(resamples, len(candidate))), axis=1)
+    changes = (cand / base - 1) * 100
+    tail = (1 - confidence) / 2 * 100
+    return float(np.percentile(changes, tail)), float(np.percentile(changes, 100 - tail))
+
+
+def compare_reports(
+    baseline: Dict,
+    candidate: Dict,
+    alpha: float = DEFAULT_ALPHA,
+    min_change_pct: float = DEFAULT_MIN_CHANGE_PCT,
+) -> List[ScenarioComparison]:
+    """Compare the latency samples of every scenario present in both reports."""
+    comparisons = []
+    for name, cand in candidate["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        base_p50 = float(np.median(base["samples_sec"]))
+        cand_p50 = float(np.median(cand["samples_sec"]))
+        low, high = bootstrap_change_ci(base["samples_sec"], cand["samples_sec"], confidence=1 - alpha)
+        comparisons.append(ScenarioComparison(
+            name=name,
+            baseline_p50_sec=base_p50,
+            candidate_p50_sec=cand_p50,
+            change_pct=(cand_p50 / base_p50 - 1) * 100 if base_p50 > 0 else 0.0,
+            ci_low_pct=low,
+            ci_high_pct=high,
+            p_value=mann_whitney_p(base["samples_sec"], cand["samples_sec"]),
+            alpha=alpha,
+            min_change_pct=min_change_pct,
+        ))
+    return comparisons
+
+
+def environment_differences(baseline: Dict, candidate: Dict) -> List[str]:
+    """Names of environment and config fields that differ; such runs are not like for like."""
+    fields = ("backend", "hostname", "database_version", "cpu_count", "python", "settings")
+    differences = [name for name in fields if baseline["environment"].get(name) != candidate["environment"].get(name)]
+    if baseline.get("config") != candidate.get("config"):
+        differences.append("config")
+    return differences
@@ -0,0 +1,156 @@
+"""
+基准测试比较 - 比较 benchmark_suite.py 输出的两次或多次运行，逐场景给出中位延迟的变化、
+bootstrap 置信区间与 Mann-Whitney U 检验的 p 值，发现统计显著的性能退化时以非零退出码结束，
+并绘制多次运行的趋势图，以便在部署前发现性能变化。
+
+默认把最新一次运行与同一后端的上一次运行比较；--baseline first 则与同一后端最早的一次比较。
+退化的判定：p < ALPHA、置信区间不含 0，且中位延迟变慢至少 MIN_CHANGE_PCT%。
+
+用法：
+    python benchmark_compare.py                              # benchmark_results/ 中的全部运行
+    python benchmark_compare.py old.json new.json            # 指定运行（文件或目录）
+    python benchmark_compare.py benchmark_results --baseline first
+
+退出码：0 无退化；1 有统计显著的退化；2 可比较的运行不足两次。
+"""
+import argparse
+import glob
+import os
+import sys
+
+from benchmark import DEFAULT_ALPHA, DEFAULT_MIN_CHANGE_PCT, compare_reports, environment_differences, load_report
+
+# --- 配置 --- #
+RESULTS_DIRECTORY = "benchmark_results"
+TREND_CHART_FILE = "benchmark_trends.png"
+# --- END 配置 --- #
+
+
+def load_runs(paths):
+    """读取文件或目录中的全部报告，按生成时间排序"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.json"))))
+        else:
+            files.append(path)
+    runs = [(path, load_report(path)) for path in files]
+    return sorted(runs, key=lambda run: run[1]["created_at"])
+
+
+def run_label(report):
+    commit = (report["environment"].get("git_commit") or "")[:7]
+    return f"{report['created_at'][:16].replace('T', ' ')} {commit}".strip()
+
+
+def plot_trends(runs, path=TREND_CHART_FILE, alpha=DEFAULT_ALPHA, min_change_pct=DEFAULT_MIN_CHANGE_PCT):
+    """每个场景一幅图：各后端的 p50 延迟折线与 p50–p95 区间，红圈标出相对上一次运行的退化"""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("  ✗ 未安装 matplotlib，跳过趋势图")
+        return None
+
+    matplotlib.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'SimHei', 'DejaVu Sans']
+    matplotlib.rcParams['axes.unicode_minus'] = False
+
+    scenarios = []
+    for _, report in runs:
+        scenarios.extend(name for name in report["scenarios"] if name not in scenarios)
+    backends = sorted({report["environment"]["backend"] for _, report in runs})
+    fig, axes = plt.subplots(len(scenarios), 1, figsize=(max(8, len(runs) * 0.9), 3.2 * len(scenarios)), squeeze=False)
+    fig.suptitle('Benchmark Trends (median latency, p50–p95 band)', fontsize=14, fontweight='bold')
+    labels = [run_label(report) for _, report in runs]
+
+    for ax, scenario in zip(axes[:, 0], scenarios):
+        for backend in backends:
+            points = [
+                (index, report) for index, (_, report) in enumerate(runs)
+                if report["environment"]["backend"] == backend and scenario in report["scenarios"]
+            ]
+            if not points:
+                continue
+            x = [index for index, _ in points]
+            p50 = [report["scenarios"][scenario]["latency_sec"]["p50"] * 1000 for _, report in points]
+            p95 = [report["scenarios"][scenario]["latency_sec"]["p95"] * 1000 for _, report in points]
+            line, = ax.plot(x, p50, marker='o', linewidth=2, label=backend)
+            ax.fill_between(x, p50, p95, color=line.get_color(), alpha=0.15)
+            for (index, report), (_, previous) in zip(points[1:], points[:-1]):
+                comparison = compare_reports(
+                    {"scenarios": {scenario: previous["scenarios"][scenario]}},
+                    {"scenarios": {scenario: report["scenarios"][scenario]}},
+                    alpha=alpha,
+                    min_change_pct=min_change_pct,
+                )[0]
+                if comparison.regression:
+                    ax.plot(index, comparison.candidate_p50_sec * 1000, 'o', color='red', markersize=11, fillstyle='none')
+        ax.set_title(scenario, fontweight='bold')
+        ax.set_ylabel('Latency (ms)', fontweight='bold')
+        ax.set_xticks(range(len(runs)))
+        ax.set_xticklabels(labels, rotation=30, ha='right', fontsize=8)
+        ax.grid(True, alpha=0.3)
+        ax.legend(fontsize=8)
+
+    plt.tight_layout(rect=(0, 0, 1, 0.98))
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    print(f"✓ 趋势图已保存: {path}")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比较基准测试结果并检测性能退化")
+    parser.add_argument("paths", nargs="*", default=[RESULTS_DIRECTORY], help="报告文件或目录")
+    parser.add_argument("--baseline", choices=["previous", "first"], default="previous")
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA)
+    parser.add_argument("--min-change", type=float, default=DEFAULT_MIN_CHANGE_PCT, help="判定退化的最小变化（%%）")
+    parser.add_argument("--chart", default=TREND_CHART_FILE, help="趋势图文件；为空则不绘制")
+    args = parser.parse_args(argv)
+
+    runs = load_runs(args.paths)
+    if not runs:
+        print("✗ 没有找到基准测试结果")
+        return 2
+    candidate_path, candidate = runs[-1]
+    backend = candidate["environment"]["backend"]
+    earlier = [run for run in runs[:-1] if run[1]["environment"]["backend"] == backend]
+    if not earlier:
+        print(f"✗ 只有 1 次 {backend} 后端的运行，无法比较")
+        return 2
+    baseline_path, baseline = earlier[-1] if args.baseline == "previous" else earlier[0]
+
+    print("=" * 90)
+    print(f"基准测试比较 ({backend} 后端, 共 {len(runs)} 次运行)")
+    print("=" * 90)
+    print(f"  基准: {baseline_path} ({run_label(baseline)})")
+    print(f"  候选: {candidate_path} ({run_label(candidate)})")
+    differences = environment_differences(baseline, candidate)
+    if differences:
+        print(f"  ⚠ 两次运行的环境或配置不同: {', '.join(differences)}，结果可能不可比")
+
+    comparisons = compare_reports(baseline, candidate, alpha=args.alpha, min_change_pct=args.min_change)
+    confidence = (1 - args.alpha) * 100
+    print(f"\n{'场景':<16} {'基准 p50':>10} {'候选 p50':>10} {'变化':>8} {f'{confidence:.0f}% 置信区间':>20} {'p 值':>8}")
+    for comparison in comparisons:
+        verdict = "✗ 退化" if comparison.regression else "✓ 改进" if comparison.improvement else ""
+        print(f"{comparison.name:<16} {comparison.baseline_p50_sec * 1000:>8.1f}ms {comparison.candidate_p50_sec * 1000:>8.1f}ms "
+              f"{comparison.change_pct:>+7.1f}% [{comparison.ci_low_pct:>+7.1f}%, {comparison.ci_high_pct:>+7.1f}%] "
+              f"{comparison.p_value:>8.4f}  {verdict}")
+
+    if args.chart and len(runs) >= 2:
+        print()
+        plot_trends(runs, args.chart, alpha=args.alpha, min_change_pct=args.min_change)
+
+    regressions = [comparison.name for comparison in comparisons if comparison.regression]
+    print()
+    if regressions:
+        print(f"✗ 统计显著的性能退化: {', '.join(regressions)}")
+        return 1
+    print("✓ 没有统计显著的性能退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
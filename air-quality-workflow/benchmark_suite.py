@@ -0,0 +1,199 @@
+"""
+基准测试套件 - 对数据生成、写入、变更收集、汇总计算与端到端工作流分别计时，
+每个场景先预热 WARMUP 次（不计时），再重复 REPETITIONS 次，用 time.perf_counter 计时，
+输出 p50/p95/p99 延迟与吞吐量（条/秒），结果连同环境信息（后端、数据库版本、git 提交、
+机器与相关配置）写入 JSON，便于不同运行之间比较。
+
+场景：
+- generate:        WorkloadGenerator 生成一批读数（纯 CPU）
+- write:           write_readings 写入一批并提交
+- collect_changes: 按 Change Tracking 版本范围读取一批新写入的变更（与 ProcessAirQualitySummary 相同的查询）
+- aggregate:       已取回的读数按测站与时间窗口累加（纯 CPU）
+- end_to_end:      GenerateAirQualityData 与 ProcessAirQualitySummary 各运行一次
+
+写入类场景使用 station-{BENCHMARK_STATION_OFFSET + 1} 起的专用测站，结束后只删除这些测站的读数，
+不清空数据库；end_to_end 与定时函数一样写入 station-1 起的测站并推进汇总进度。
+end_to_end 计时前先删除专用测站的读数，再不计时地运行一次汇总处理清空积压：
+基准数据不会进入汇总表，计时也不包含之前积压的变更。
+本地 SQLite 与 Azure SQL 均可运行（由 SQL_BACKEND 决定）。
+
+用法：
+    python benchmark_suite.py                    # 全部场景
+    python benchmark_suite.py write,aggregate    # 指定场景
+"""
+import asyncio
+import datetime
+import json
+import os
+import sqlite3
+import sys
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+from azure_sql import get_backend, get_sql_connection
+from benchmark import Scenario, environment_metadata, run_scenario, write_report
+from bulk_insert import write_readings
+from GenerateAirQualityData import main as generate_main
+from ProcessAirQualitySummary import _collect_changes, _read_versions, _window_sizes, process_changes
+from summary_aggregator import base_bucket_seconds, consume_changes, rollup_windows
+from workload_profiles import WorkloadGenerator, get_profile
+
+# --- 配置 --- #
+BATCH_SIZE = int(os.getenv("BENCHMARK_BATCH_SIZE", "5000"))
+STATION_COUNT = int(os.getenv("BENCHMARK_STATION_COUNT", "50"))
+WARMUP = int(os.getenv("BENCHMARK_WARMUP", "2"))
+REPETITIONS = int(os.getenv("BENCHMARK_REPETITIONS", "20"))
+WORKLOAD_PROFILE = os.getenv("WORKLOAD_PROFILE", "sampled")
+BULK_INSERT_STRATEGY = os.getenv("BULK_INSERT_STRATEGY", "auto")
+BENCHMARK_STATION_OFFSET = 900000
+END_TO_END_BATCH_SIZE = int(os.getenv("BENCHMARK_END_TO_END_BATCH_SIZE", "200"))
+END_TO_END_STATION_COUNT = 15
+OUTPUT_DIRECTORY = "benchmark_results"
+# --- END 配置 --- #
+
+SCENARIOS = ["generate", "write", "collect_changes", "aggregate", "end_to_end"]
+
+
+class _RowCursor:
+    """把已取回的行交给 consume_changes，只计汇总本身的耗时"""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._position = 0
+
+    def fetchmany(self, size):
+        rows = self._rows[self._position:self._position + size]
+        self._position += size
+        return rows
+
+
+def database_version(conn):
+    if get_backend() == "sqlite":
+        return f"SQLite {sqlite3.sqlite_version}"
+    cur = conn.cursor()
+    cur.execute("SELECT @@VERSION")
+    version = cur.fetchone()[0].splitlines()[0]
+    cur.close()
+    return version
+
+
+def current_version(conn):
+    cur = conn.cursor()
+    version = _read_versions(cur)[0]
+    cur.close()
+    conn.commit()
+    return version
+
+
+def delete_benchmark_rows(conn):
+    stations = [f"station-{BENCHMARK_STATION_OFFSET + n}" for n in range(1, STATION_COUNT + 1)]
+    with conn.cursor() as cur:
+        cur.execute(
+            f"DELETE FROM air_quality_data WHERE station_id IN ({', '.join('?' * len(stations))})",
+            *stations,
+        )
+    conn.commit()
+
+
+def build_scenarios(conn):
+    generator = WorkloadGenerator(get_profile(WORKLOAD_PROFILE), STATION_COUNT, station_offset=BENCHMARK_STATION_OFFSET)
+    window_sizes = _window_sizes()
+    bucket_seconds = base_bucket_seconds(window_sizes)
+
+    def write(batch):
+        write_readings(conn, batch, strategy=BULK_INSERT_STRATEGY)
+        conn.commit()
+        return len(batch)
+
+    def committed_changes():
+        before = current_version(conn)
+        write(generator.next_batch(BATCH_SIZE))
+        return before, current_version(conn)
+
+    def collect(versions):
+        cur = conn.cursor()
+        by_station, _ = _collect_changes(cur, versions[0], versions[1], bucket_seconds=bucket_seconds)
+        cur.close()
+        conn.commit()
+        return sum(acc.count for acc in by_station.values())
+
+    def aggregate(rows):
+        by_station, by_bucket = consume_changes(_RowCursor(rows), bucket_seconds=bucket_seconds)
+        if bucket_seconds:
+            rollup_windows(by_bucket, bucket_seconds, window_sizes)
+        return len(rows)
+
+    def end_to_end(_):
+        asyncio.run(generate_main(None))
+        return process_changes().records
+
+    drained = False
+
+    def end_to_end_setup():
+        nonlocal drained
+        if not drained:
+            # 已删除的读数没有汇总过，处理时直接跳过
+            delete_benchmark_rows(conn)
+            process_changes()
+            drained = True
+        os.environ["BATCH_SIZE"] = str(END_TO_END_BATCH_SIZE)
+        os.environ["STATION_COUNT"] = str(END_TO_END_STATION_COUNT)
+        os.environ["WORKLOAD_PROFILE"] = WORKLOAD_PROFILE
+
+    return {
+        "generate": Scenario("generate", lambda _: len(generator.next_batch(BATCH_SIZE))),
+        "write": Scenario("write", write, setup=lambda: generator.next_batch(BATCH_SIZE)),
+        "collect_changes": Scenario("collect_changes", collect, setup=committed_changes),
+        "aggregate": Scenario("aggregate", aggregate, setup=lambda: generator.next_batch(BATCH_SIZE).rows()),
+        "end_to_end": Scenario("end_to_end", end_to_end, setup=end_to_end_setup),
+    }
+
+
+def main():
+    selected = sys.argv[1].split(",") if len(sys.argv) > 1 else SCENARIOS
+    unknown = [name for name in selected if name not in SCENARIOS]
+    if unknown:
+        print(f"✗ 未知场景: {', '.join(unknown)}；可选: {', '.join(SCENARIOS)}")
+        sys.exit(2)
+
+    backend = get_backend()
+    print("=" * 80)
+    print(f"基准测试套件 ({backend} 后端, 预热 {WARMUP} 次, 重复 {REPETITIONS} 次, 每批 {BATCH_SIZE:,} 条, "
+          f"负载模式 {WORKLOAD_PROFILE})")
+    print("=" * 80)
+
+    conn = get_sql_connection()
+    environment = environment_metadata(backend, database_version(conn))
+    results = []
+    try:
+        scenarios = build_scenarios(conn)
+        print(f"\n{'场景':<16} {'p50':>10} {'p95':>10} {'p99':>10} {'条/秒 p50':>12} {'p95':>12}")
+        for name in selected:
+            result = run_scenario(scenarios[name], WARMUP, REPETITIONS)
+            results.append(result)
+            print(f"{name:<16} {result.latency_percentile(50) * 1000:>8.1f}ms {result.latency_percentile(95) * 1000:>8.1f}ms "
+                  f"{result.latency_percentile(99) * 1000:>8.1f}ms {result.rows_per_sec_percentile(50):>12,.0f} "
+                  f"{result.rows_per_sec_percentile(95):>12,.0f}")
+    finally:
+        delete_benchmark_rows(conn)
+        conn.close()
+
+    config = {
+        "batch_size": BATCH_SIZE,
+        "station_count": STATION_COUNT,
+        "warmup": WARMUP,
+        "repetitions": REPETITIONS,
+        "workload_profile": WORKLOAD_PROFILE,
+        "bulk_insert_strategy": BULK_INSERT_STRATEGY,
+        "end_to_end_batch_size": END_TO_END_BATCH_SIZE,
+        "end_to_end_station_count": END_TO_END_STATION_COUNT,
+    }
+    path = os.path.join(OUTPUT_DIRECTORY, f"{backend}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    write_report(path, results, environment, config)
+    print(f"\n✓ 结果已保存到: {path}")
+
+
+if __name__ == "__main__":
+    main()
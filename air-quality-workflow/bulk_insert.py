@@ -0,0 +1,124 @@
+"""Bulk insert strategies for air_quality_data.
+
+Every strategy writes the same six columns and leaves the commit to the caller,
+so a batch is still a single transaction regardless of how many round trips it
+takes:
+
+- ``executemany``: plain ``cursor.executemany`` (one round trip per row).
+- ``fast_executemany``: pyodbc array-bound parameter sets, sent in chunks.
+- ``tvp``: the whole chunk as one table-valued parameter to
+  ``dbo.usp_insert_air_quality_batch`` (created by ``init_database.py``).
+- ``values``: multi-row ``INSERT ... VALUES`` statements sized to stay under
+  SQL Server's 2100-parameter limit.
+- ``upsert``: the chunk as a table-valued parameter to
+  ``dbo.usp_upsert_air_quality_batch``, which updates readings whose
+  ``(station_id, recorded_at)`` already exists with different values and
+  inserts the rest in two set-based statements. Replaying a chunk that was
+  already written changes nothing, so a failed or timed-out write can be
+  retried blindly; the other strategies fail on the unique natural key.
+- ``auto``: ``values`` when the batch fits in one statement, otherwise
+  ``fast_executemany``.
+"""
+
+import time
+from typing import List, NamedTuple, Sequence, Tuple
+
+COLUMNS = ("station_id", "recorded_at", "pm25", "pm10", "o3", "aqi")
+SQL_SERVER_MAX_PARAMS = 2100
+SQL_SERVER_MAX_VALUES_ROWS = 1000
+MAX_ROWS_PER_VALUES = min((SQL_SERVER_MAX_PARAMS - 1) // len(COLUMNS), SQL_SERVER_MAX_VALUES_ROWS)
+DEFAULT_CHUNK_SIZE = 10000
+STRATEGIES = ("auto", "executemany", "fast_executemany", "tvp", "upsert", "values")
+
+_INSERT_PREFIX = f"INSERT INTO air_quality_data ({', '.join(COLUMNS)}) VALUES "
+_ROW_PLACEHOLDER = "(" + ", ".join("?" * len(COLUMNS)) + ")"
+_TVP_PROCEDURE = "{CALL dbo.usp_insert_air_quality_batch (?)}"
+_UPSERT_PROCEDURE = "{CALL dbo.usp_upsert_air_quality_batch (?)}"
+
+
+class BulkWriteResult(NamedTuple):
+    strategy: str
+    rows: int
+    round_trips: int
+    duration_sec: float
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.duration_sec if self.duration_sec > 0 else 0.0
+
+
+def _chunks(rows: Sequence[Tuple], size: int):
+    for offset in range(0, len(rows), size):
+        yield rows[offset:offset + size]
+
+
+def _resolve_strategy(strategy: str, row_count: int, chunk_size: int) -> str:
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown bulk insert strategy {strategy!r}; expected one of {STRATEGIES}")
+    if strategy != "auto":
+        return strategy
+    if row_count <= min(chunk_size, MAX_ROWS_PER_VALUES):
+        return "values"
+    return "fast_executemany"
+
+
+def _insert_executemany(cursor, rows, chunk_size, fast):
+    cursor.fast_executemany = fast
+    query = _INSERT_PREFIX + _ROW_PLACEHOLDER
+    round_trips = 0
+    for chunk in _chunks(rows, chunk_size):
+        cursor.executemany(query, chunk)
+        # Without fast_executemany the driver sends one request per row.
+        round_trips += 1 if fast else len(chunk)
+    return round_trips
+
+
+def _insert_tvp(cursor, rows, chunk_size, procedure=_TVP_PROCEDURE):
+    round_trips = 0
+    for chunk in _chunks(rows, chunk_size):
+        cursor.execute(procedure, (list(chunk),))
+        round_trips += 1
+    return round_trips
+
+
+def _insert_values(cursor, rows, chunk_size):
+    rows_per_statement = max(1, min(chunk_size, MAX_ROWS_PER_VALUES))
+    full_statement = _INSERT_PREFIX + ", ".join([_ROW_PLACEHOLDER] * rows_per_statement)
+    round_trips = 0
+    for chunk in _chunks(rows, rows_per_statement):
+        if len(chunk) == rows_per_statement:
+            query = full_statement
+        else:
+            query = _INSERT_PREFIX + ", ".join([_ROW_PLACEHOLDER] * len(chunk))
+        params: List = []
+        for row in chunk:
+            params.extend(row)
+        cursor.execute(query, params)
+        round_trips += 1
+    return round_trips
+
+
+def write_readings(conn, rows: Sequence[Tuple], strategy: str = "auto", chunk_size: int = DEFAULT_CHUNK_SIZE) -> BulkWriteResult:
+    """Insert ``rows`` of ``COLUMNS`` tuples on ``conn`` without committing."""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    resolved = _resolve_strategy(strategy, len(rows), chunk_size)
+    start = time.perf_counter()
+    round_trips = 0
+    if rows:
+        # Not ``with conn.cursor()``: pyodbc commits when that block exits.
+        cursor = conn.cursor()
+        try:
+            if resolved == "executemany":
+                round_trips = _insert_executemany(cursor, rows, chunk_size, fast=False)
+            elif resolved == "fast_executemany":
+                round_trips = _insert_executemany(cursor, rows, chunk_size, fast=True)
+            elif resolved == "tvp":
+                round_trips = _insert_tvp(cursor, rows, chunk_size)
+            elif resolved == "upsert":
+                round_trips = _insert_tvp(cursor, rows, chunk_size, procedure=_UPSERT_PROCEDURE)
+            else:
+                round_trips = _insert_values(cursor, rows, chunk_size)
+        finally:
+            cursor.close()
+    return BulkWriteResult(resolved, len(rows), round_trips, time.perf_counter() - start)
@@ -0,0 +1,111 @@
+"""
+批量写入性能测试 - 比较不同 bulk insert 策略在不同 BATCH_SIZE 下的吞吐量（记录/秒）
+"""
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+from GenerateAirQualityData import _generate_readings
+from azure_sql import get_sql_connection
+from bulk_insert import DEFAULT_CHUNK_SIZE, write_readings
+
+# --- 配置 --- #
+BATCH_SIZES = [20, 200, 1000, 10000, 100000]
+STRATEGIES = ["executemany", "fast_executemany", "tvp", "values"]
+STATION_COUNT = 15
+CHUNK_SIZE = int(os.getenv("BULK_INSERT_CHUNK_SIZE", str(DEFAULT_CHUNK_SIZE)))
+# 逐行往返的策略在大批量下耗时数小时，超过该行数时跳过
+MAX_ROWS = {"executemany": 1000}
+OUTPUT_FILE = "bulk_insert_results.csv"
+# --- END 配置 --- #
+
+
+def clear_data(conn):
+    """清空原始数据表，保证每次测试从相同状态开始"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM air_quality_data")
+    conn.commit()
+
+
+def run_single(conn, strategy, batch_size):
+    readings = _generate_readings(batch_size, STATION_COUNT)
+    start = time.perf_counter()
+    result = write_readings(conn, readings, strategy=strategy, chunk_size=CHUNK_SIZE)
+    conn.commit()
+    duration = time.perf_counter() - start
+    return {
+        'strategy': result.strategy,
+        'batch_size': batch_size,
+        'chunk_size': CHUNK_SIZE,
+        'round_trips': result.round_trips,
+        'write_sec': result.duration_sec,
+        'write_and_commit_sec': duration,
+        'rows_per_sec': batch_size / duration if duration > 0 else 0,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def main():
+    print("=" * 80)
+    print("批量写入性能测试")
+    print("=" * 80)
+    print(f"\n批次大小: {BATCH_SIZES}")
+    print(f"写入策略: {STRATEGIES}")
+    print(f"CHUNK_SIZE: {CHUNK_SIZE}")
+
+    conn = get_sql_connection()
+    results = []
+    try:
+        for strategy in STRATEGIES:
+            print(f"\n{'=' * 80}")
+            print(f"策略: {strategy}")
+            print(f"{'=' * 80}")
+            for batch_size in BATCH_SIZES:
+                if batch_size > MAX_ROWS.get(strategy, batch_size):
+                    print(f"  BATCH_SIZE={batch_size:<8} 跳过（超过 {MAX_ROWS[strategy]} 行上限）")
+                    continue
+                clear_data(conn)
+                try:
+                    result = run_single(conn, strategy, batch_size)
+                except Exception as e:
+                    conn.rollback()
+                    print(f"  BATCH_SIZE={batch_size:<8} ✗ 错误: {e}")
+                    continue
+                results.append(result)
+                print(
+                    f"  BATCH_SIZE={batch_size:<8} {result['write_and_commit_sec']:>9.3f}s "
+                    f"{result['rows_per_sec']:>12.1f} 记录/秒 ({result['round_trips']} 次往返)"
+                )
+        clear_data(conn)
+    finally:
+        conn.close()
+
+    if not results:
+        print("\n没有结果可保存")
+        sys.exit(1)
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+
+    print("\n" + "=" * 80)
+    print(f"{'策略':<20} " + " ".join(f"{bs:>10}" for bs in BATCH_SIZES))
+    print("-" * 80)
+    for strategy in STRATEGIES:
+        by_size = {r['batch_size']: r['rows_per_sec'] for r in results if r['strategy'] == strategy}
+        print(f"{strategy:<20} " + " ".join(
+            f"{by_size[bs]:>10.0f}" if bs in by_size else f"{'-':>10}" for bs in BATCH_SIZES
+        ))
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 """
 累积性能测试 - 数据不断增长，测试系统在大数据量下的性能
 模拟真实的 IoT 场景：数据持续产生，系统持续处理
+
+负载模式（workload_profiles.py）通过命令行参数或 WORKLOAD_PROFILE 选择，例如：
+    python cumulative_performance_test.py realistic
 """
+import asyncio
 import json
 import os
+import sys
 import time
 from datetime import datetime
 from unittest.mock import Mock
@@ -15,6 +20,11 @@ os.environ.update(cfg["Values"])
 from GenerateAirQualityData import main as generate_main
 from ProcessAirQualitySummary import main as process_main
 from azure_sql import get_sql_connection
+from workload_profiles import get_profile
+
+# --- 配置 --- #
+WORKLOAD_PROFILE = sys.argv[1] if len(sys.argv) > 1 else os.getenv("WORKLOAD_PROFILE", "uniform")
+# --- END 配置 --- #
 
 
 def get_database_stats():
@@ -48,7 +58,7 @@ def run_workflow_cycle(batch_size, station_count):
 
     # 1. 生成数据
     gen_start = time.time()
-    generate_main(mock_timer)
+    asyncio.run(generate_main(mock_timer))
     gen_duration = time.time() - gen_start
 
     # 短暂延迟
@@ -70,10 +80,14 @@ def run_workflow_cycle(batch_size, station_count):
 
 
 def main():
+    get_profile(WORKLOAD_PROFILE)
+    os.environ["WORKLOAD_PROFILE"] = WORKLOAD_PROFILE
+
     print("=" * 80)
     print("累积性能测试 - 模拟真实 IoT 数据增长场景")
     print("=" * 80)
     print(f"\n开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"负载模式: {WORKLOAD_PROFILE}")
 
     # 获取初始状态
     data_count, summary_count, sync_version, ct_version = get_database_stats()
@@ -121,6 +135,7 @@ def main():
             # 记录结果
             result_record = {
                 'cycle': cycle_number,
+                'workload_profile': WORKLOAD_PROFILE,
                 'batch_size': batch_size,
                 'station_count': station_count,
                 'gen_duration': result['gen_duration'],
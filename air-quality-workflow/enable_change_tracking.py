@@ -3,7 +3,7 @@ import json
 import os
 import sys
 
-from azure_sql import get_sql_connection
+from azure_sql import get_backend, get_sql_connection
 
 
 def main():
@@ -16,6 +16,10 @@ def main():
     print("=" * 70)
     print()
 
+    if get_backend() == "sqlite":
+        print("本地 SQLite 后端通过触发器模拟 Change Tracking，无需额外配置。")
+        return
+
     try:
         # 1. 启用数据库级别的 Change Tracking
         print("【1/2】启用数据库级别 Change Tracking")
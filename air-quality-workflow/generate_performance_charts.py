@@ -1,7 +1,10 @@
 """
 生成性能分析图表
-基于真实的性能测试数据生成可视化图表
+基于真实的性能测试数据生成可视化图表；benchmark_results/ 中有两次及以上基准测试运行时，
+同时生成趋势图（benchmark_compare.py）
 """
+import os
+
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib
@@ -174,3 +177,11 @@ print("\n✓✓✓ 所有图表生成完成！")
 print("\n生成的文件:")
 print("  - performance_charts.png (性能概览图表)")
 print("  - scalability_analysis.png (可扩展性分析)")
+
+# 基准测试趋势图
+from benchmark_compare import RESULTS_DIRECTORY, TREND_CHART_FILE, load_runs, plot_trends
+
+benchmark_runs = load_runs([RESULTS_DIRECTORY]) if os.path.isdir(RESULTS_DIRECTORY) else []
+if len(benchmark_runs) >= 2:
+    plot_trends(benchmark_runs, TREND_CHART_FILE)
+    print(f"  - {TREND_CHART_FILE} (基准测试趋势)")
@@ -1,9 +1,38 @@
 """初始化 Azure SQL 数据库结构和 Change Tracking"""
+import datetime
 import json
 import os
 import sys
 
-from azure_sql import get_sql_connection
+from azure_sql import get_backend, get_sql_connection
+from retention import DEFAULT_DAYS_AHEAD, DEFAULT_RETENTION_DAYS, PARTITION_FUNCTION, PARTITION_SCHEME, daily_boundaries
+
+KEY_DEFAULTS = {"sequential": "NEWSEQUENTIALID()", "random": "NEWID()"}
+
+# 幂等写入（bulk_insert.py 的 upsert 策略）：已存在且值不同的读数更新，其余插入；
+# UPDLOCK + HOLDLOCK 锁住查到的键范围，并行重放同一批次时不会撞上唯一索引
+UPSERT_PROCEDURE_SQL = """
+CREATE OR ALTER PROCEDURE dbo.usp_upsert_air_quality_batch
+    @rows dbo.AirQualityReadingType READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    UPDATE d
+    SET pm25 = s.pm25, pm10 = s.pm10, o3 = s.o3, aqi = s.aqi
+    FROM air_quality_data AS d WITH (UPDLOCK, HOLDLOCK)
+    JOIN @rows AS s ON s.station_id = d.station_id AND s.recorded_at = d.recorded_at
+    WHERE EXISTS (SELECT d.pm25, d.pm10, d.o3, d.aqi EXCEPT SELECT s.pm25, s.pm10, s.o3, s.aqi);
+
+    INSERT INTO air_quality_data (station_id, recorded_at, pm25, pm10, o3, aqi)
+    SELECT s.station_id, s.recorded_at, s.pm25, s.pm10, s.o3, s.aqi
+    FROM @rows AS s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM air_quality_data AS d WITH (UPDLOCK, HOLDLOCK)
+        WHERE d.station_id = s.station_id AND d.recorded_at = s.recorded_at
+    );
+END
+"""
 
 
 def execute_sql(cursor, sql, description):
@@ -18,6 +47,45 @@ def execute_sql(cursor, sql, description):
         return False
 
 
+def create_daily_partitions(cursor):
+    """按天的分区函数/方案：覆盖保留期内的每一天，再预留 DEFAULT_DAYS_AHEAD 天"""
+    today = datetime.datetime.utcnow().date()
+    days = daily_boundaries(
+        today - datetime.timedelta(days=DEFAULT_RETENTION_DAYS), today + datetime.timedelta(days=DEFAULT_DAYS_AHEAD)
+    )
+    values = ", ".join(f"'{day:%Y-%m-%d}'" for day in days)
+    execute_sql(
+        cursor,
+        f"CREATE PARTITION FUNCTION {PARTITION_FUNCTION} (DATETIME2) AS RANGE RIGHT FOR VALUES ({values})",
+        f"创建按天分区函数（{len(days)} 个边界）"
+    )
+    execute_sql(
+        cursor,
+        f"CREATE PARTITION SCHEME {PARTITION_SCHEME} AS PARTITION {PARTITION_FUNCTION} ALL TO ([PRIMARY])",
+        "创建分区方案"
+    )
+
+
+def init_sqlite():
+    """本地 SQLite 后端：连接时自动建表并安装 Change Tracking 模拟触发器"""
+    print(f"使用本地 SQLite 后端: {os.getenv('SQLITE_DATABASE_PATH', 'air_quality_local.db')}")
+    conn = get_sql_connection()
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sys.tables ORDER BY name")
+        tables = [row[0] for row in cursor.fetchall()]
+        print(f"\n已创建的表 ({len(tables)} 个):")
+        for table in tables:
+            print(f"  ✓ {table}")
+
+        cursor.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()")
+        print(f"当前 Change Tracking 版本: {cursor.fetchone()[0]}")
+    conn.close()
+
+    print("\n" + "=" * 70)
+    print("✓✓✓ 数据库初始化完成！✓✓✓")
+    print("=" * 70)
+
+
 def main():
     # 加载配置
     cfg = json.load(open("local.settings.json", encoding="utf-8"))
@@ -28,9 +96,13 @@ def main():
     print("=" * 70)
     print()
 
+    if get_backend() == "sqlite":
+        init_sqlite()
+        return
+
     try:
         # 1. 启用数据库级别的 Change Tracking (需要单独连接，不能在事务中)
-        print("【1/5】启用数据库 Change Tracking")
+        print("【1/14】启用数据库 Change Tracking")
         conn = get_sql_connection()
         conn.autocommit = True  # ALTER DATABASE 必须在 autocommit 模式下
         with conn.cursor() as cursor:
@@ -52,26 +124,87 @@ def main():
         with conn.cursor() as cursor:
 
             # 2. 创建主数据表 air_quality_data
-            print("\n【2/5】创建 air_quality_data 表")
+            # sequential: NEWSEQUENTIALID() 递增聚集键，插入总是追加到索引末尾
+            # random: 原来的 NEWID() 随机聚集键（仅用于对比测试）
+            layout = os.getenv("AIR_QUALITY_KEY_LAYOUT", "sequential")
+            # daily: 按 recorded_at 按天分区，过期数据的清理只触及最旧的分区
+            partitioning = os.getenv("AIR_QUALITY_PARTITIONING", "none")
+            print(f"\n【2/14】创建 air_quality_data 表（{layout} 主键，分区: {partitioning}）")
+            if partitioning == "daily":
+                create_daily_partitions(cursor)
+                # 分区表按 recorded_at 聚集；主键 id 保持不分区，Change Tracking 仍以 id 为键
+                execute_sql(
+                    cursor,
+                    f"""
+                    CREATE TABLE air_quality_data (
+                        id UNIQUEIDENTIFIER NOT NULL
+                            CONSTRAINT PK_air_quality_data PRIMARY KEY NONCLUSTERED ON [PRIMARY]
+                            CONSTRAINT DF_air_quality_data_id DEFAULT {KEY_DEFAULTS[layout]},
+                        station_id NVARCHAR(50),
+                        recorded_at DATETIME2,
+                        pm25 FLOAT,
+                        pm10 FLOAT,
+                        o3 FLOAT,
+                        aqi INT
+                    )
+                    """,
+                    "创建空气质量数据表"
+                )
+                execute_sql(
+                    cursor,
+                    f"""
+                    CREATE CLUSTERED INDEX CX_air_quality_data_recorded_at
+                    ON air_quality_data (recorded_at)
+                    ON {PARTITION_SCHEME} (recorded_at)
+                    """,
+                    "按天分区的 recorded_at 聚集索引"
+                )
+                # 批量删除的锁最多升级到分区级，不会锁住正在写入的当天分区
+                execute_sql(
+                    cursor,
+                    "ALTER TABLE air_quality_data SET (LOCK_ESCALATION = AUTO)",
+                    "锁升级限制在分区级"
+                )
+            else:
+                execute_sql(
+                    cursor,
+                    f"""
+                    CREATE TABLE air_quality_data (
+                        id UNIQUEIDENTIFIER NOT NULL
+                            CONSTRAINT PK_air_quality_data PRIMARY KEY CLUSTERED
+                            CONSTRAINT DF_air_quality_data_id DEFAULT {KEY_DEFAULTS[layout]},
+                        station_id NVARCHAR(50),
+                        recorded_at DATETIME2,
+                        pm25 FLOAT,
+                        pm10 FLOAT,
+                        o3 FLOAT,
+                        aqi INT
+                    )
+                    """,
+                    "创建空气质量数据表"
+                )
+                execute_sql(
+                    cursor,
+                    """
+                    CREATE INDEX IX_air_quality_data_recorded_at
+                    ON air_quality_data (recorded_at)
+                    """,
+                    "创建 recorded_at 索引（恢复时按时间分区扫描）"
+                )
+            # (station_id, recorded_at) 是读数的自然键：唯一索引让重放的批次不会重复写入
             execute_sql(
                 cursor,
                 """
-                CREATE TABLE air_quality_data (
-                    id UNIQUEIDENTIFIER PRIMARY KEY DEFAULT NEWID(),
-                    station_id NVARCHAR(50),
-                    recorded_at DATETIME2,
-                    pm25 FLOAT,
-                    pm10 FLOAT,
-                    o3 FLOAT,
-                    aqi INT
-                )
+                CREATE UNIQUE INDEX IX_air_quality_data_station_time
+                ON air_quality_data (station_id, recorded_at)
+                INCLUDE (pm25, pm10, o3, aqi)
                 """,
-                "创建空气质量数据表"
+                "创建 (station_id, recorded_at) 唯一覆盖索引"
             )
             conn.commit()
 
             # 3. 创建汇总表 air_quality_summary
-            print("\n【3/5】创建 air_quality_summary 表")
+            print("\n【3/14】创建 air_quality_summary 表")
             execute_sql(
                 cursor,
                 """
@@ -90,13 +223,15 @@ def main():
             conn.commit()
 
             # 4. 创建同步状态表 air_quality_sync_state
-            print("\n【4/5】创建 air_quality_sync_state 表")
+            print("\n【4/14】创建 air_quality_sync_state 表")
             execute_sql(
                 cursor,
                 """
                 CREATE TABLE air_quality_sync_state (
                     id INT PRIMARY KEY CHECK (id = 1),
-                    last_version BIGINT
+                    last_version BIGINT,
+                    lease_owner NVARCHAR(64) NULL,
+                    lease_expires_at DATETIME2 NULL
                 )
                 """,
                 "创建同步状态表"
@@ -109,7 +244,7 @@ def main():
             conn.commit()
 
             # 5. 在 air_quality_data 表上启用 Change Tracking
-            print("\n【5/5】启用表级别 Change Tracking")
+            print("\n【5/14】启用表级别 Change Tracking")
             execute_sql(
                 cursor,
                 """
@@ -121,6 +256,227 @@ def main():
             )
             conn.commit()
 
+            # 6. 创建批量写入使用的表值参数类型和存储过程（bulk_insert.py 的 tvp 策略）
+            print("\n【6/14】创建批量写入 TVP 类型与存储过程")
+            execute_sql(
+                cursor,
+                """
+                CREATE TYPE dbo.AirQualityReadingType AS TABLE (
+                    station_id NVARCHAR(50),
+                    recorded_at DATETIME2,
+                    pm25 FLOAT,
+                    pm10 FLOAT,
+                    o3 FLOAT,
+                    aqi INT
+                )
+                """,
+                "创建表值参数类型 AirQualityReadingType"
+            )
+            execute_sql(
+                cursor,
+                """
+                CREATE PROCEDURE dbo.usp_insert_air_quality_batch
+                    @rows dbo.AirQualityReadingType READONLY
+                AS
+                BEGIN
+                    SET NOCOUNT ON;
+                    INSERT INTO air_quality_data (station_id, recorded_at, pm25, pm10, o3, aqi)
+                    SELECT station_id, recorded_at, pm25, pm10, o3, aqi FROM @rows;
+                END
+                """,
+                "创建批量插入存储过程 usp_insert_air_quality_batch"
+            )
+            execute_sql(cursor, UPSERT_PROCEDURE_SQL, "创建幂等写入存储过程 usp_upsert_air_quality_batch")
+            conn.commit()
+
+            # 7. 创建分站汇总表：按 (station_id, window_end) 聚集，按站点查询走索引查找
+            print("\n【7/14】创建 air_quality_station_summary 表")
+            execute_sql(
+                cursor,
+                """
+                CREATE TABLE air_quality_station_summary (
+                    id UNIQUEIDENTIFIER NOT NULL DEFAULT NEWID()
+                        CONSTRAINT PK_air_quality_station_summary PRIMARY KEY NONCLUSTERED,
+                    station_id NVARCHAR(50) NOT NULL,
+                    sync_version BIGINT NOT NULL,
+                    window_start DATETIME2,
+                    window_end DATETIME2,
+                    avg_aqi FLOAT,
+                    max_pm25 FLOAT,
+                    min_o3 FLOAT,
+                    record_count INT
+                )
+                """,
+                "创建分站汇总表"
+            )
+            execute_sql(
+                cursor,
+                """
+                CREATE CLUSTERED INDEX IX_station_summary_station_window
+                ON air_quality_station_summary (station_id, window_end)
+                """,
+                "创建 (station_id, window_end) 聚集索引"
+            )
+            execute_sql(
+                cursor,
+                """
+                CREATE INDEX IX_station_summary_sync_version
+                ON air_quality_station_summary (sync_version)
+                """,
+                "创建 sync_version 索引"
+            )
+            conn.commit()
+
+            # 步骤 8: 按 recorded_at 划分的固定时间窗口汇总表
+            print("\n【8/14】创建 air_quality_window_summary 表")
+            execute_sql(
+                cursor,
+                """
+                CREATE TABLE air_quality_window_summary (
+                    window_seconds INT NOT NULL,
+                    window_start DATETIME2 NOT NULL,
+                    window_end DATETIME2 NOT NULL,
+                    record_count INT NOT NULL,
+                    sum_aqi FLOAT NOT NULL,
+                    sum_sq_aqi FLOAT NOT NULL,
+                    avg_aqi FLOAT,
+                    max_pm25 FLOAT,
+                    min_o3 FLOAT,
+                    updated_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME(),
+                    CONSTRAINT PK_air_quality_window_summary PRIMARY KEY CLUSTERED (window_seconds, window_start)
+                )
+                """,
+                "创建时间窗口汇总表"
+            )
+            conn.commit()
+
+            # 步骤 9: 记录每行已计入汇总的值，用于更新/删除时做增量修正
+            print("\n【9/14】创建 air_quality_contribution 表")
+            execute_sql(
+                cursor,
+                """
+                CREATE TABLE air_quality_contribution (
+                    row_id UNIQUEIDENTIFIER NOT NULL CONSTRAINT PK_air_quality_contribution PRIMARY KEY,
+                    row_version BIGINT NOT NULL,
+                    station_id NVARCHAR(50),
+                    recorded_at DATETIME2,
+                    pm25 FLOAT,
+                    o3 FLOAT,
+                    aqi INT
+                )
+                """,
+                "创建汇总贡献表"
+            )
+            execute_sql(
+                cursor,
+                """
+                CREATE INDEX IX_contribution_recorded_at
+                ON air_quality_contribution (recorded_at) INCLUDE (pm25, o3)
+                """,
+                "创建 recorded_at 索引"
+            )
+            conn.commit()
+
+            # 步骤 10: 按 station_id 哈希分区并行处理时，每个分区一行检查点
+            print("\n【10/14】创建 air_quality_partition_state 表")
+            execute_sql(
+                cursor,
+                """
+                CREATE TABLE air_quality_partition_state (
+                    partition_count INT NOT NULL,
+                    partition_id INT NOT NULL,
+                    last_version BIGINT NOT NULL,
+                    updated_at DATETIME2,
+                    lease_owner NVARCHAR(64) NULL,
+                    lease_expires_at DATETIME2 NULL,
+                    CONSTRAINT PK_air_quality_partition_state PRIMARY KEY (partition_count, partition_id)
+                )
+                """,
+                "创建分区检查点表"
+            )
+            conn.commit()
+
+            # 11. 创建按小时汇总表 air_quality_hourly
+            print("\n【11/14】创建 air_quality_hourly 表")
+            execute_sql(
+                cursor,
+                """
+                CREATE TABLE air_quality_hourly (
+                    station_id NVARCHAR(50) NOT NULL,
+                    hour_start DATETIME2 NOT NULL,
+                    record_count INT NOT NULL,
+                    sum_aqi FLOAT,
+                    avg_aqi FLOAT,
+                    max_pm25 FLOAT,
+                    min_o3 FLOAT,
+                    CONSTRAINT PK_air_quality_hourly PRIMARY KEY (station_id, hour_start)
+                )
+                """,
+                "创建按小时汇总表"
+            )
+            execute_sql(
+                cursor,
+                "CREATE INDEX IX_air_quality_hourly_hour_start ON air_quality_hourly (hour_start)",
+                "创建 hour_start 索引（按时间范围重建与查询）"
+            )
+            conn.commit()
+
+            # 12. 创建按天汇总表 air_quality_daily
+            print("\n【12/14】创建 air_quality_daily 表")
+            execute_sql(
+                cursor,
+                """
+                CREATE TABLE air_quality_daily (
+                    station_id NVARCHAR(50) NOT NULL,
+                    day_start DATETIME2 NOT NULL,
+                    record_count INT NOT NULL,
+                    sum_aqi FLOAT,
+                    avg_aqi FLOAT,
+                    max_pm25 FLOAT,
+                    min_o3 FLOAT,
+                    CONSTRAINT PK_air_quality_daily PRIMARY KEY (station_id, day_start)
+                )
+                """,
+                "创建按天汇总表"
+            )
+            execute_sql(
+                cursor,
+                "CREATE INDEX IX_air_quality_daily_day_start ON air_quality_daily (day_start)",
+                "创建 day_start 索引（按时间范围重建与查询）"
+            )
+            conn.commit()
+
+            # 13. 创建降采样水位表 air_quality_rollup_state
+            print("\n【13/14】创建 air_quality_rollup_state 表")
+            execute_sql(
+                cursor,
+                """
+                CREATE TABLE air_quality_rollup_state (
+                    level NVARCHAR(10) NOT NULL CONSTRAINT PK_air_quality_rollup_state PRIMARY KEY,
+                    watermark DATETIME2 NOT NULL,
+                    updated_at DATETIME2
+                )
+                """,
+                "创建降采样水位表"
+            )
+            conn.commit()
+
+            # 14. 创建写入缓冲区偏移表 air_quality_spool_state
+            print("\n【14/14】创建 air_quality_spool_state 表")
+            execute_sql(
+                cursor,
+                """
+                CREATE TABLE air_quality_spool_state (
+                    spool_id NVARCHAR(100) NOT NULL CONSTRAINT PK_air_quality_spool_state PRIMARY KEY,
+                    segment BIGINT NOT NULL,
+                    position BIGINT NOT NULL,
+                    updated_at DATETIME2
+                )
+                """,
+                "创建本地写入缓冲区已写入偏移表"
+            )
+            conn.commit()
+
             # 验证结果
             print("\n" + "=" * 70)
             print("验证数据库结构")
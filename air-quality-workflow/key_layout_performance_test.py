@@ -0,0 +1,172 @@
+"""
+聚集键布局性能测试 - 比较 NEWID() 随机聚集键（原布局）与 NEWSEQUENTIALID() 递增聚集键 +
+(station_id, recorded_at) 覆盖索引（新布局）的插入吞吐量、按测站/时间范围扫描耗时和碎片率
+
+在两张临时表上进行，不影响 air_quality_data；Azure SQL 与本地 SQLite 后端均可运行。
+"""
+import csv
+import datetime
+import json
+import os
+import time
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+from azure_sql import get_backend, get_sql_connection
+from bulk_insert import COLUMNS
+from init_database import KEY_DEFAULTS
+from reading_generator import generate_batch
+
+# --- 配置 --- #
+ROW_COUNTS = [100000, 1000000]
+LAYOUTS = ["random", "sequential"]
+STATION_COUNT = 15
+CHUNK_SIZE = 10000
+# 每个分块的读数相隔 1 分钟，扫描最近 SCAN_FRACTION 的时间范围
+SCAN_FRACTION = 0.1
+SCAN_REPEATS = 5
+OUTPUT_FILE = "key_layout_results.csv"
+# --- END 配置 --- #
+
+BASE_TIME = datetime.datetime(2025, 1, 1)
+
+
+def table_name(layout):
+    return f"air_quality_layout_{layout}"
+
+
+def create_table(conn, layout):
+    table = table_name(layout)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {table}")
+        cur.execute(
+            f"""
+            CREATE TABLE {table} (
+                id UNIQUEIDENTIFIER NOT NULL CONSTRAINT PK_{table} PRIMARY KEY DEFAULT ({KEY_DEFAULTS[layout]}),
+                station_id NVARCHAR(50),
+                recorded_at DATETIME2,
+                pm25 FLOAT,
+                pm10 FLOAT,
+                o3 FLOAT,
+                aqi INT
+            )
+            """
+        )
+        if layout == "sequential":
+            if get_backend() == "sqlite":
+                cur.execute(
+                    f"CREATE INDEX IX_{table}_station_time ON {table} (station_id, recorded_at, pm25, pm10, o3, aqi)"
+                )
+            else:
+                cur.execute(
+                    f"""
+                    CREATE INDEX IX_{table}_station_time ON {table} (station_id, recorded_at)
+                    INCLUDE (pm25, pm10, o3, aqi)
+                    """
+                )
+    conn.commit()
+
+
+def drop_table(conn, layout):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {table_name(layout)}")
+    conn.commit()
+
+
+def insert_rows(conn, layout, count):
+    """分块写入 count 条读数，每块一个事务；返回耗时"""
+    query = f"INSERT INTO {table_name(layout)} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+    cur = conn.cursor()
+    cur.fast_executemany = True
+    start = time.perf_counter()
+    for chunk, offset in enumerate(range(0, count, CHUNK_SIZE)):
+        size = min(CHUNK_SIZE, count - offset)
+        recorded_at = BASE_TIME + datetime.timedelta(minutes=chunk)
+        cur.executemany(query, generate_batch(size, STATION_COUNT, recorded_at=recorded_at).rows())
+        conn.commit()
+    duration = time.perf_counter() - start
+    cur.close()
+    return duration
+
+
+def scan_stations(conn, layout, count):
+    """对每个测站查询最近一段时间的汇总，返回单轮平均耗时"""
+    chunks = -(-count // CHUNK_SIZE)
+    since = BASE_TIME + datetime.timedelta(minutes=int(chunks * (1 - SCAN_FRACTION)))
+    cur = conn.cursor()
+    start = time.perf_counter()
+    for _ in range(SCAN_REPEATS):
+        for station in range(1, STATION_COUNT + 1):
+            cur.execute(
+                f"""
+                SELECT COUNT(*), AVG(CAST(aqi AS FLOAT)), MAX(pm25), MIN(o3), AVG(pm10)
+                FROM {table_name(layout)}
+                WHERE station_id = ? AND recorded_at >= ?
+                """,
+                f"station-{station}",
+                since,
+            )
+            cur.fetchall()
+    duration = (time.perf_counter() - start) / SCAN_REPEATS
+    cur.close()
+    return duration
+
+
+def fragmentation(conn, layout):
+    """聚集索引碎片率（仅 Azure SQL）"""
+    if get_backend() == "sqlite":
+        return None
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT avg_fragmentation_in_percent
+        FROM sys.dm_db_index_physical_stats(DB_ID(), OBJECT_ID('{table_name(layout)}'), 1, NULL, 'LIMITED')
+        """
+    )
+    row = cur.fetchone()
+    cur.close()
+    return row[0] if row else None
+
+
+def main():
+    print("=" * 80)
+    print(f"聚集键布局性能测试 ({get_backend()} 后端)")
+    print("=" * 80)
+
+    conn = get_sql_connection()
+    results = []
+    try:
+        for count in ROW_COUNTS:
+            print(f"\n{count:,} 条读数")
+            for layout in LAYOUTS:
+                create_table(conn, layout)
+                insert_sec = insert_rows(conn, layout, count)
+                scan_sec = scan_stations(conn, layout, count)
+                frag = fragmentation(conn, layout)
+                drop_table(conn, layout)
+                results.append({
+                    'layout': layout,
+                    'rows': count,
+                    'insert_sec': insert_sec,
+                    'insert_rows_per_sec': count / insert_sec if insert_sec > 0 else 0,
+                    'station_scan_sec': scan_sec,
+                    'fragmentation_pct': frag,
+                    'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                })
+                frag_text = f"{frag:.1f}%" if frag is not None else "n/a"
+                print(f"  {layout:<11} 写入 {insert_sec:>8.2f}s ({results[-1]['insert_rows_per_sec']:>10,.0f} 条/秒)  "
+                      f"{STATION_COUNT} 个测站扫描 {scan_sec * 1000:>9.1f}ms  碎片率 {frag_text}")
+    finally:
+        conn.close()
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+租约并发压力测试 - N 个 ProcessAirQualitySummary 进程同时运行（模拟定时器重叠或多实例扩展），
+检查汇总不会重复计数，并统计租约争用
+
+使用本地 SQLite 后端（临时数据库文件），不需要 Azure SQL。
+"""
+import csv
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.update(
+    SQL_BACKEND="sqlite",
+    SQLITE_DATABASE_PATH=os.path.join(tempfile.mkdtemp(), "lease_stress.db"),
+)
+
+from GenerateAirQualityData import _generate_readings
+from azure_sql import get_sql_connection
+from bulk_insert import write_readings
+
+# --- 配置 --- #
+RUNNER_COUNTS = [2, 4, 8]
+PARTITION_COUNTS = [1, 4]
+ROUNDS = 5
+ROWS_PER_ROUND = 5000
+STATION_COUNT = 15
+OUTPUT_FILE = "lease_stress_results.csv"
+# --- END 配置 --- #
+
+SUMMARY_TABLES = [
+    "air_quality_summary",
+    "air_quality_station_summary",
+    "air_quality_window_summary",
+    "air_quality_contribution",
+    "air_quality_partition_state",
+]
+
+
+def runner(partitions, barrier, reports):
+    """一个独立进程：等所有进程就绪后同时开始处理"""
+    os.environ["SUMMARY_PARTITIONS"] = str(partitions)
+    os.environ["SQL_POOL_SIZE"] = str(partitions + 1)
+    from ProcessAirQualitySummary import process_changes
+
+    barrier.wait()
+    try:
+        reports.put(tuple(process_changes()))
+    except Exception as exc:  # pylint: disable=broad-except
+        reports.put(("error", repr(exc)))
+
+
+def reset_database(conn):
+    with conn.cursor() as cur:
+        for table in SUMMARY_TABLES:
+            cur.execute(f"DELETE FROM {table}")
+        cur.execute("DELETE FROM air_quality_data")
+        cur.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()")
+        version = cur.fetchone()[0] or 0
+        cur.execute(
+            "UPDATE air_quality_sync_state SET last_version = ?, lease_owner = NULL, lease_expires_at = NULL WHERE id = 1",
+            version,
+        )
+    conn.commit()
+
+
+def run_round(runners, partitions):
+    barrier = multiprocessing.Barrier(runners)
+    reports = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=runner, args=(partitions, barrier, reports)) for _ in range(runners)
+    ]
+    for process in processes:
+        process.start()
+    results = [reports.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return results
+
+
+def check_totals(conn):
+    """汇总记录数必须与原始数据行数一致（没有重复计数也没有遗漏）"""
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM air_quality_data")
+    raw = cur.fetchone()[0]
+    cur.execute("SELECT SUM(record_count) FROM air_quality_summary")
+    summarized = cur.fetchone()[0] or 0
+    cur.execute("SELECT SUM(record_count) FROM air_quality_station_summary")
+    by_station = cur.fetchone()[0] or 0
+    cur.execute("SELECT COUNT(*) FROM air_quality_contribution")
+    ledger = cur.fetchone()[0]
+    cur.close()
+    return raw, summarized, by_station, ledger
+
+
+def main():
+    print("=" * 80)
+    print("租约并发压力测试: 多个处理进程同时运行")
+    print("=" * 80)
+
+    conn = get_sql_connection()
+    results = []
+    failed = False
+    try:
+        for partitions in PARTITION_COUNTS:
+            for runners in RUNNER_COUNTS:
+                reset_database(conn)
+                runs = skipped = claimed = contended = lost = errors = 0
+                start = time.perf_counter()
+                for _ in range(ROUNDS):
+                    write_readings(conn, _generate_readings(ROWS_PER_ROUND, STATION_COUNT), strategy="fast_executemany")
+                    conn.commit()
+                    for report in run_round(runners, partitions):
+                        runs += 1
+                        if report[0] == "error":
+                            errors += 1
+                            print(f"  ✗ 处理进程出错: {report[1]}")
+                            continue
+                        _, processed_partitions, report_contended, _, _, report_lost = report
+                        claimed += processed_partitions
+                        contended += report_contended
+                        lost += report_lost
+                        skipped += processed_partitions == 0
+                duration = time.perf_counter() - start
+
+                raw, summarized, by_station, ledger = check_totals(conn)
+                consistent = raw == summarized == by_station == ledger
+                failed |= not consistent or errors > 0
+                results.append({
+                    'partitions': partitions,
+                    'runners': runners,
+                    'rounds': ROUNDS,
+                    'runs': runs,
+                    'skipped_runs': skipped,
+                    'partitions_claimed': claimed,
+                    'partitions_contended': contended,
+                    'contention_rate': contended / (claimed + contended) if claimed + contended else 0,
+                    'leases_lost': lost,
+                    'errors': errors,
+                    'raw_rows': raw,
+                    'summarized_rows': summarized,
+                    'consistent': consistent,
+                    'duration_sec': duration,
+                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                })
+                mark = "✓" if consistent else "✗"
+                print(f"  {mark} {partitions} 个分区 × {runners} 个进程: 原始 {raw:,} 条, 汇总 {summarized:,} 条, "
+                      f"争用 {contended} 次 ({results[-1]['contention_rate']:.0%}), 跳过 {skipped}/{runs} 次运行, "
+                      f"租约被接管 {lost} 次")
+    finally:
+        conn.close()
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+    if failed:
+        raise SystemExit("✗ 存在重复计数、遗漏或处理错误")
+    print("✓ 所有并发组合下汇总均与原始数据一致")
+
+
+if __name__ == "__main__":
+    main()
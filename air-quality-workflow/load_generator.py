@@ -0,0 +1,241 @@
+"""Open-loop, multi-process load generation against the ingest path.
+
+:func:`run_stage` starts ``workers`` processes. Each one simulates its own
+contiguous slice of the station fleet with a :class:`WorkloadGenerator`, so
+no two workers share a ``(station_id, recorded_at)`` key. Every ``tick_sec``
+a worker owes one batch of ``target_rows_per_sec / workers * tick_sec``
+readings. It writes and commits the batch on its own connection.
+
+The schedule is open loop: a slow write does not push the later batches
+back. They queue behind it, and their queueing delay is measured from the
+time each one was due rather than from when the worker got to it. A stage
+lasts ``duration_sec``. Batches still waiting when it ends are reported as
+backlog instead of being written, so a stage never outlasts its duration by
+more than one write.
+
+A stage keeps up when the achieved rate is close to the target, errors are
+rare and batches wait less than a tick. :func:`saturation_point` finds the
+first stage of a rising sweep that does not.
+"""
+
+import datetime
+import multiprocessing
+import time
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from azure_sql import get_sql_connection
+from bulk_insert import write_readings
+from parallel_writer import shard_bounds
+from workload_profiles import WorkloadGenerator, get_profile
+
+DEFAULT_TICK_SEC = 1.0
+DEFAULT_START_DELAY_SEC = 3.0
+KEEP_UP_RATE_RATIO = 0.95
+KEEP_UP_ERROR_RATE = 0.01
+
+
+class BatchRecord(NamedTuple):
+    worker: int
+    scheduled_sec: float
+    started_sec: float
+    finished_sec: float
+    rows: int
+    error: Optional[str]
+
+    @property
+    def queue_delay_sec(self) -> float:
+        return self.started_sec - self.scheduled_sec
+
+    @property
+    def latency_sec(self) -> float:
+        return self.finished_sec - self.scheduled_sec
+
+
+class WorkerResult(NamedTuple):
+    worker: int
+    stations: int
+    batches: List[BatchRecord]
+    backlog_batches: int
+
+
+class StageResult(NamedTuple):
+    target_rows_per_sec: float
+    workers: int
+    stations: int
+    duration_sec: float
+    tick_sec: float
+    batches: List[BatchRecord]
+    backlog_batches: int
+
+    @property
+    def committed_rows(self) -> int:
+        return sum(batch.rows for batch in self.batches if batch.error is None)
+
+    @property
+    def achieved_rows_per_sec(self) -> float:
+        return self.committed_rows / self.duration_sec if self.duration_sec > 0 else 0.0
+
+    @property
+    def errors(self) -> int:
+        return sum(1 for batch in self.batches if batch.error is not None)
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / len(self.batches) if self.batches else 0.0
+
+    def queue_delay_percentile(self, pct: float) -> float:
+        delays = [batch.queue_delay_sec for batch in self.batches]
+        return float(np.percentile(delays, pct)) if delays else 0.0
+
+    def latency_percentile(self, pct: float) -> float:
+        latencies = [batch.latency_sec for batch in self.batches]
+        return float(np.percentile(latencies, pct)) if latencies else 0.0
+
+    @property
+    def keeping_up(self) -> bool:
+        return (
+            self.achieved_rows_per_sec >= KEEP_UP_RATE_RATIO * self.target_rows_per_sec
+            and self.error_rate <= KEEP_UP_ERROR_RATE
+            and self.queue_delay_percentile(95) < self.tick_sec
+        )
+
+
+def _rows_due(rows_per_tick: float, tick: int) -> int:
+    # Carry the fractional rows over so a worker's total matches its rate exactly.
+    return int(round((tick + 1) * rows_per_tick)) - int(round(tick * rows_per_tick))
+
+
+def _reconnect(conn):
+    try:
+        conn.rollback()
+        return conn
+    except Exception:  # pylint: disable=broad-except
+        try:
+            conn.close()
+        except Exception:  # pylint: disable=broad-except
+            pass
+        return get_sql_connection()
+
+
+def _run_worker(
+    worker: int,
+    station_offset: int,
+    station_count: int,
+    rows_per_sec: float,
+    duration_sec: float,
+    tick_sec: float,
+    profile: str,
+    strategy: str,
+    start_at: float,
+    results,
+):
+    """Worker process body; puts one :class:`WorkerResult` on ``results``."""
+    generator = WorkloadGenerator(get_profile(profile, period_sec=tick_sec), station_count, station_offset=station_offset)
+    rows_per_tick = rows_per_sec * tick_sec
+    ticks = int(round(duration_sec / tick_sec))
+    records = []
+    conn = None
+    tick = 0
+    try:
+        conn = get_sql_connection()
+        while tick < ticks:
+            scheduled = tick * tick_sec
+            wait = start_at + scheduled - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            started = time.time() - start_at
+            if started >= duration_sec:
+                break
+            batch = generator.next_batch(
+                _rows_due(rows_per_tick, tick),
+                now=datetime.datetime.utcfromtimestamp(start_at + scheduled),
+            )
+            error = None
+            try:
+                write_readings(conn, batch, strategy=strategy)
+                conn.commit()
+            except Exception as exc:  # pylint: disable=broad-except
+                error = f"{type(exc).__name__}: {exc}"
+                conn = _reconnect(conn)
+            records.append(BatchRecord(worker, scheduled, started, time.time() - start_at, len(batch), error))
+            tick += 1
+    finally:
+        if conn is not None:
+            conn.close()
+        # Always report, or run_stage would wait for this worker forever.
+        results.put(WorkerResult(worker, station_count, records, ticks - tick))
+
+
+def run_stage(
+    target_rows_per_sec: float,
+    workers: int,
+    station_count: int,
+    duration_sec: float,
+    tick_sec: float = DEFAULT_TICK_SEC,
+    profile: str = "sampled",
+    strategy: str = "auto",
+    start_delay_sec: float = DEFAULT_START_DELAY_SEC,
+) -> StageResult:
+    """Drive ``target_rows_per_sec`` from ``workers`` processes for ``duration_sec``.
+
+    All workers start their schedules together ``start_delay_sec`` after the
+    processes are launched, leaving time for imports and connecting.
+    """
+    if workers < 1 or station_count < workers:
+        raise ValueError("need at least one worker and one station per worker")
+    get_profile(profile)
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    start_at = time.time() + start_delay_sec
+    processes = [
+        context.Process(
+            target=_run_worker,
+            args=(
+                worker,
+                offset,
+                stop - offset,
+                target_rows_per_sec / workers,
+                duration_sec,
+                tick_sec,
+                profile,
+                strategy,
+                start_at,
+                results,
+            ),
+            name=f"load-worker-{worker}",
+        )
+        for worker, (offset, stop) in enumerate(shard_bounds(station_count, workers))
+    ]
+    for process in processes:
+        process.start()
+    # Drain the queue before joining: a worker blocks on exit until its result is read.
+    worker_results = []
+    for _ in processes:
+        worker_results.append(results.get())
+    for process in processes:
+        process.join()
+
+    batches = sorted(
+        (batch for result in worker_results for batch in result.batches),
+        key=lambda batch: (batch.scheduled_sec, batch.worker),
+    )
+    return StageResult(
+        target_rows_per_sec=target_rows_per_sec,
+        workers=workers,
+        stations=station_count,
+        duration_sec=duration_sec,
+        tick_sec=tick_sec,
+        batches=batches,
+        backlog_batches=sum(result.backlog_batches for result in worker_results),
+    )
+
+
+def saturation_point(stages: Sequence[StageResult]) -> Optional[StageResult]:
+    """Return the first stage, in rising target order, that did not keep up."""
+    for stage in sorted(stages, key=lambda stage: stage.target_rows_per_sec):
+        if not stage.keeping_up:
+            return stage
+    return None
@@ -0,0 +1,137 @@
+"""
+迁移 air_quality_data 到唯一自然键 (station_id, recorded_at)
+
+旧的生成器把同一批次中同一测站的多条读数记在同一时刻，这些读数不是重复写入，不能删除：
+1. 按天逐段把同一 (station_id, recorded_at) 的第 k 条读数（按 id 排序，k 从 0 开始）后移 k 微秒，
+   与新生成器的时间戳规则一致；更新经 Change Tracking 进入汇总修正，汇总结果不变；
+2. 以 ONLINE 方式把 IX_air_quality_data_station_time 重建为唯一索引；
+3. 创建或更新幂等写入存储过程 usp_upsert_air_quality_batch。
+
+每一步都可以重复运行。
+"""
+import datetime
+import json
+import os
+
+from azure_sql import get_backend, get_sql_connection
+from init_database import UPSERT_PROCEDURE_SQL
+
+# --- 配置 --- #
+NATURAL_KEY_INDEX = "IX_air_quality_data_station_time"
+# --- END 配置 --- #
+
+
+def restamp_duplicates(conn):
+    """按天分段后移重复时间戳；同一键的读数时间相同，不会被分到两段"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(recorded_at), MAX(recorded_at) FROM air_quality_data")
+    first, last = cursor.fetchone()
+    total = 0
+    if first is not None:
+        day = datetime.datetime.combine(first.date(), datetime.time())
+        while day <= last:
+            cursor.execute(
+                """
+                WITH ranked AS (
+                    SELECT recorded_at,
+                           ROW_NUMBER() OVER (PARTITION BY station_id, recorded_at ORDER BY id) AS rn
+                    FROM air_quality_data
+                    WHERE recorded_at >= ? AND recorded_at < ?
+                )
+                UPDATE ranked SET recorded_at = DATEADD(MICROSECOND, rn - 1, recorded_at) WHERE rn > 1
+                """,
+                day,
+                day + datetime.timedelta(days=1),
+            )
+            total += max(cursor.rowcount, 0)
+            conn.commit()
+            day += datetime.timedelta(days=1)
+    cursor.close()
+    return total
+
+
+def create_unique_index(cursor):
+    cursor.execute(
+        "SELECT is_unique FROM sys.indexes WHERE object_id = OBJECT_ID('air_quality_data') AND name = ?",
+        NATURAL_KEY_INDEX,
+    )
+    row = cursor.fetchone()
+    if row and row[0]:
+        print(f"  ✓ {NATURAL_KEY_INDEX} 已是唯一索引，跳过")
+        return
+    print(f"  在线{'重建' if row else '创建'} {NATURAL_KEY_INDEX}...", end=" ")
+    cursor.execute(
+        f"""
+        CREATE UNIQUE NONCLUSTERED INDEX {NATURAL_KEY_INDEX}
+        ON air_quality_data (station_id, recorded_at)
+        INCLUDE (pm25, pm10, o3, aqi)
+        WITH (ONLINE = ON{', DROP_EXISTING = ON' if row else ''})
+        """
+    )
+    print("✓")
+
+
+def migrate_sqlite():
+    """本地 SQLite 后端：逐行后移重复时间戳后创建唯一索引"""
+    from azure_sql.sqlite_backend import NATURAL_KEY_SQL, _parse_datetime
+
+    conn = get_sql_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT id, recorded_at, rn FROM (
+            SELECT id, recorded_at,
+                   ROW_NUMBER() OVER (PARTITION BY station_id, recorded_at ORDER BY id) AS rn
+            FROM air_quality_data
+        ) AS ranked
+        WHERE rn > 1
+        """
+    )
+    updates = [
+        (_parse_datetime(recorded_at) + datetime.timedelta(microseconds=rn - 1), row_id)
+        for row_id, recorded_at, rn in cursor.fetchall()
+    ]
+    cursor.executemany("UPDATE air_quality_data SET recorded_at = ? WHERE id = ?", updates)
+    cursor.execute(NATURAL_KEY_SQL)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"  ✓ 后移 {len(updates):,} 条读数的时间戳，唯一索引已就绪")
+
+
+def main():
+    # 加载配置
+    cfg = json.load(open("local.settings.json", encoding="utf-8"))
+    os.environ.update(cfg["Values"])
+
+    print("=" * 70)
+    print("air_quality_data 迁移: 唯一自然键 (station_id, recorded_at)")
+    print("=" * 70)
+
+    if get_backend() == "sqlite":
+        migrate_sqlite()
+        return
+
+    conn = get_sql_connection()
+    try:
+        print("\n【1/3】后移重复时间戳")
+        print(f"  ✓ 后移 {restamp_duplicates(conn):,} 条读数的时间戳")
+        # 在线建索引与 CREATE OR ALTER 不需要放在用户事务中
+        conn.autocommit = True
+        cursor = conn.cursor()
+        print("【2/3】创建唯一自然键索引")
+        create_unique_index(cursor)
+        print("【3/3】创建幂等写入存储过程")
+        cursor.execute(UPSERT_PROCEDURE_SQL)
+        print("  ✓ usp_upsert_air_quality_batch 已就绪")
+        cursor.close()
+    finally:
+        conn.close()
+
+    print("\n" + "=" * 70)
+    print("✓✓✓ 迁移完成！✓✓✓")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+在线迁移 air_quality_data 到递增聚集键布局（不停机、不复制表）
+
+1. 把 id 列的默认值从 NEWID() 换成 NEWSEQUENTIALID()（只改元数据），之后的插入都追加在聚集索引末尾；
+2. 以 ONLINE + RESUMABLE 方式重建聚集主键，消除随机键造成的碎片，期间读写照常进行，中断后可续做；
+3. 以 ONLINE 方式创建 (station_id, recorded_at) INCLUDE (pm25, pm10, o3, aqi) 覆盖索引。
+
+id 仍是 UNIQUEIDENTIFIER 主键，Change Tracking、air_quality_contribution 和存储过程都不受影响。
+每一步都先检查是否已完成，可以重复运行。
+"""
+import json
+import os
+
+from azure_sql import get_backend, get_sql_connection
+
+# --- 配置 --- #
+MAX_REBUILD_MINUTES = 60
+COVERING_INDEX = "IX_air_quality_data_station_time"
+# --- END 配置 --- #
+
+
+def fragmentation(cursor):
+    """聚集索引的碎片率与页数"""
+    cursor.execute(
+        """
+        SELECT avg_fragmentation_in_percent, page_count
+        FROM sys.dm_db_index_physical_stats(DB_ID(), OBJECT_ID('air_quality_data'), 1, NULL, 'LIMITED')
+        """
+    )
+    row = cursor.fetchone()
+    return (row[0], row[1]) if row else (0.0, 0)
+
+
+def switch_default(cursor):
+    cursor.execute(
+        """
+        SELECT dc.name, dc.definition
+        FROM sys.default_constraints AS dc
+        JOIN sys.columns AS c ON c.object_id = dc.parent_object_id AND c.column_id = dc.parent_column_id
+        WHERE dc.parent_object_id = OBJECT_ID('air_quality_data') AND c.name = 'id'
+        """
+    )
+    row = cursor.fetchone()
+    if row and "newsequentialid" in row[1].lower():
+        print("  ✓ id 默认值已是 NEWSEQUENTIALID()，跳过")
+        return
+    statements = []
+    if row:
+        statements.append(f"ALTER TABLE air_quality_data DROP CONSTRAINT [{row[0]}]")
+    statements.append(
+        "ALTER TABLE air_quality_data ADD CONSTRAINT DF_air_quality_data_id DEFAULT NEWSEQUENTIALID() FOR id"
+    )
+    # 两条语句在同一事务中执行，不会出现没有默认值的空窗
+    cursor.execute("BEGIN TRANSACTION; " + "; ".join(statements) + "; COMMIT TRANSACTION;")
+    print("  ✓ id 默认值改为 NEWSEQUENTIALID()")
+
+
+def rebuild_clustered(cursor):
+    cursor.execute(
+        "SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID('air_quality_data') AND index_id = 1"
+    )
+    name = cursor.fetchone()[0]
+    cursor.execute(
+        "SELECT state_desc FROM sys.index_resumable_operations WHERE object_id = OBJECT_ID('air_quality_data')"
+    )
+    paused = cursor.fetchone()
+    if paused:
+        print(f"  发现未完成的重建（{paused[0]}），继续...", end=" ")
+        cursor.execute(f"ALTER INDEX [{name}] ON air_quality_data RESUME")
+    else:
+        print(f"  在线重建 {name}...", end=" ")
+        cursor.execute(
+            f"""
+            ALTER INDEX [{name}] ON air_quality_data
+            REBUILD WITH (ONLINE = ON, RESUMABLE = ON, MAX_DURATION = {MAX_REBUILD_MINUTES} MINUTES)
+            """
+        )
+    print("✓")
+
+
+def create_covering_index(cursor):
+    cursor.execute(
+        "SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID('air_quality_data') AND name = ?",
+        COVERING_INDEX,
+    )
+    if cursor.fetchone():
+        print(f"  ✓ {COVERING_INDEX} 已存在，跳过")
+        return
+    print(f"  在线创建 {COVERING_INDEX}...", end=" ")
+    cursor.execute(
+        f"""
+        CREATE NONCLUSTERED INDEX {COVERING_INDEX}
+        ON air_quality_data (station_id, recorded_at)
+        INCLUDE (pm25, pm10, o3, aqi)
+        WITH (ONLINE = ON)
+        """
+    )
+    print("✓")
+
+
+def migrate_sqlite():
+    """本地 SQLite 后端：新建的数据库文件已是递增键布局，已有文件只补建覆盖索引"""
+    conn = get_sql_connection()
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS {COVERING_INDEX}
+            ON air_quality_data (station_id, recorded_at, pm25, pm10, o3, aqi)
+            """
+        )
+    conn.close()
+    print(f"  ✓ {COVERING_INDEX} 已就绪")
+    print("  SQLite 无法修改已有列的默认值；删除本地数据库文件后重新创建即可使用 NEWSEQUENTIALID() 键")
+
+
+def main():
+    # 加载配置
+    cfg = json.load(open("local.settings.json", encoding="utf-8"))
+    os.environ.update(cfg["Values"])
+
+    print("=" * 70)
+    print("air_quality_data 在线迁移: 递增聚集键 + 覆盖索引")
+    print("=" * 70)
+
+    if get_backend() == "sqlite":
+        migrate_sqlite()
+        return
+
+    conn = get_sql_connection()
+    # 可续做的在线重建不能在用户事务中执行
+    conn.autocommit = True
+    try:
+        cursor = conn.cursor()
+        before, pages = fragmentation(cursor)
+        print(f"\n迁移前聚集索引碎片率: {before:.1f}%（{pages:,} 页）\n")
+
+        print("【1/3】切换 id 默认值")
+        switch_default(cursor)
+        print("【2/3】重建聚集主键")
+        rebuild_clustered(cursor)
+        print("【3/3】创建覆盖索引")
+        create_covering_index(cursor)
+
+        after, pages = fragmentation(cursor)
+        print(f"\n迁移后聚集索引碎片率: {after:.1f}%（{pages:,} 页）")
+        cursor.close()
+    finally:
+        conn.close()
+
+    print("\n" + "=" * 70)
+    print("✓✓✓ 迁移完成！✓✓✓")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Split a large batch across several connections and commit each shard on its own.
+
+One connection serialises a batch's traffic however fast the insert
+primitive is. :func:`write_sharded` cuts the batch into ``connections``
+contiguous shards and writes them from a thread pool of the same size; each
+``write_shard`` call borrows its own connection, writes and commits. When
+shards fail, only those shards are sent again, up to ``retries`` more
+times with a growing pause in between; shards that committed are never
+re-sent. The batch is therefore no longer one transaction: a shard that
+still fails after its retries raises :class:`ShardWriteFailed` with the
+shards that did commit.
+
+A commit that succeeds on the server but whose acknowledgement is lost is
+reported as a failure and retried. With the ``upsert`` bulk insert strategy
+that replay changes nothing; with the plain strategies the unique
+``(station_id, recorded_at)`` index rejects it and the shard ends up failed.
+
+Per-shard latency and attempts are returned so the writer parallelism can
+be raised until shard latency grows with it, the point where the server's
+log-write throughput rather than the client is the limit.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BACKOFF_SEC = 0.5
+
+
+class ShardResult(NamedTuple):
+    index: int
+    rows: int
+    round_trips: int
+    attempts: int
+    latency_sec: float
+
+
+class ShardedWriteResult(NamedTuple):
+    strategy: str
+    rows: int
+    round_trips: int
+    duration_sec: float
+    connections: int
+    shards: Tuple[ShardResult, ...]
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.duration_sec if self.duration_sec > 0 else 0.0
+
+    @property
+    def retried_shards(self) -> int:
+        return sum(1 for shard in self.shards if shard.attempts > 1)
+
+    @property
+    def max_shard_latency_sec(self) -> float:
+        return max((shard.latency_sec for shard in self.shards), default=0.0)
+
+
+class ShardWriteFailed(Exception):
+    """Shards still failed after their retries; ``committed`` holds the shards that were written."""
+
+    def __init__(self, failed: Dict[int, BaseException], committed: Tuple[ShardResult, ...]):
+        first = min(failed)
+        super().__init__(
+            f"{len(failed)} of {len(failed) + len(committed)} shards failed "
+            f"(shard {first}: {failed[first]})"
+        )
+        self.failed = failed
+        self.committed = committed
+
+
+def shard_bounds(row_count: int, connections: int) -> List[Tuple[int, int]]:
+    """Return ``(start, stop)`` offsets of at most ``connections`` near-equal contiguous shards."""
+    shards = max(1, min(connections, row_count))
+    size, extra = divmod(row_count, shards)
+    bounds = []
+    start = 0
+    for index in range(shards):
+        stop = start + size + (1 if index < extra else 0)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+
+def _timed(write_shard, rows):
+    start = time.perf_counter()
+    result = write_shard(rows)
+    return result, time.perf_counter() - start
+
+
+def write_sharded(
+    readings: Sequence,
+    connections: int,
+    write_shard: Callable[[Sequence], object],
+    retries: int = DEFAULT_RETRIES,
+    retry_backoff_sec: float = DEFAULT_RETRY_BACKOFF_SEC,
+) -> ShardedWriteResult:
+    """Write ``readings`` as ``connections`` shards in parallel, retrying failed shards only.
+
+    ``write_shard(rows)`` must write *and commit* ``rows`` on a connection of
+    its own and return a ``BulkWriteResult``.
+    """
+    if connections < 1:
+        raise ValueError("connections must be at least 1")
+
+    bounds = shard_bounds(len(readings), connections)
+    done: Dict[int, ShardResult] = {}
+    attempts = {index: 0 for index in range(len(bounds))}
+    failed: Dict[int, BaseException] = {}
+    strategy = ""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(bounds), thread_name_prefix="shard-writer") as executor:
+        pending = list(range(len(bounds)))
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(retry_backoff_sec * attempt)
+            futures = {
+                index: executor.submit(_timed, write_shard, readings[bounds[index][0]:bounds[index][1]])
+                for index in pending
+            }
+            failed = {}
+            for index, future in futures.items():
+                attempts[index] += 1
+                try:
+                    result, latency = future.result()
+                except Exception as exc:  # pylint: disable=broad-except
+                    failed[index] = exc
+                    continue
+                strategy = getattr(result, "strategy", strategy)
+                done[index] = ShardResult(
+                    index=index,
+                    rows=bounds[index][1] - bounds[index][0],
+                    round_trips=getattr(result, "round_trips", 1),
+                    attempts=attempts[index],
+                    latency_sec=latency,
+                )
+            pending = sorted(failed)
+            if not pending:
+                break
+
+    shards = tuple(done[index] for index in sorted(done))
+    if failed:
+        raise ShardWriteFailed(failed, shards)
+    return ShardedWriteResult(
+        strategy=strategy,
+        rows=sum(shard.rows for shard in shards),
+        round_trips=sum(shard.round_trips for shard in shards),
+        duration_sec=time.perf_counter() - start,
+        connections=len(bounds),
+        shards=shards,
+    )
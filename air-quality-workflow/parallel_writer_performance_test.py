@@ -0,0 +1,133 @@
+"""
+并行分片写入性能测试 - 比较 GenerateAirQualityData._write_batch 在不同写入连接数（WRITER_CONNECTIONS）下
+的吞吐量与每个分片的延迟，找出继续增加连接不再提升吞吐量的拐点
+
+Azure SQL 后端同时记录测试期间 sys.dm_db_resource_stats 中的最高日志写入百分比：
+分片延迟随连接数上升且日志写入接近 100% 时，瓶颈已是数据库日志写入而不是客户端。
+另外注入一次分片失败，检查只重试失败的分片、写入条数与批次大小一致（没有重复写入）。
+"""
+import csv
+import datetime
+import json
+import os
+import statistics
+import threading
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+# --- 配置 --- #
+BATCH_SIZE = 200000
+CONNECTION_COUNTS = [1, 2, 4, 8]
+STATION_COUNT = 15
+OUTPUT_FILE = "parallel_writer_results.csv"
+# --- END 配置 --- #
+
+# 每个写入连接占用一个池化连接；按连接数分片时不设最小分片行数
+os.environ["SQL_POOL_SIZE"] = str(max(CONNECTION_COUNTS))
+os.environ["WRITER_MIN_SHARD_ROWS"] = "1"
+
+from GenerateAirQualityData import _commit_rows, _generate_readings, _write_batch
+from azure_sql import get_backend, get_sql_connection
+from parallel_writer import write_sharded
+
+
+def clear_data(conn):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM air_quality_data")
+    conn.commit()
+
+
+def count_rows(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM air_quality_data")
+    count = cur.fetchone()[0]
+    cur.close()
+    return count
+
+
+def peak_log_write_percent(conn, since):
+    """测试期间数据库日志写入占上限的最高百分比（仅 Azure SQL，约 15 秒一个采样点）"""
+    if get_backend() == "sqlite":
+        return None
+    cur = conn.cursor()
+    cur.execute("SELECT MAX(avg_log_write_percent) FROM sys.dm_db_resource_stats WHERE end_time >= ?", since)
+    row = cur.fetchone()
+    cur.close()
+    return row[0] if row else None
+
+
+def run_single(conn, connections):
+    os.environ["WRITER_CONNECTIONS"] = str(connections)
+    readings = _generate_readings(BATCH_SIZE, STATION_COUNT)
+    clear_data(conn)
+    since = datetime.datetime.utcnow()
+    result = _write_batch(readings)
+    latencies = [shard.latency_sec for shard in getattr(result, "shards", ())] or [result.duration_sec]
+    log_pct = peak_log_write_percent(conn, since)
+    return {
+        'connections': connections,
+        'batch_size': BATCH_SIZE,
+        'strategy': result.strategy,
+        'duration_sec': result.duration_sec,
+        'rows_per_sec': result.rows_per_sec,
+        'shard_latency_p50_sec': statistics.median(latencies),
+        'shard_latency_max_sec': max(latencies),
+        'peak_log_write_pct': log_pct,
+        'rows_written': count_rows(conn),
+        'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def check_retry(conn, connections):
+    """让第二次写入调用（某一个分片的第一次写入）失败，检查只有该分片被重试"""
+    sent = []
+    lock = threading.Lock()
+
+    def flaky_write(rows):
+        with lock:
+            sent.append(len(rows))
+            first_try_of_shard_1 = len(sent) == 2
+        if first_try_of_shard_1:
+            raise ConnectionError("simulated transient failure")
+        return _commit_rows(rows)
+
+    clear_data(conn)
+    readings = _generate_readings(BATCH_SIZE, STATION_COUNT)
+    result = write_sharded(readings, connections, flaky_write, retries=1, retry_backoff_sec=0)
+    return result.retried_shards == 1 and len(sent) == connections + 1 and count_rows(conn) == BATCH_SIZE
+
+
+def main():
+    print("=" * 80)
+    print(f"并行分片写入性能测试 ({get_backend()} 后端, {BATCH_SIZE:,} 条/批)")
+    print("=" * 80)
+
+    conn = get_sql_connection()
+    results = []
+    try:
+        for connections in CONNECTION_COUNTS:
+            row = run_single(conn, connections)
+            results.append(row)
+            complete = "✓" if row['rows_written'] == BATCH_SIZE else "✗"
+            log_text = f"{row['peak_log_write_pct']:.0f}%" if row['peak_log_write_pct'] is not None else "n/a"
+            print(f"  {complete} {connections} 个连接  {row['duration_sec']:>7.2f}s ({row['rows_per_sec']:>9,.0f} 条/秒)  "
+                  f"分片延迟 p50 {row['shard_latency_p50_sec']:.2f}s / 最大 {row['shard_latency_max_sec']:.2f}s  "
+                  f"日志写入峰值 {log_text}")
+
+        retry_ok = check_retry(conn, max(CONNECTION_COUNTS))
+        print(f"\n  {'✓' if retry_ok else '✗'} 注入失败后只重试失败的分片，写入条数与批次大小一致")
+        clear_data(conn)
+    finally:
+        conn.close()
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+分区并行处理性能测试 - 同一批待处理变更按 station_id 哈希分成 1/2/4/8 个分区并行处理时的吞吐量
+"""
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from unittest.mock import Mock
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+from GenerateAirQualityData import _generate_readings
+from ProcessAirQualitySummary import main as process_main
+from azure_sql import get_sql_connection
+from bulk_insert import write_readings
+
+# --- 配置 --- #
+PENDING_CHANGES = 200000
+PARTITION_COUNTS = [1, 2, 4, 8]
+STATION_COUNT = 15
+SEED_CHUNK_SIZE = 50000
+OUTPUT_FILE = "partition_results.csv"
+# --- END 配置 --- #
+
+# 每个分区各占一个连接
+os.environ["SQL_POOL_SIZE"] = str(max(PARTITION_COUNTS))
+
+SUMMARY_TABLES = [
+    "air_quality_summary",
+    "air_quality_station_summary",
+    "air_quality_window_summary",
+    "air_quality_contribution",
+    "air_quality_partition_state",
+]
+
+
+def reset_database(conn):
+    """清空数据并返回当前 Change Tracking 版本"""
+    with conn.cursor() as cur:
+        for table in SUMMARY_TABLES:
+            cur.execute(f"DELETE FROM {table}")
+        cur.execute("DELETE FROM air_quality_data")
+    conn.commit()
+    cur = conn.cursor()
+    cur.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()")
+    version = cur.fetchone()[0] or 0
+    cur.close()
+    return version
+
+
+def seed_changes(conn, count):
+    written = 0
+    while written < count:
+        size = min(SEED_CHUNK_SIZE, count - written)
+        write_readings(conn, _generate_readings(size, STATION_COUNT), strategy="fast_executemany")
+        conn.commit()
+        written += size
+
+
+def rewind(conn, version):
+    """清空汇总与检查点，让每种分区数处理同一批变更"""
+    with conn.cursor() as cur:
+        for table in SUMMARY_TABLES:
+            cur.execute(f"DELETE FROM {table}")
+        cur.execute("UPDATE air_quality_sync_state SET last_version = ? WHERE id = 1", version)
+    conn.commit()
+
+
+def run_partitions(count):
+    os.environ["SUMMARY_PARTITIONS"] = str(count)
+    mock_timer = Mock()
+    mock_timer.past_due = False
+    start = time.perf_counter()
+    process_main(mock_timer)
+    return time.perf_counter() - start
+
+
+def main():
+    print("=" * 80)
+    print(f"分区并行处理性能测试: {PENDING_CHANGES:,} 条待处理变更")
+    print("=" * 80)
+
+    conn = get_sql_connection()
+    results = []
+    try:
+        base_version = reset_database(conn)
+        print("  写入测试数据...", end=" ")
+        seed_changes(conn, PENDING_CHANGES)
+        print("✓\n")
+
+        for count in PARTITION_COUNTS:
+            rewind(conn, base_version)
+            duration = run_partitions(count)
+            cur = conn.cursor()
+            cur.execute("SELECT SUM(record_count) FROM air_quality_summary")
+            processed = cur.fetchone()[0] or 0
+            cur.close()
+            results.append({
+                'partitions': count,
+                'duration_sec': duration,
+                'records_processed': processed,
+                'records_per_sec': processed / duration if duration > 0 else 0,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            })
+            print(f"  {count} 个分区  {duration:>9.3f}s  处理 {processed:,} 条  "
+                  f"{results[-1]['records_per_sec']:>12,.0f} 条/秒")
+        reset_database(conn)
+    finally:
+        conn.close()
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+
+    baseline = results[0]['records_per_sec']
+    print("\n" + "=" * 80)
+    for result in results[1:]:
+        if baseline > 0:
+            print(f"  {result['partitions']} 个分区: 吞吐量为单分区的 {result['records_per_sec'] / baseline:.2f} 倍")
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 """
 性能测试脚本 - 测试不同负载下的 Serverless Workflow 性能
 所有数据都是真实运行获得，不编造任何数据
+
+负载模式（workload_profiles.py）通过命令行参数或 WORKLOAD_PROFILE 选择，例如：
+    python performance_test.py diurnal
 """
+import asyncio
 import json
 import os
 import sys
@@ -19,6 +23,11 @@ os.environ.update(cfg["Values"])
 from GenerateAirQualityData import main as generate_main
 from ProcessAirQualitySummary import main as process_main
 from azure_sql import get_sql_connection
+from workload_profiles import get_profile
+
+# --- 配置 --- #
+WORKLOAD_PROFILE = sys.argv[1] if len(sys.argv) > 1 else os.getenv("WORKLOAD_PROFILE", "uniform")
+# --- END 配置 --- #
 
 
 class PerformanceMonitor:
@@ -92,6 +101,7 @@ def run_single_test(batch_size, station_count, iteration):
     # 设置环境变量
     os.environ["BATCH_SIZE"] = str(batch_size)
     os.environ["STATION_COUNT"] = str(station_count)
+    os.environ["WORKLOAD_PROFILE"] = WORKLOAD_PROFILE
 
     mock_timer = Mock()
     mock_timer.past_due = False
@@ -102,7 +112,7 @@ def run_single_test(batch_size, station_count, iteration):
     monitor_gen.start()
 
     try:
-        generate_main(mock_timer)
+        asyncio.run(generate_main(mock_timer))
         monitor_gen.stop()
         gen_stats = monitor_gen.get_stats()
         print(f"✓ ({gen_stats['duration']:.3f}s)")
@@ -133,6 +143,7 @@ def run_single_test(batch_size, station_count, iteration):
     # 返回完整的测试结果
     result = {
         'iteration': iteration,
+        'workload_profile': WORKLOAD_PROFILE,
         'batch_size': batch_size,
         'station_count': station_count,
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
@@ -156,8 +167,8 @@ def run_single_test(batch_size, station_count, iteration):
         'total_data_records': data_count,
         'total_summary_records': summary_count,
 
-        # 吞吐量（每秒处理的记录数）
-        'throughput_records_per_sec': batch_size / gen_stats['duration'] if gen_stats['duration'] > 0 else 0
+        # 吞吐量（每秒写入的记录数；突发与迟到负载下与 batch_size 不同）
+        'throughput_records_per_sec': data_count / gen_stats['duration'] if gen_stats['duration'] > 0 else 0
     }
 
     print(f"    - 总耗时: {result['total_duration_sec']:.3f}s")
@@ -176,6 +187,7 @@ def run_performance_tests():
     print("  - 平台: Azure Functions (Python)")
     print("  - 数据库: Azure SQL Database")
     print("  - 触发机制: Timer Trigger + Change Tracking")
+    print(f"  - 负载模式: {WORKLOAD_PROFILE}")
 
     # 测试配置组合
     test_configs = [
@@ -309,6 +321,8 @@ def generate_summary_report(results):
 def main():
     """主函数"""
     try:
+        get_profile(WORKLOAD_PROFILE)
+
         # 运行性能测试
         results = run_performance_tests()
 
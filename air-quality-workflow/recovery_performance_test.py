@@ -0,0 +1,134 @@
+"""
+恢复性能测试 - 同步版本落后于 CHANGE_TRACKING_MIN_VALID_VERSION 时，
+按 recorded_at 分区并行重扫 air_quality_data 的耗时与缺口大小、并行度的关系
+
+Azure SQL 的 Change Tracking 清理无法按需触发，本脚本通过本地 SQLite 后端
+（SQL_BACKEND=sqlite）的 cleanup_change_tracking 人为制造缺口。
+"""
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from unittest.mock import Mock
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+os.environ["SQL_BACKEND"] = "sqlite"
+
+from GenerateAirQualityData import _generate_readings
+from ProcessAirQualitySummary import main as process_main
+from azure_sql import get_sql_connection
+from azure_sql.sqlite_backend import cleanup_change_tracking
+from bulk_insert import write_readings
+
+# --- 配置 --- #
+GAP_SIZES = [10000, 100000, 1000000]
+WORKER_COUNTS = [1, 4]
+PARTITIONS = 8
+STATION_COUNT = 15
+SEED_CHUNK_SIZE = 50000
+OUTPUT_FILE = "recovery_results.csv"
+# --- END 配置 --- #
+
+SUMMARY_TABLES = [
+    "air_quality_summary",
+    "air_quality_station_summary",
+    "air_quality_window_summary",
+    "air_quality_contribution",
+]
+
+
+def current_version(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()")
+    version = cur.fetchone()[0] or 0
+    cur.close()
+    return version
+
+
+def reset_database(conn):
+    with conn.cursor() as cur:
+        for table in SUMMARY_TABLES:
+            cur.execute(f"DELETE FROM {table}")
+        cur.execute("DELETE FROM air_quality_data")
+    conn.commit()
+
+
+def create_gap(conn, count):
+    """写入 count 条记录后清理变更历史，使同步版本落后于最小有效版本"""
+    written = 0
+    while written < count:
+        size = min(SEED_CHUNK_SIZE, count - written)
+        write_readings(conn, _generate_readings(size, STATION_COUNT), strategy="fast_executemany")
+        conn.commit()
+        written += size
+    cleanup_change_tracking(conn, min_valid_version=current_version(conn))
+
+
+def rewind(conn):
+    """清空汇总并把同步版本退回 0，让每种并行度都从同一个缺口开始恢复"""
+    with conn.cursor() as cur:
+        for table in SUMMARY_TABLES:
+            cur.execute(f"DELETE FROM {table}")
+        cur.execute("UPDATE air_quality_sync_state SET last_version = 0 WHERE id = 1")
+    conn.commit()
+
+
+def run_recovery(workers):
+    os.environ["SUMMARY_RECOVERY_WORKERS"] = str(workers)
+    os.environ["SUMMARY_RECOVERY_PARTITIONS"] = str(PARTITIONS)
+    mock_timer = Mock()
+    mock_timer.past_due = False
+    start = time.perf_counter()
+    process_main(mock_timer)
+    return time.perf_counter() - start
+
+
+def main():
+    print("=" * 80)
+    print("恢复性能测试: 缺口大小 × 并行度")
+    print("=" * 80)
+
+    conn = get_sql_connection()
+    results = []
+    try:
+        for gap in GAP_SIZES:
+            print(f"\n缺口: {gap:,} 条")
+            reset_database(conn)
+            print("  写入测试数据并清理变更历史...", end=" ")
+            create_gap(conn, gap)
+            print("✓")
+
+            for workers in WORKER_COUNTS:
+                rewind(conn)
+                duration = run_recovery(workers)
+                cur = conn.cursor()
+                cur.execute("SELECT SUM(record_count) FROM air_quality_summary")
+                recovered = cur.fetchone()[0] or 0
+                cur.close()
+                results.append({
+                    'gap_rows': gap,
+                    'workers': workers,
+                    'partitions': PARTITIONS,
+                    'duration_sec': duration,
+                    'records_recovered': recovered,
+                    'records_per_sec': recovered / duration if duration > 0 else 0,
+                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                })
+                print(f"  {workers} 个连接  {duration:>9.3f}s  恢复 {recovered:,} 条  "
+                      f"{results[-1]['records_per_sec']:>12,.0f} 条/秒")
+        reset_database(conn)
+    finally:
+        conn.close()
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
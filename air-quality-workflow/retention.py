@@ -0,0 +1,164 @@
+"""Retention purge for ``air_quality_data``.
+
+Readings older than the retention period are deleted in small batches, each
+its own short transaction, so the one-minute ingest function never waits
+behind a long-running delete. A batch stays below SQL Server's lock
+escalation threshold of 5000 locks. The ids of every deleted batch are
+removed from ``air_quality_contribution`` in the same transaction. The
+summaries already hold these readings and are left alone: the delete
+entries Change Tracking records for the purged rows find no contribution to
+correct.
+
+Partitions cannot be switched out, because SQL Server refuses partition
+switches on change-tracked tables. When ``init_database.py`` created the
+table on the daily partition scheme (``AIR_QUALITY_PARTITIONING=daily``),
+:func:`maintain_partitions` does the partition housekeeping instead. It
+merges boundaries whose partitions the purge has emptied and splits new
+empty partitions ahead of the ingest. Both are metadata-only operations on
+empty partitions. They run under a short ``LOCK_TIMEOUT``, so a queued
+schema lock cannot stall inserts.
+"""
+
+import datetime
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+DEFAULT_RETENTION_DAYS = 30
+DEFAULT_BATCH_SIZE = 4000
+DEFAULT_DAYS_AHEAD = 7
+PARTITION_FUNCTION = "pf_air_quality_day"
+PARTITION_SCHEME = "ps_air_quality_day"
+DDL_LOCK_TIMEOUT_MS = 5000
+
+
+class PurgeResult(NamedTuple):
+    rows: int
+    ledger_rows: int
+    batches: int
+    duration_sec: float
+    complete: bool
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.duration_sec if self.duration_sec > 0 else 0.0
+
+
+def retention_cutoff(now: datetime.datetime, days: int) -> datetime.datetime:
+    return now - datetime.timedelta(days=days)
+
+
+def purge_expired(
+    conn,
+    cutoff: datetime.datetime,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    deadline: Optional[float] = None,
+    pause_sec: float = 0.0,
+) -> PurgeResult:
+    """Delete readings recorded before ``cutoff`` in ``batch_size`` batches.
+
+    Each batch commits on its own. The purge stops once nothing is left, or
+    when ``deadline`` (a ``time.monotonic()`` value) has passed; the next
+    run continues from there. ``pause_sec`` leaves a gap between batches
+    for other writers.
+    """
+    start = time.perf_counter()
+    rows = ledger_rows = batches = 0
+    complete = False
+    cursor = conn.cursor()
+    try:
+        while True:
+            cursor.execute(
+                """
+                DELETE TOP (?) FROM air_quality_data
+                OUTPUT deleted.id
+                WHERE recorded_at < ?
+                """,
+                batch_size,
+                cutoff,
+            )
+            ids = [(row[0],) for row in cursor.fetchall()]
+            if ids:
+                cursor.fast_executemany = True
+                cursor.executemany("DELETE FROM air_quality_contribution WHERE row_id = ?", ids)
+                ledger_rows += max(cursor.rowcount, 0)
+            conn.commit()
+            rows += len(ids)
+            batches += 1
+            if len(ids) < batch_size:
+                complete = True
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if pause_sec:
+                time.sleep(pause_sec)
+    finally:
+        cursor.close()
+    return PurgeResult(rows, ledger_rows, batches, time.perf_counter() - start, complete)
+
+
+def daily_boundaries(first: datetime.date, last: datetime.date) -> List[datetime.date]:
+    return [first + datetime.timedelta(days=n) for n in range((last - first).days + 1)]
+
+
+def _boundaries(cursor) -> List[datetime.datetime]:
+    cursor.execute(
+        """
+        SELECT CAST(prv.value AS DATETIME2)
+        FROM sys.partition_range_values AS prv
+        JOIN sys.partition_functions AS pf ON pf.function_id = prv.function_id
+        WHERE pf.name = ?
+        ORDER BY prv.boundary_id
+        """,
+        PARTITION_FUNCTION,
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _partition_rows(cursor, partition_number: int) -> int:
+    cursor.execute(
+        """
+        SELECT SUM(rows) FROM sys.partitions
+        WHERE object_id = OBJECT_ID('air_quality_data') AND index_id IN (0, 1) AND partition_number = ?
+        """,
+        partition_number,
+    )
+    return cursor.fetchone()[0] or 0
+
+
+def maintain_partitions(
+    conn, cutoff: datetime.datetime, today: datetime.date, days_ahead: int = DEFAULT_DAYS_AHEAD
+) -> Tuple[int, int]:
+    """Merge emptied daily partitions and add empty ones ahead; returns (merged, added).
+
+    Does nothing when the table is not partitioned.
+    """
+    cursor = conn.cursor()
+    try:
+        boundaries = _boundaries(cursor)
+        if not boundaries:
+            return 0, 0
+        cursor.execute(f"SET LOCK_TIMEOUT {DDL_LOCK_TIMEOUT_MS}")
+        merged = 0
+        # RANGE RIGHT: after each merge, partition 2 is [boundaries[index], boundaries[index + 1]).
+        for index in range(len(boundaries) - 1):
+            if boundaries[index + 1] > cutoff or _partition_rows(cursor, 2) > 0:
+                break
+            cursor.execute(
+                f"ALTER PARTITION FUNCTION {PARTITION_FUNCTION}() MERGE RANGE ('{boundaries[index]:%Y-%m-%d}')"
+            )
+            conn.commit()
+            merged += 1
+
+        added = 0
+        last = boundaries[-1].date()
+        for day in daily_boundaries(last + datetime.timedelta(days=1), today + datetime.timedelta(days=days_ahead)):
+            cursor.execute(f"ALTER PARTITION SCHEME {PARTITION_SCHEME} NEXT USED [PRIMARY]")
+            cursor.execute(f"ALTER PARTITION FUNCTION {PARTITION_FUNCTION}() SPLIT RANGE ('{day:%Y-%m-%d}')")
+            conn.commit()
+            added += 1
+        return merged, added
+    finally:
+        # The connection goes back to the pool; do not leave the short timeout on it.
+        conn.rollback()
+        cursor.execute("SET LOCK_TIMEOUT -1")
+        cursor.close()
@@ -0,0 +1,157 @@
+"""
+保留期清理性能测试 - 不同删除批大小下的清理速度（行/秒），以及清理期间每分钟写入函数的插入延迟
+
+清理前先运行一次 ProcessAirQualitySummary，使过期读数都已计入汇总；清理后再运行一次，
+检查汇总记录数只增加了清理期间新写入的读数，没有因为删除而减少（air_quality_contribution 中对应的记录随批删除）。
+"""
+import csv
+import datetime
+import json
+import os
+import statistics
+import threading
+import time
+from unittest.mock import Mock
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+from ProcessAirQualitySummary import main as process_main
+from azure_sql import get_sql_connection
+from bulk_insert import write_readings
+from reading_generator import generate_batch
+from retention import purge_expired, retention_cutoff
+
+# --- 配置 --- #
+EXPIRED_ROWS = 200000
+BATCH_SIZES = [1000, 4000, 20000]
+# 批与批之间的间隔，与 PurgeAirQualityData 的 RETENTION_BATCH_PAUSE_MS 默认值一致
+BATCH_PAUSE_SEC = 0.02
+RETENTION_DAYS = 30
+STATION_COUNT = 15
+SEED_CHUNK_SIZE = 10000
+# 清理期间模拟写入函数：每隔 INGEST_INTERVAL 秒写入 INGEST_BATCH 条
+INGEST_BATCH = 20
+INGEST_INTERVAL = 0.05
+OUTPUT_FILE = "retention_results.csv"
+# --- END 配置 --- #
+
+SUMMARY_TABLES = [
+    "air_quality_summary",
+    "air_quality_station_summary",
+    "air_quality_window_summary",
+    "air_quality_contribution",
+    "air_quality_partition_state",
+]
+
+
+def reset_database(conn):
+    with conn.cursor() as cur:
+        for table in SUMMARY_TABLES:
+            cur.execute(f"DELETE FROM {table}")
+        cur.execute("DELETE FROM air_quality_data")
+        cur.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()")
+        version = cur.fetchone()[0] or 0
+        cur.execute("UPDATE air_quality_sync_state SET last_version = ? WHERE id = 1", version)
+    conn.commit()
+
+
+def seed_expired(conn, count, cutoff):
+    """写入 count 条早于保留期的读数，每个分块相隔 1 分钟"""
+    start = cutoff - datetime.timedelta(days=10)
+    for chunk, offset in enumerate(range(0, count, SEED_CHUNK_SIZE)):
+        size = min(SEED_CHUNK_SIZE, count - offset)
+        recorded_at = start + datetime.timedelta(minutes=chunk)
+        write_readings(conn, generate_batch(size, STATION_COUNT, recorded_at=recorded_at), strategy="fast_executemany")
+        conn.commit()
+
+
+def summarized_rows(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT SUM(record_count) FROM air_quality_summary")
+    count = cur.fetchone()[0] or 0
+    cur.close()
+    return count
+
+
+def run_processor():
+    mock_timer = Mock()
+    mock_timer.past_due = False
+    process_main(mock_timer)
+
+
+def ingest_while(stop, latencies):
+    """在独立连接上按固定间隔写入，记录每次写入（含提交）的延迟"""
+    conn = get_sql_connection()
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            write_readings(conn, generate_batch(INGEST_BATCH, STATION_COUNT), strategy="values")
+            conn.commit()
+            latencies.append(time.perf_counter() - start)
+            time.sleep(INGEST_INTERVAL)
+    finally:
+        conn.close()
+
+
+def main():
+    print("=" * 80)
+    print(f"保留期清理性能测试: {EXPIRED_ROWS:,} 条过期读数")
+    print("=" * 80)
+
+    cutoff = retention_cutoff(datetime.datetime.utcnow(), RETENTION_DAYS)
+    conn = get_sql_connection()
+    results = []
+    try:
+        for batch_size in BATCH_SIZES:
+            reset_database(conn)
+            seed_expired(conn, EXPIRED_ROWS, cutoff)
+            run_processor()
+            before = summarized_rows(conn)
+
+            stop = threading.Event()
+            latencies = []
+            ingest = threading.Thread(target=ingest_while, args=(stop, latencies))
+            ingest.start()
+            time.sleep(0.5)
+            try:
+                result = purge_expired(conn, cutoff, batch_size, pause_sec=BATCH_PAUSE_SEC)
+            finally:
+                stop.set()
+                ingest.join()
+
+            run_processor()
+            after = summarized_rows(conn)
+            latencies.sort()
+            results.append({
+                'batch_size': batch_size,
+                'rows_purged': result.rows,
+                'ledger_rows_purged': result.ledger_rows,
+                'batches': result.batches,
+                'duration_sec': result.duration_sec,
+                'rows_per_sec': result.rows_per_sec,
+                'ingest_writes': len(latencies),
+                'ingest_p50_ms': statistics.median(latencies) * 1000 if latencies else 0,
+                'ingest_max_ms': latencies[-1] * 1000 if latencies else 0,
+                'summaries_kept': after == before + len(latencies) * INGEST_BATCH,
+                'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            })
+            row = results[-1]
+            mark = "✓" if row['summaries_kept'] else "✗"
+            print(f"  {mark} 批大小 {batch_size:>6,}  清理 {result.rows:,} 条 / {result.batches} 批  "
+                  f"{result.duration_sec:>7.2f}s ({result.rows_per_sec:>10,.0f} 行/秒)  "
+                  f"写入延迟 p50 {row['ingest_p50_ms']:.1f}ms / 最大 {row['ingest_max_ms']:.1f}ms")
+        reset_database(conn)
+    finally:
+        conn.close()
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Downsample ``air_quality_data`` into hourly and daily per-station aggregates.
+
+Closed hours are rolled from raw readings into ``air_quality_hourly``, and
+closed days from those hourly rows into ``air_quality_daily``. A query over
+months of history then reads one row per station and day instead of every
+reading.
+
+Each level keeps a watermark in ``air_quality_rollup_state``: the end of
+the last period it rolled. A run covers at most ``max_periods`` periods
+after the watermark. It deletes whatever rows already exist for them,
+inserts them again from the level below, and advances the watermark, all
+in one transaction. A run that fails, or is repeated over the same range,
+therefore leaves the same result, and a backlog drains over several runs.
+
+An hour counts as closed ``grace`` after it ends. Readings that arrive even
+later are not added to an hour that was already rolled; the time-window
+summaries in ``air_quality_window_summary`` do take them in.
+"""
+
+import datetime
+from typing import NamedTuple, Optional
+
+DEFAULT_GRACE_MINUTES = 5
+DEFAULT_MAX_HOURS = 24 * 7
+DEFAULT_MAX_DAYS = 31
+BASE = "'2000-01-01'"
+
+HOUR = datetime.timedelta(hours=1)
+DAY = datetime.timedelta(days=1)
+
+
+class RollupResult(NamedTuple):
+    level: str
+    periods: int
+    rows: int
+    watermark: Optional[datetime.datetime]
+
+
+def hour_floor(value: datetime.datetime) -> datetime.datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def day_floor(value: datetime.datetime) -> datetime.datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _as_datetime(value):
+    # SQLite returns MIN() of a DATETIME2 column as text.
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+def read_watermark(cursor, level: str) -> Optional[datetime.datetime]:
+    cursor.execute("SELECT watermark FROM air_quality_rollup_state WHERE level = ?", level)
+    row = cursor.fetchone()
+    return _as_datetime(row[0]) if row else None
+
+
+def save_watermark(cursor, level: str, watermark: datetime.datetime):
+    cursor.execute(
+        "UPDATE air_quality_rollup_state SET watermark = ?, updated_at = SYSUTCDATETIME() WHERE level = ?",
+        watermark,
+        level,
+    )
+    if cursor.rowcount == 0:
+        cursor.execute(
+            "INSERT INTO air_quality_rollup_state (level, watermark, updated_at) VALUES (?, ?, SYSUTCDATETIME())",
+            level,
+            watermark,
+        )
+
+
+def _first_period(cursor, table: str, column: str, floor) -> Optional[datetime.datetime]:
+    cursor.execute(f"SELECT MIN({column}) FROM {table}")
+    first = _as_datetime(cursor.fetchone()[0])
+    return floor(first) if first is not None else None
+
+
+def rollup_hours(cursor, start: datetime.datetime, end: datetime.datetime) -> int:
+    """Rebuild the hourly rows in ``[start, end)`` from raw readings; returns rows written."""
+    cursor.execute("DELETE FROM air_quality_hourly WHERE hour_start >= ? AND hour_start < ?", start, end)
+    cursor.execute(
+        f"""
+        INSERT INTO air_quality_hourly (station_id, hour_start, record_count, sum_aqi, avg_aqi, max_pm25, min_o3)
+        SELECT station_id, DATEADD(HOUR, DATEDIFF(HOUR, {BASE}, recorded_at), {BASE}),
+               COUNT(*), SUM(CAST(aqi AS FLOAT)), AVG(CAST(aqi AS FLOAT)), MAX(pm25), MIN(o3)
+        FROM air_quality_data
+        WHERE recorded_at >= ? AND recorded_at < ?
+        GROUP BY station_id, DATEDIFF(HOUR, {BASE}, recorded_at)
+        """,
+        start,
+        end,
+    )
+    return cursor.rowcount
+
+
+def rollup_days(cursor, start: datetime.datetime, end: datetime.datetime) -> int:
+    """Rebuild the daily rows in ``[start, end)`` from the hourly rows; returns rows written."""
+    cursor.execute("DELETE FROM air_quality_daily WHERE day_start >= ? AND day_start < ?", start, end)
+    cursor.execute(
+        f"""
+        INSERT INTO air_quality_daily (station_id, day_start, record_count, sum_aqi, avg_aqi, max_pm25, min_o3)
+        SELECT station_id, DATEADD(DAY, DATEDIFF(DAY, {BASE}, hour_start), {BASE}),
+               SUM(record_count), SUM(sum_aqi), SUM(sum_aqi) / SUM(record_count), MAX(max_pm25), MIN(min_o3)
+        FROM air_quality_hourly
+        WHERE hour_start >= ? AND hour_start < ?
+        GROUP BY station_id, DATEDIFF(DAY, {BASE}, hour_start)
+        """,
+        start,
+        end,
+    )
+    return cursor.rowcount
+
+
+def run_hourly(
+    cursor,
+    now: datetime.datetime,
+    grace: datetime.timedelta = datetime.timedelta(minutes=DEFAULT_GRACE_MINUTES),
+    max_periods: int = DEFAULT_MAX_HOURS,
+) -> RollupResult:
+    """Roll the closed hours after the hourly watermark. The caller commits."""
+    closed = hour_floor(now - grace)
+    start = read_watermark(cursor, "hourly")
+    first = _first_period(cursor, "air_quality_data", "recorded_at", hour_floor)
+    if start is None or (first is not None and first > start):
+        # Never rebuild hours whose raw readings the retention purge has already removed.
+        start = first
+    if start is None or start >= closed:
+        return RollupResult("hourly", 0, 0, start)
+    end = min(closed, start + HOUR * max_periods)
+    rows = rollup_hours(cursor, start, end)
+    save_watermark(cursor, "hourly", end)
+    return RollupResult("hourly", (end - start) // HOUR, rows, end)
+
+
+def run_daily(cursor, max_periods: int = DEFAULT_MAX_DAYS) -> RollupResult:
+    """Roll the days the hourly level has completely covered. The caller commits."""
+    hourly = read_watermark(cursor, "hourly")
+    if hourly is None:
+        return RollupResult("daily", 0, 0, None)
+    closed = day_floor(hourly)
+    start = read_watermark(cursor, "daily") or _first_period(cursor, "air_quality_hourly", "hour_start", day_floor)
+    if start is None or start >= closed:
+        return RollupResult("daily", 0, 0, start)
+    end = min(closed, start + DAY * max_periods)
+    rows = rollup_days(cursor, start, end)
+    save_watermark(cursor, "daily", end)
+    return RollupResult("daily", (end - start) // DAY, rows, end)
@@ -0,0 +1,171 @@
+"""
+降采样性能测试 - 把数月的原始读数汇总成按小时/按天的分站聚合，
+比较长时间范围查询直接扫描原始数据与读取按天聚合的耗时和读取行数
+
+同时检查：按天聚合的记录数与原始数据一致；把水位退回后重跑得到相同结果（幂等）。
+"""
+import csv
+import datetime
+import json
+import os
+import time
+from unittest.mock import Mock
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+from RollupAirQualityData import main as rollup_main
+from azure_sql import get_sql_connection
+from bulk_insert import write_readings
+from reading_generator import generate_batch
+
+# --- 配置 --- #
+HISTORY_DAYS = 90
+ROWS_PER_HOUR = 450
+STATION_COUNT = 15
+OUTPUT_FILE = "rollup_results.csv"
+# --- END 配置 --- #
+
+ROLLUP_TABLES = ["air_quality_hourly", "air_quality_daily", "air_quality_rollup_state"]
+
+
+def reset_database(conn):
+    with conn.cursor() as cur:
+        for table in ROLLUP_TABLES:
+            cur.execute(f"DELETE FROM {table}")
+        cur.execute("DELETE FROM air_quality_data")
+    conn.commit()
+
+
+def seed_history(conn, start):
+    """每小时写入 ROWS_PER_HOUR 条读数，覆盖 HISTORY_DAYS 天"""
+    for hour in range(HISTORY_DAYS * 24):
+        recorded_at = start + datetime.timedelta(hours=hour, minutes=30)
+        write_readings(conn, generate_batch(ROWS_PER_HOUR, STATION_COUNT, recorded_at=recorded_at), strategy="fast_executemany")
+        if hour % 24 == 23:
+            conn.commit()
+    conn.commit()
+
+
+def daily_watermark(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT watermark FROM air_quality_rollup_state WHERE level = 'daily'")
+    row = cur.fetchone()
+    cur.close()
+    return row[0] if row else None
+
+
+def rollup_until_caught_up(conn):
+    """重复运行降采样函数直到按天水位不再前进，返回 (运行次数, 总耗时)"""
+    mock_timer = Mock()
+    mock_timer.past_due = False
+    runs = 0
+    duration = 0.0
+    watermark = None
+    while True:
+        start = time.perf_counter()
+        rollup_main(mock_timer)
+        duration += time.perf_counter() - start
+        runs += 1
+        previous, watermark = watermark, daily_watermark(conn)
+        if watermark is None or watermark == previous:
+            return runs, duration
+
+
+def timed_query(conn, sql, *params):
+    cur = conn.cursor()
+    start = time.perf_counter()
+    cur.execute(sql, *params)
+    rows = cur.fetchall()
+    duration = time.perf_counter() - start
+    cur.close()
+    return rows, duration
+
+
+def snapshot(conn):
+    rows, _ = timed_query(
+        conn, "SELECT station_id, day_start, record_count, avg_aqi, max_pm25, min_o3 FROM air_quality_daily ORDER BY station_id, day_start"
+    )
+    return [tuple(row) for row in rows]
+
+
+def main():
+    print("=" * 80)
+    print(f"降采样性能测试: {HISTORY_DAYS} 天 × 每小时 {ROWS_PER_HOUR} 条 × {STATION_COUNT} 个测站")
+    print("=" * 80)
+
+    today = datetime.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today - datetime.timedelta(days=HISTORY_DAYS)
+    conn = get_sql_connection()
+    results = []
+    try:
+        reset_database(conn)
+        print("  写入历史数据...", end=" ")
+        seed_history(conn, start)
+        print("✓")
+
+        runs, rollup_sec = rollup_until_caught_up(conn)
+        print(f"  降采样完成: {runs} 次运行, 共 {rollup_sec:.2f}s")
+
+        raw, raw_sec = timed_query(
+            conn,
+            """
+            SELECT station_id, COUNT(*), AVG(CAST(aqi AS FLOAT)), MAX(pm25), MIN(o3)
+            FROM air_quality_data WHERE recorded_at >= ? AND recorded_at < ?
+            GROUP BY station_id
+            """,
+            start,
+            today,
+        )
+        daily, daily_sec = timed_query(
+            conn,
+            """
+            SELECT station_id, SUM(record_count), SUM(sum_aqi) / SUM(record_count), MAX(max_pm25), MIN(min_o3)
+            FROM air_quality_daily WHERE day_start >= ? AND day_start < ?
+            GROUP BY station_id
+            """,
+            start,
+            today,
+        )
+        counts, _ = timed_query(conn, "SELECT (SELECT COUNT(*) FROM air_quality_data), (SELECT COUNT(*) FROM air_quality_daily)")
+        raw_rows, daily_rows = counts[0]
+        consistent = sorted((r[0], r[1]) for r in raw) == sorted((r[0], r[1]) for r in daily)
+
+        before = snapshot(conn)
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM air_quality_rollup_state")
+        conn.commit()
+        rollup_until_caught_up(conn)
+        idempotent = snapshot(conn) == before
+
+        results.append({
+            'history_days': HISTORY_DAYS,
+            'raw_rows': raw_rows,
+            'daily_rows': daily_rows,
+            'rollup_sec': rollup_sec,
+            'raw_query_sec': raw_sec,
+            'daily_query_sec': daily_sec,
+            'speedup': raw_sec / daily_sec if daily_sec > 0 else 0,
+            'consistent': consistent,
+            'idempotent': idempotent,
+            'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        print(f"\n  {HISTORY_DAYS} 天分站汇总查询:")
+        print(f"    原始数据: 读取 {raw_rows:>10,} 行  {raw_sec * 1000:>9.1f}ms")
+        print(f"    按天聚合: 读取 {daily_rows:>10,} 行  {daily_sec * 1000:>9.1f}ms  (快 {results[-1]['speedup']:.0f} 倍)")
+        print(f"  {'✓' if consistent else '✗'} 按天聚合的记录数与原始数据一致")
+        print(f"  {'✓' if idempotent else '✗'} 退回水位重跑结果相同")
+        reset_database(conn)
+    finally:
+        conn.close()
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+饱和负载测试 - 多个工作进程各自模拟一部分测站（共数千个），按开环目标速率（条/秒）持续写入，
+逐级提高目标速率，记录实际写入速率、排队延迟与错误率，绘制饱和曲线，找出写入路径跟不上负载的位置
+
+开环：每个工作进程每 TICK_SECONDS 秒应写入一批，上一批写得慢不会推迟下一批的计划时间，
+排队延迟从计划时间算起（load_generator.py）。
+负载模式（workload_profiles.py）通过命令行参数或 WORKLOAD_PROFILE 选择，例如：
+    python saturation_load_test.py realistic
+"""
+import csv
+import datetime
+import json
+import os
+import sys
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+from azure_sql import get_backend, get_sql_connection
+from load_generator import run_stage, saturation_point
+
+# --- 配置 --- #
+WORKERS = 4
+STATION_COUNT = 2000
+TARGET_RATES = [1000, 2000, 5000, 10000, 20000, 40000, 80000]
+STAGE_SECONDS = 20
+TICK_SECONDS = 1.0
+# 出现饱和后再多跑几级，让曲线越过拐点
+STAGES_AFTER_SATURATION = 1
+WORKLOAD_PROFILE = sys.argv[1] if len(sys.argv) > 1 else os.getenv("WORKLOAD_PROFILE", "sampled")
+BULK_INSERT_STRATEGY = os.getenv("BULK_INSERT_STRATEGY", "auto")
+OUTPUT_FILE = "saturation_results.csv"
+CHART_FILE = "saturation_curve.png"
+# --- END 配置 --- #
+
+
+def clear_data():
+    conn = get_sql_connection()
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM air_quality_data")
+    conn.commit()
+    conn.close()
+
+
+def stage_row(stage):
+    return {
+        'workload_profile': WORKLOAD_PROFILE,
+        'workers': stage.workers,
+        'stations': stage.stations,
+        'target_rows_per_sec': stage.target_rows_per_sec,
+        'achieved_rows_per_sec': stage.achieved_rows_per_sec,
+        'committed_rows': stage.committed_rows,
+        'batches': len(stage.batches),
+        'backlog_batches': stage.backlog_batches,
+        'errors': stage.errors,
+        'error_rate': stage.error_rate,
+        'queue_delay_p50_sec': stage.queue_delay_percentile(50),
+        'queue_delay_p95_sec': stage.queue_delay_percentile(95),
+        'queue_delay_p99_sec': stage.queue_delay_percentile(99),
+        'latency_p95_sec': stage.latency_percentile(95),
+        'keeping_up': stage.keeping_up,
+        'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def plot_saturation_curve(rows, saturated_at):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("  ✗ 未安装 matplotlib，跳过饱和曲线图")
+        return
+
+    targets = [row['target_rows_per_sec'] for row in rows]
+    fig, axes = plt.subplots(1, 3, figsize=(18, 5))
+
+    axes[0].plot(targets, targets, '--', color='gray', label='Target')
+    axes[0].plot(targets, [row['achieved_rows_per_sec'] for row in rows], 'o-', label='Achieved')
+    axes[0].set_title('Achieved vs Target Rate')
+    axes[0].set_ylabel('Rows/sec')
+
+    for pct in (50, 95, 99):
+        axes[1].plot(targets, [max(row[f'queue_delay_p{pct}_sec'], 1e-4) for row in rows], 'o-', label=f'p{pct}')
+    axes[1].axhline(TICK_SECONDS, linestyle='--', color='gray', label='Tick')
+    axes[1].set_yscale('log')
+    axes[1].set_title('Queueing Delay')
+    axes[1].set_ylabel('Seconds')
+
+    axes[2].plot(targets, [row['error_rate'] * 100 for row in rows], 'o-', color='red')
+    axes[2].set_title('Error Rate')
+    axes[2].set_ylabel('%')
+
+    for ax in axes:
+        ax.set_xscale('log')
+        ax.set_xlabel('Target rows/sec')
+        ax.grid(True, alpha=0.3)
+        if saturated_at is not None:
+            ax.axvline(saturated_at, color='orange', alpha=0.6)
+    axes[0].legend()
+    axes[1].legend()
+    fig.suptitle(f'Ingest saturation ({get_backend()}, {WORKERS} workers, {STATION_COUNT} stations, {WORKLOAD_PROFILE})')
+    fig.tight_layout()
+    fig.savefig(CHART_FILE, dpi=150)
+    plt.close(fig)
+    print(f"✓ 饱和曲线已保存到: {CHART_FILE}")
+
+
+def main():
+    print("=" * 80)
+    print(f"饱和负载测试 ({get_backend()} 后端, {WORKERS} 个工作进程, {STATION_COUNT} 个测站, "
+          f"负载模式 {WORKLOAD_PROFILE}, 每级 {STAGE_SECONDS}s)")
+    print("=" * 80)
+    print(f"\n{'目标(条/秒)':>12} {'实际(条/秒)':>12} {'排队 p50':>10} {'p95':>9} {'p99':>9} "
+          f"{'错误率':>7} {'积压批次':>8}")
+
+    stages = []
+    rows = []
+    remaining = None
+    for rate in TARGET_RATES:
+        clear_data()
+        stage = run_stage(
+            rate,
+            WORKERS,
+            STATION_COUNT,
+            STAGE_SECONDS,
+            tick_sec=TICK_SECONDS,
+            profile=WORKLOAD_PROFILE,
+            strategy=BULK_INSERT_STRATEGY,
+        )
+        stages.append(stage)
+        rows.append(stage_row(stage))
+        print(f"{rate:>12,} {stage.achieved_rows_per_sec:>12,.0f} {stage.queue_delay_percentile(50):>9.3f}s "
+              f"{stage.queue_delay_percentile(95):>8.3f}s {stage.queue_delay_percentile(99):>8.3f}s "
+              f"{stage.error_rate * 100:>6.1f}% {stage.backlog_batches:>8}  {'✓' if stage.keeping_up else '✗'}")
+        if remaining is None and not stage.keeping_up:
+            remaining = STAGES_AFTER_SATURATION
+        elif remaining is not None:
+            remaining -= 1
+        if remaining == 0:
+            break
+    clear_data()
+
+    saturated = saturation_point(stages)
+    sustained = [stage for stage in stages if stage.keeping_up]
+    print()
+    if saturated is None:
+        print(f"  ✓ 最高目标速率 {TARGET_RATES[-1]:,} 条/秒下写入路径仍能跟上")
+    else:
+        print(f"  ✗ 目标速率 {saturated.target_rows_per_sec:,} 条/秒时写入路径跟不上 "
+              f"(实际 {saturated.achieved_rows_per_sec:,.0f} 条/秒, 排队 p95 {saturated.queue_delay_percentile(95):.3f}s, "
+              f"错误率 {saturated.error_rate * 100:.1f}%)")
+    if sustained:
+        best = max(sustained, key=lambda stage: stage.achieved_rows_per_sec)
+        print(f"  可持续的最高速率: {best.achieved_rows_per_sec:,.0f} 条/秒")
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=rows[0].keys())
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+    plot_saturation_curve(rows, saturated.target_rows_per_sec if saturated else None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""Durable local write-behind spool for readings.
+
+Readings are appended to local segment files first and drained into SQL
+later by :func:`flush`, so a one-minute ingest does not wait on the database
+and a database outage only makes the spool grow.
+
+Each append is one record: a ``<length, crc32>`` header followed by a JSON
+payload holding the append time and the rows. Records go to the newest
+segment file; once it reaches ``segment_bytes`` a new one is started.
+Segments are named by a number derived from the wall clock in
+milliseconds and always increasing. A wiped spool directory therefore
+never reuses numbers below an offset that was already flushed. ``fsync``
+controls durability:
+
+- ``always``: fsync after every append, so an acknowledged append survives
+  power loss.
+- ``interval``: fsync at most every ``fsync_interval_sec``.
+- ``never``: leave it to the OS, so appends survive a process crash but not
+  a host crash.
+
+A crash can leave a torn record at the end of the newest segment. Opening
+the spool truncates the file back to the last record whose checksum
+matches.
+
+The flushed position ``(segment, byte position)`` lives in
+``air_quality_spool_state``. It is updated in the same transaction as the
+rows it covers, so a crash before the commit replays those rows and a
+crash after it never does. Segments wholly before that position are then
+deleted. A small ``offset`` file next to the segments caches the last
+flushed position. It only decides whether a flush is due without asking
+the database, and is never trusted for correctness.
+
+One process appends to and flushes a spool directory at a time; the
+timer-triggered ingest function runs as a singleton.
+"""
+
+import datetime
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from bulk_insert import DEFAULT_CHUNK_SIZE, write_readings
+
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+DEFAULT_FLUSH_MAX_ROWS = 50000
+FSYNC_MODES = ("always", "interval", "never")
+
+_HEADER = struct.Struct("<II")
+_SUFFIX = ".seg"
+_OFFSET_FILE = "offset"
+
+
+class SpoolOffset(NamedTuple):
+    segment: int
+    position: int
+
+
+class SpoolBatch(NamedTuple):
+    rows: List[Tuple]
+    records: int
+    end: SpoolOffset
+    oldest_appended_at: Optional[float]
+
+
+class FlushResult(NamedTuple):
+    rows: int
+    transactions: int
+    segments_deleted: int
+    duration_sec: float
+    offset: SpoolOffset
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.duration_sec if self.duration_sec > 0 else 0.0
+
+
+START = SpoolOffset(0, 0)
+
+
+def _encode(rows: Sequence[Tuple]) -> bytes:
+    payload = {
+        "at": time.time(),
+        "rows": [[station, recorded_at.isoformat(), pm25, pm10, o3, aqi] for station, recorded_at, pm25, pm10, o3, aqi in rows],
+    }
+    data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(len(data), zlib.crc32(data)) + data
+
+
+def _decode(data: bytes):
+    payload = json.loads(data)
+    rows = [
+        (station, datetime.datetime.fromisoformat(recorded_at), pm25, pm10, o3, aqi)
+        for station, recorded_at, pm25, pm10, o3, aqi in payload["rows"]
+    ]
+    return payload["at"], rows
+
+
+def _records(handle):
+    """Yield ``(end_position, payload_bytes)`` for every intact record from the handle's position."""
+    while True:
+        header = handle.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        length, crc = _HEADER.unpack(header)
+        data = handle.read(length)
+        if len(data) < length or zlib.crc32(data) != crc:
+            return
+        yield handle.tell(), data
+
+
+class Spool:
+    """Segmented append-only spool in ``directory``."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        fsync: str = "always",
+        fsync_interval_sec: float = 1.0,
+    ):
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"Unknown spool fsync mode {fsync!r}; expected one of {FSYNC_MODES}")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.fsync_interval_sec = fsync_interval_sec
+        self._lock = threading.Lock()
+        self._handle = None
+        self._last_fsync = 0.0
+        os.makedirs(directory, exist_ok=True)
+        segments = self.segments()
+        self._active = segments[-1] if segments else None
+        if self._active is not None:
+            self._truncate_torn_tail(self._active)
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:020d}{_SUFFIX}")
+
+    def segments(self) -> List[int]:
+        return sorted(int(name[:-len(_SUFFIX)]) for name in os.listdir(self.directory) if name.endswith(_SUFFIX))
+
+    def _truncate_torn_tail(self, segment: int):
+        path = self._path(segment)
+        end = 0
+        with open(path, "rb") as handle:
+            for end, _ in _records(handle):
+                pass
+        if end < os.path.getsize(path):
+            with open(path, "r+b") as handle:
+                handle.truncate(end)
+                os.fsync(handle.fileno())
+
+    def _roll(self):
+        if self._handle is not None:
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+            self._handle.close()
+        now_ms = int(time.time() * 1000)
+        self._active = max(now_ms, (self._active or 0) + 1)
+        self._handle = open(self._path(self._active), "ab")
+        self._sync_directory()
+
+    def _sync_directory(self):
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def append(self, rows: Sequence[Tuple]) -> int:
+        """Append ``rows`` as one record; returns the bytes written."""
+        record = _encode(rows)
+        with self._lock:
+            if self._handle is None and self._active is not None:
+                self._handle = open(self._path(self._active), "ab")
+            if self._handle is None or self._handle.tell() >= self.segment_bytes:
+                self._roll()
+            self._handle.write(record)
+            self._handle.flush()
+            now = time.monotonic()
+            if self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval_sec):
+                os.fsync(self._handle.fileno())
+                self._last_fsync = now
+        return len(record)
+
+    def read(self, start: SpoolOffset, max_rows: Optional[int] = None) -> SpoolBatch:
+        """Read whole records after ``start`` until at least ``max_rows`` rows (or everything)."""
+        rows: List[Tuple] = []
+        records = 0
+        oldest = None
+        end = start
+        for segment in self.segments():
+            if segment < start.segment:
+                continue
+            with open(self._path(segment), "rb") as handle:
+                if segment == start.segment:
+                    handle.seek(start.position)
+                for position, data in _records(handle):
+                    appended_at, record_rows = _decode(data)
+                    rows.extend(record_rows)
+                    records += 1
+                    oldest = appended_at if oldest is None else oldest
+                    end = SpoolOffset(segment, position)
+                    if max_rows is not None and len(rows) >= max_rows:
+                        return SpoolBatch(rows, records, end, oldest)
+        return SpoolBatch(rows, records, end, oldest)
+
+    def delete_before(self, offset: SpoolOffset) -> int:
+        """Delete segments wholly before ``offset``; returns how many were removed."""
+        deleted = 0
+        with self._lock:
+            for segment in self.segments():
+                if segment >= offset.segment or segment == self._active:
+                    break
+                os.remove(self._path(segment))
+                deleted += 1
+        return deleted
+
+    def cached_offset(self) -> SpoolOffset:
+        try:
+            with open(os.path.join(self.directory, _OFFSET_FILE), encoding="utf-8") as handle:
+                segment, position = handle.read().split()
+            return SpoolOffset(int(segment), int(position))
+        except (OSError, ValueError):
+            return START
+
+    def cache_offset(self, offset: SpoolOffset):
+        path = os.path.join(self.directory, _OFFSET_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as handle:
+            handle.write(f"{offset.segment} {offset.position}")
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        with self._lock:
+            if self._handle is not None:
+                self._handle.flush()
+                os.fsync(self._handle.fileno())
+                self._handle.close()
+                self._handle = None
+
+
+def read_offset(cursor, spool_id: str) -> SpoolOffset:
+    cursor.execute("SELECT segment, position FROM air_quality_spool_state WHERE spool_id = ?", spool_id)
+    row = cursor.fetchone()
+    return SpoolOffset(row[0], row[1]) if row else START
+
+
+def save_offset(cursor, spool_id: str, offset: SpoolOffset):
+    cursor.execute(
+        "UPDATE air_quality_spool_state SET segment = ?, position = ?, updated_at = SYSUTCDATETIME() WHERE spool_id = ?",
+        offset.segment,
+        offset.position,
+        spool_id,
+    )
+    if cursor.rowcount == 0:
+        cursor.execute(
+            "INSERT INTO air_quality_spool_state (spool_id, segment, position, updated_at) VALUES (?, ?, ?, SYSUTCDATETIME())",
+            spool_id,
+            offset.segment,
+            offset.position,
+        )
+
+
+def flush_due(spool: Spool, min_rows: int, max_age_sec: float) -> bool:
+    """Whether the rows after the cached offset reach ``min_rows`` or the oldest is ``max_age_sec`` old."""
+    pending = spool.read(spool.cached_offset(), max_rows=min_rows)
+    if not pending.rows:
+        return False
+    return len(pending.rows) >= min_rows or time.time() - pending.oldest_appended_at >= max_age_sec
+
+
+def flush(
+    conn,
+    spool: Spool,
+    spool_id: str,
+    max_rows: int = DEFAULT_FLUSH_MAX_ROWS,
+    strategy: str = "auto",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    deadline: Optional[float] = None,
+) -> FlushResult:
+    """Drain the spool into ``air_quality_data``, about ``max_rows`` rows per transaction.
+
+    Stops when the spool is empty or ``deadline`` (a ``time.monotonic()``
+    value) has passed. Each transaction inserts its rows and advances the
+    stored offset together.
+    """
+    start = time.perf_counter()
+    rows = transactions = 0
+    cursor = conn.cursor()
+    try:
+        offset = read_offset(cursor, spool_id)
+        while True:
+            batch = spool.read(offset, max_rows=max_rows)
+            if not batch.records:
+                break
+            write_readings(conn, batch.rows, strategy=strategy, chunk_size=chunk_size)
+            save_offset(cursor, spool_id, batch.end)
+            conn.commit()
+            offset = batch.end
+            rows += len(batch.rows)
+            transactions += 1
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+    finally:
+        cursor.close()
+    spool.cache_offset(offset)
+    deleted = spool.delete_before(offset)
+    return FlushResult(rows, transactions, deleted, time.perf_counter() - start, offset)
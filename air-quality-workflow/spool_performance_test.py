@@ -0,0 +1,216 @@
+"""
+本地写入缓冲区性能测试 - 比较每分钟一批直接写入 SQL 与先追加到本地缓冲区（INGEST_MODE=spool）的写入延迟，
+不同 fsync 模式下的追加延迟，以及把积压一次性大事务写入 SQL 的吞吐量
+
+同时检查：
+- 数据库不可用期间缓冲区照常接收读数，恢复后全部写入且没有重复；
+- 写入缓冲区的进程在写入 SQL 途中被强制结束（SIGKILL）后重新写入，记录数与追加的完全一致；
+- 缓冲区文件末尾有写了一半的记录时，重新打开后被截掉，之后的追加与读取不受影响。
+"""
+import csv
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+from azure_sql import get_backend, get_sql_connection
+from bulk_insert import write_readings
+from reading_generator import generate_batch
+from spool import Spool, flush
+
+# --- 配置 --- #
+BATCH_SIZE = 20
+STATION_COUNT = 8
+BATCHES = 500
+FSYNC_MODES = ["always", "interval", "never"]
+FLUSH_MAX_ROWS = 50000
+CRASH_BATCHES = 5000
+CRASH_FLUSH_ROWS = 2000
+CRASH_AFTER_SEC = 1.0
+OUTPUT_FILE = "spool_results.csv"
+# --- END 配置 --- #
+
+SPOOL_ID = "spool-performance-test"
+
+
+def reset_database(conn):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM air_quality_data")
+        cur.execute("DELETE FROM air_quality_spool_state WHERE spool_id = ?", SPOOL_ID)
+    conn.commit()
+
+
+def count_rows(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM air_quality_data")
+    total = cur.fetchone()[0]
+    cur.execute("SELECT COUNT(*) FROM (SELECT DISTINCT station_id, recorded_at, pm25, pm10, o3 FROM air_quality_data) AS d")
+    distinct = cur.fetchone()[0]
+    cur.close()
+    return total, distinct
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def make_batch(minute):
+    recorded_at = datetime.datetime(2025, 1, 1) + datetime.timedelta(minutes=minute)
+    return generate_batch(BATCH_SIZE, STATION_COUNT, recorded_at=recorded_at).rows()
+
+
+def direct_latencies(conn):
+    """每批直接写入并提交（原 GenerateAirQualityData 的做法）"""
+    latencies = []
+    for minute in range(BATCHES):
+        rows = make_batch(minute)
+        start = time.perf_counter()
+        write_readings(conn, rows)
+        conn.commit()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def spool_latencies(directory, fsync):
+    spool = Spool(directory, fsync=fsync)
+    latencies = []
+    for minute in range(BATCHES):
+        rows = make_batch(minute)
+        start = time.perf_counter()
+        spool.append(rows)
+        latencies.append(time.perf_counter() - start)
+    spool.close()
+    return latencies
+
+
+def latency_row(mode, latencies, **extra):
+    row = {
+        'mode': mode,
+        'batches': len(latencies),
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'flush_rows': '',
+        'flush_transactions': '',
+        'flush_rows_per_sec': '',
+        'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    row.update(extra)
+    return row
+
+
+def flush_in_child(directory):
+    conn = get_sql_connection()
+    flush(conn, Spool(directory), SPOOL_ID, max_rows=CRASH_FLUSH_ROWS)
+
+
+def check_outage(conn, directory):
+    """数据库不可用时写入缓冲区失败但读数保留，恢复后全部写入"""
+    reset_database(conn)
+    spool = Spool(directory, fsync="never")
+    for minute in range(BATCHES):
+        spool.append(make_batch(minute))
+    broken = get_sql_connection()
+    broken.close()
+    try:
+        flush(broken, spool, SPOOL_ID)
+        failed = False
+    except Exception:  # pylint: disable=broad-except
+        failed = True
+    flush(conn, spool, SPOOL_ID)
+    total, distinct = count_rows(conn)
+    spool.close()
+    return failed and total == distinct == BATCHES * BATCH_SIZE
+
+
+def check_crash(conn, directory):
+    """写入 SQL 途中强制结束进程，再次写入后记录数与追加的完全一致"""
+    reset_database(conn)
+    spool = Spool(directory, fsync="never")
+    for minute in range(CRASH_BATCHES):
+        spool.append(make_batch(minute))
+    spool.close()
+    child = multiprocessing.Process(target=flush_in_child, args=(directory,))
+    child.start()
+    time.sleep(CRASH_AFTER_SEC)
+    child.kill()
+    child.join()
+    partial, _ = count_rows(conn)
+    flush(conn, Spool(directory), SPOOL_ID)
+    total, distinct = count_rows(conn)
+    return partial, total == distinct == CRASH_BATCHES * BATCH_SIZE
+
+
+def check_torn_tail(directory):
+    spool = Spool(directory)
+    spool.append(make_batch(0))
+    spool.close()
+    segment = os.path.join(directory, os.listdir(directory)[0])
+    with open(segment, "ab") as handle:
+        handle.write(b"\x40\x00\x00\x00\x01\x02\x03\x04{\"at\":")
+    spool = Spool(directory)
+    spool.append(make_batch(1))
+    batch = spool.read(spool.cached_offset())
+    spool.close()
+    return batch.records == 2 and len(batch.rows) == 2 * BATCH_SIZE
+
+
+def main():
+    print("=" * 80)
+    print(f"本地写入缓冲区性能测试 ({get_backend()} 后端, {BATCHES} 批 × {BATCH_SIZE} 条)")
+    print("=" * 80)
+
+    conn = get_sql_connection()
+    results = []
+    root = tempfile.mkdtemp(prefix="air_quality_spool_")
+    try:
+        reset_database(conn)
+        results.append(latency_row("direct", direct_latencies(conn)))
+
+        for fsync in FSYNC_MODES:
+            reset_database(conn)
+            directory = os.path.join(root, fsync)
+            latencies = spool_latencies(directory, fsync)
+            result = flush(conn, Spool(directory), SPOOL_ID, max_rows=FLUSH_MAX_ROWS)
+            results.append(latency_row(
+                f"spool_{fsync}",
+                latencies,
+                flush_rows=result.rows,
+                flush_transactions=result.transactions,
+                flush_rows_per_sec=result.rows_per_sec,
+            ))
+
+        print(f"\n{'方式':<16} {'写入延迟 p50':>12} {'p99':>10}   积压写入 SQL")
+        for row in results:
+            flushed = (f"{row['flush_rows']:,} 条 / {row['flush_transactions']} 个事务 "
+                       f"({row['flush_rows_per_sec']:,.0f} 条/秒)") if row['flush_rows'] != '' else "-"
+            print(f"{row['mode']:<16} {row['p50_ms']:>10.3f}ms {row['p99_ms']:>8.3f}ms   {flushed}")
+
+        outage_ok = check_outage(conn, os.path.join(root, "outage"))
+        print(f"\n  {'✓' if outage_ok else '✗'} 数据库不可用期间读数留在缓冲区，恢复后全部写入且没有重复")
+        partial, crash_ok = check_crash(conn, os.path.join(root, "crash"))
+        print(f"  {'✓' if crash_ok else '✗'} 写入途中强制结束（已写入 {partial:,} 条）后重新写入，记录数与追加的一致")
+        torn_ok = check_torn_tail(os.path.join(root, "torn"))
+        print(f"  {'✓' if torn_ok else '✗'} 末尾半条记录在重新打开时被截掉")
+        reset_database(conn)
+    finally:
+        conn.close()
+        shutil.rmtree(root, ignore_errors=True)
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Overlap reading generation with database writes through a bounded queue.
+
+A producer thread generates fixed-size chunks and hands them to the writer
+through a ``queue.Queue`` of ``queue_depth`` slots, so at most
+``queue_depth + 2`` chunks are alive at any time regardless of the total batch
+size, and the next chunk is generated while the previous one is on the wire.
+
+Memory is reported as the process's peak resident set size, which costs
+nothing to read. ``tracemalloc`` traces every allocation and slows the very
+path this module speeds up, so it only runs when asked for with
+``trace_memory``.
+"""
+
+import queue
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, NamedTuple, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_DONE = object()
+_PUT_POLL_SECONDS = 0.1
+
+# tracemalloc is process-wide; only one call may start and stop it at a time.
+_trace_lock = threading.Lock()
+
+
+class StreamingStats(NamedTuple):
+    rows: int
+    chunks: int
+    round_trips: int
+    wall_sec: float
+    generate_sec: float
+    write_sec: float
+    peak_rss_mb: Optional[float]
+    peak_traced_mb: Optional[float] = None
+
+    @property
+    def overlap_efficiency(self) -> float:
+        """Share of the shorter stage that was hidden behind the longer one (0 = serial, 1 = fully overlapped)."""
+        shorter = min(self.generate_sec, self.write_sec)
+        if shorter <= 0:
+            return 0.0
+        hidden = self.generate_sec + self.write_sec - self.wall_sec
+        return max(0.0, min(1.0, hidden / shorter))
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, or ``None`` where ``resource`` is unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _put(items: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=_PUT_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(items, stop, batch_size, chunk_size, make_chunk, timings):
+    try:
+        produced = 0
+        while produced < batch_size:
+            size = min(chunk_size, batch_size - produced)
+            start = time.perf_counter()
+            chunk = make_chunk(size)
+            timings["generate"] += time.perf_counter() - start
+            if not _put(items, chunk, stop):
+                return
+            produced += size
+        _put(items, _DONE, stop)
+    except BaseException as exc:  # pylint: disable=broad-except
+        _put(items, exc, stop)
+
+
+def stream_ingest(
+    batch_size: int,
+    chunk_size: int,
+    queue_depth: int,
+    make_chunk: Callable[[int], object],
+    write_chunk: Callable[[object], object],
+    trace_memory: bool = False,
+) -> StreamingStats:
+    """Generate ``batch_size`` rows in chunks on a background thread and write them as they arrive.
+
+    ``make_chunk(n)`` returns ``n`` readings; ``write_chunk(chunk)`` writes them
+    and may return a ``BulkWriteResult`` whose round trips are accumulated.
+    Committing is left to the caller.
+
+    ``peak_rss_mb`` is the process-wide peak, so it also covers whatever ran
+    before this call. With ``trace_memory`` the allocations of this call are
+    traced as well and ``peak_traced_mb`` is their peak; it stays ``None``
+    when another call or an outer caller is already tracing, since their
+    numbers would be mixed in.
+    """
+    if chunk_size < 1 or queue_depth < 1:
+        raise ValueError("chunk_size and queue_depth must be at least 1")
+
+    owns_tracing = trace_memory and _trace_lock.acquire(blocking=False)
+    if owns_tracing and tracemalloc.is_tracing():
+        _trace_lock.release()
+        owns_tracing = False
+    if owns_tracing:
+        tracemalloc.start()
+
+    items = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+    timings = {"generate": 0.0}
+    producer = threading.Thread(
+        target=_produce,
+        args=(items, stop, batch_size, chunk_size, make_chunk, timings),
+        name="reading-generator",
+        daemon=True,
+    )
+
+    rows = chunks = round_trips = 0
+    write_sec = 0.0
+    start = time.perf_counter()
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            write_start = time.perf_counter()
+            result = write_chunk(item)
+            write_sec += time.perf_counter() - write_start
+            rows += len(item)
+            chunks += 1
+            round_trips += getattr(result, "round_trips", 1)
+            del item
+    finally:
+        stop.set()
+        producer.join()
+        wall_sec = time.perf_counter() - start
+        peak_traced = None
+        if owns_tracing:
+            peak_traced = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+            _trace_lock.release()
+
+    return StreamingStats(
+        rows=rows,
+        chunks=chunks,
+        round_trips=round_trips,
+        wall_sec=wall_sec,
+        generate_sec=timings["generate"],
+        write_sec=write_sec,
+        peak_rss_mb=peak_rss_mb(),
+        peak_traced_mb=peak_traced,
+    )
@@ -0,0 +1,200 @@
+"""Single-pass, constant-memory aggregation of air-quality readings.
+
+``SummaryAccumulator`` folds rows shaped like ``air_quality_data``
+(``station_id, recorded_at, pm25, pm10, o3, aqi``) into the values stored in
+``air_quality_summary``. It never keeps rows, so a backlog can be read with
+``cursor.fetchmany`` in batches of any size, and partial accumulators built
+from separate batches, partitions or workers combine with :meth:`merge`.
+The state is count, sum and sum of squares of ``aqi`` plus MAX/MIN, so a row
+can also be taken back out with :meth:`SummaryAccumulator.subtract` when a
+reading is updated or deleted.
+:func:`consume_changes` keeps one accumulator per ``station_id`` and, when
+asked, one per tumbling event-time bucket of ``recorded_at`` in the same pass,
+so memory is O(stations + buckets) rather than O(rows). :func:`rollup_windows`
+folds those buckets into each configured window size.
+"""
+
+import datetime
+import functools
+import math
+from typing import Dict, Iterable, Optional, Tuple
+
+DEFAULT_FETCH_SIZE = 5000
+DEFAULT_WINDOW_SECONDS = (300,)
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def bucket_index(recorded_at: datetime.datetime, seconds: int) -> int:
+    """Number of the ``seconds``-wide tumbling window, counted from the Unix epoch."""
+    return (recorded_at - EPOCH) // datetime.timedelta(seconds=seconds)
+
+
+def bucket_start(index: int, seconds: int) -> datetime.datetime:
+    return EPOCH + datetime.timedelta(seconds=index * seconds)
+
+
+def base_bucket_seconds(window_seconds: Iterable[int]) -> Optional[int]:
+    """Largest bucket that every window size is a whole multiple of."""
+    sizes = list(window_seconds)
+    return functools.reduce(math.gcd, sizes) if sizes else None
+
+
+class SummaryAccumulator:
+    __slots__ = ("count", "sum_aqi", "sum_sq_aqi", "max_pm25", "min_o3", "window_start", "window_end")
+
+    def __init__(self):
+        self.count = 0
+        self.sum_aqi = 0
+        self.sum_sq_aqi = 0
+        self.max_pm25 = None
+        self.min_o3 = None
+        self.window_start = None
+        self.window_end = None
+
+    @property
+    def avg_aqi(self):
+        return self.sum_aqi / self.count if self.count else None
+
+    @property
+    def stddev_aqi(self):
+        if not self.count:
+            return None
+        mean = self.sum_aqi / self.count
+        return math.sqrt(max(self.sum_sq_aqi / self.count - mean * mean, 0.0))
+
+    def add(self, row):
+        _, recorded_at, pm25, _, o3, aqi = row
+        self.count += 1
+        self.sum_aqi += aqi
+        self.sum_sq_aqi += aqi * aqi
+        if self.max_pm25 is None or pm25 > self.max_pm25:
+            self.max_pm25 = pm25
+        if self.min_o3 is None or o3 < self.min_o3:
+            self.min_o3 = o3
+        if self.window_start is None or recorded_at < self.window_start:
+            self.window_start = recorded_at
+        if self.window_end is None or recorded_at > self.window_end:
+            self.window_end = recorded_at
+        return self
+
+    @classmethod
+    def from_partial(cls, count, sum_aqi, sum_sq_aqi, max_pm25, min_o3, window_start, window_end):
+        """Rebuild an accumulator from an aggregate computed elsewhere (e.g. in SQL)."""
+        acc = cls()
+        acc.count = count
+        acc.sum_aqi = sum_aqi
+        acc.sum_sq_aqi = sum_sq_aqi
+        acc.max_pm25 = max_pm25
+        acc.min_o3 = min_o3
+        acc.window_start = window_start
+        acc.window_end = window_end
+        return acc
+
+    def subtract(self, row) -> bool:
+        """Take back a row previously added, in O(1).
+
+        Count and sums are exact. MAX/MIN cannot be inverted, so the return
+        value says whether the row held ``max_pm25`` or ``min_o3``; the caller
+        then has to recompute those two from the remaining rows.
+        """
+        _, _, pm25, _, o3, aqi = row
+        self.count -= 1
+        self.sum_aqi -= aqi
+        self.sum_sq_aqi -= aqi * aqi
+        if not self.count:
+            self.sum_aqi = self.sum_sq_aqi = 0
+            self.max_pm25 = self.min_o3 = None
+            return False
+        return pm25 >= self.max_pm25 or o3 <= self.min_o3
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add(row)
+        return self
+
+    def consume(self, cursor, fetch_size: int = DEFAULT_FETCH_SIZE):
+        """Drain the cursor's current result set ``fetch_size`` rows at a time."""
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                return self
+            self.add_rows(rows)
+
+    def merge(self, other: "SummaryAccumulator"):
+        """Fold another partial aggregate into this one."""
+        if not other.count:
+            return self
+        if not self.count:
+            for name in self.__slots__:
+                setattr(self, name, getattr(other, name))
+            return self
+        self.count += other.count
+        self.sum_aqi += other.sum_aqi
+        self.sum_sq_aqi += other.sum_sq_aqi
+        self.max_pm25 = max(self.max_pm25, other.max_pm25)
+        self.min_o3 = min(self.min_o3, other.min_o3)
+        self.window_start = min(self.window_start, other.window_start)
+        self.window_end = max(self.window_end, other.window_end)
+        return self
+
+    def __repr__(self):
+        return (
+            f"SummaryAccumulator(count={self.count}, avg_aqi={self.avg_aqi}, stddev_aqi={self.stddev_aqi}, max_pm25={self.max_pm25}, "
+            f"min_o3={self.min_o3}, window={self.window_start}..{self.window_end})"
+        )
+
+
+def consume_changes(
+    cursor, fetch_size: int = DEFAULT_FETCH_SIZE, bucket_seconds: Optional[int] = None
+) -> Tuple[Dict[str, SummaryAccumulator], Dict[int, SummaryAccumulator]]:
+    """Drain the cursor into accumulators per ``station_id`` and per ``recorded_at`` bucket.
+
+    Buckets are keyed by :func:`bucket_index`; with no ``bucket_seconds`` the
+    second dict stays empty.
+    """
+    by_station: Dict[str, SummaryAccumulator] = {}
+    by_bucket: Dict[int, SummaryAccumulator] = {}
+    width = datetime.timedelta(seconds=bucket_seconds) if bucket_seconds else None
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            return by_station, by_bucket
+        for row in rows:
+            acc = by_station.get(row[0])
+            if acc is None:
+                acc = by_station[row[0]] = SummaryAccumulator()
+            acc.add(row)
+            if width is not None:
+                index = (row[1] - EPOCH) // width
+                acc = by_bucket.get(index)
+                if acc is None:
+                    acc = by_bucket[index] = SummaryAccumulator()
+                acc.add(row)
+
+
+def rollup_windows(
+    by_bucket: Dict[int, SummaryAccumulator], bucket_seconds: int, window_seconds: Iterable[int]
+) -> Dict[Tuple[int, int], SummaryAccumulator]:
+    """Merge base buckets into ``(window_seconds, bucket_index)`` windows of each size.
+
+    Every size must be a multiple of ``bucket_seconds`` (see :func:`base_bucket_seconds`).
+    """
+    windows: Dict[Tuple[int, int], SummaryAccumulator] = {}
+    for size in window_seconds:
+        if size % bucket_seconds:
+            raise ValueError(f"Window of {size}s is not a multiple of the {bucket_seconds}s bucket")
+        factor = size // bucket_seconds
+        for index, acc in by_bucket.items():
+            key = (size, index // factor)
+            window = windows.get(key)
+            if window is None:
+                window = windows[key] = SummaryAccumulator()
+            window.merge(acc)
+    return windows
+
+
+def merge_all(accumulators: Iterable[SummaryAccumulator]) -> SummaryAccumulator:
+    total = SummaryAccumulator()
+    for acc in accumulators:
+        total.merge(acc)
+    return total
@@ -0,0 +1,110 @@
+"""Expiring leases on the checkpoint rows, so concurrent runners never process the same changes.
+
+Overlapping timer executions, or several instances of a scaled-out
+Function App, would otherwise read the same ``last_version`` and summarize
+the same changes twice. Before touching a partition a runner claims its
+checkpoint row (``air_quality_sync_state`` for the single-partition setup,
+``air_quality_partition_state`` otherwise) with one conditional ``UPDATE``:
+the row is taken only if it is free, its lease has expired, or the runner
+already owns it. The database serializes the update on the row lock, so
+exactly one runner wins and the others skip that partition at once.
+
+Every checkpoint write is fenced on ``lease_owner`` and renews the lease.
+A runner whose lease expired and was taken over therefore cannot commit:
+:func:`save_checkpoint` raises :class:`LeaseLost` and the slice, which
+shares the transaction, is rolled back.
+"""
+
+import os
+import socket
+import uuid
+from typing import Iterable, List, Tuple
+
+from summary_partitions import Partition
+
+DEFAULT_LEASE_SECONDS = 300
+
+
+class LeaseLost(Exception):
+    """The checkpoint row is now owned by another runner."""
+
+
+def new_owner() -> str:
+    """Identify this runner: the Function App instance (or host), process and a random suffix."""
+    instance = os.getenv("WEBSITE_INSTANCE_ID", "")[:12] or socket.gethostname()
+    return f"{instance}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _row(partition: Partition) -> Tuple[str, str, Tuple]:
+    if partition.count == 1:
+        return "air_quality_sync_state", "id = 1", ()
+    return (
+        "air_quality_partition_state",
+        "partition_count = ? AND partition_id = ?",
+        (partition.count, partition.index),
+    )
+
+
+def try_claim(cursor, partition: Partition, owner: str, seconds: int) -> bool:
+    """Take the lease on ``partition``'s checkpoint row; False if another runner holds it."""
+    table, key, params = _row(partition)
+    cursor.execute(
+        f"""
+        UPDATE {table}
+        SET lease_owner = ?, lease_expires_at = DATEADD(SECOND, ?, SYSUTCDATETIME())
+        WHERE {key}
+          AND (lease_owner IS NULL OR lease_owner = ? OR lease_expires_at < SYSUTCDATETIME())
+        """,
+        owner,
+        seconds,
+        *params,
+        owner,
+    )
+    return cursor.rowcount == 1
+
+
+def claim(cursor, partitions: Iterable[Partition], owner: str, seconds: int) -> Tuple[List[Partition], List[Partition]]:
+    """Try every partition; returns (claimed, held by other runners)."""
+    claimed, contended = [], []
+    for partition in partitions:
+        (claimed if try_claim(cursor, partition, owner, seconds) else contended).append(partition)
+    return claimed, contended
+
+
+def read_checkpoint(cursor, partition: Partition) -> int:
+    table, key, params = _row(partition)
+    cursor.execute(f"SELECT last_version FROM {table} WHERE {key}", *params)
+    return cursor.fetchone()[0] or 0
+
+
+def save_checkpoint(cursor, partition: Partition, version: int, owner: str, seconds: int):
+    """Advance the checkpoint and renew the lease, or raise :class:`LeaseLost`."""
+    table, key, params = _row(partition)
+    stamp = ", updated_at = SYSUTCDATETIME()" if partition.count > 1 else ""
+    cursor.execute(
+        f"""
+        UPDATE {table}
+        SET last_version = ?, lease_expires_at = DATEADD(SECOND, ?, SYSUTCDATETIME()){stamp}
+        WHERE {key} AND lease_owner = ?
+        """,
+        version,
+        seconds,
+        *params,
+        owner,
+    )
+    if cursor.rowcount != 1:
+        raise LeaseLost(f"Lease on partition {partition.index}/{partition.count} was taken over")
+
+
+def release(cursor, partitions: Iterable[Partition], owner: str):
+    for partition in partitions:
+        table, key, params = _row(partition)
+        cursor.execute(
+            f"""
+            UPDATE {table}
+            SET lease_owner = NULL, lease_expires_at = NULL
+            WHERE {key} AND lease_owner = ?
+            """,
+            *params,
+            owner,
+        )
@@ -0,0 +1,68 @@
+"""Hash partitioning of the change stream by ``station_id``.
+
+Partition ``i`` of ``n`` owns the stations with
+``(CHECKSUM(station_id) & 2147483647) % n = i`` and keeps its own checkpoint
+in ``air_quality_partition_state``, so partitions can be processed
+concurrently by threads of one invocation or by separate instances.
+
+``air_quality_sync_state`` remains the checkpoint of the single-partition
+setup. With several partitions it holds their low watermark (the minimum
+checkpoint). New partition rows start from that watermark whenever the
+partition count changes. Re-reading versions that were already processed is
+harmless, because ``air_quality_contribution`` keeps every row from being
+counted twice.
+
+Checkpoint rows carry a lease (see :mod:`summary_leases`) so that a
+partition is processed by one runner at a time.
+"""
+
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+DEFAULT_PARTITION_COUNT = 1
+
+
+class Partition(NamedTuple):
+    index: int
+    count: int
+
+    def filter(self, column: str) -> Tuple[str, Tuple]:
+        """SQL predicate (with a leading ``AND``) and parameters selecting this partition's rows."""
+        if self.count == 1:
+            return "", ()
+        return f"AND (CHECKSUM({column}) & 2147483647) % ? = ?", (self.count, self.index)
+
+
+SINGLE = Partition(0, 1)
+
+
+def partitions_for(count: int, indexes: Optional[Iterable[int]] = None) -> List[Partition]:
+    """The partitions this process handles: all of them, or only ``indexes`` when the work is spread over instances."""
+    if count < 1:
+        raise ValueError("Partition count must be at least 1")
+    wanted = range(count) if indexes is None else sorted(set(indexes))
+    for index in wanted:
+        if not 0 <= index < count:
+            raise ValueError(f"Partition {index} is outside 0..{count - 1}")
+    return [Partition(index, count) for index in wanted]
+
+
+def ensure_checkpoints(cursor, count: int, seed_version: int):
+    """Create the checkpoint rows of a ``count``-way split that do not exist yet, at ``seed_version``."""
+    cursor.execute(
+        "SELECT partition_id FROM air_quality_partition_state WHERE partition_count = ?",
+        count,
+    )
+    existing = {row[0] for row in cursor.fetchall()}
+    missing = [(count, index, seed_version, count, index) for index in range(count) if index not in existing]
+    if missing:
+        # Another runner may be seeding the same rows.
+        cursor.executemany(
+            """
+            INSERT INTO air_quality_partition_state (partition_count, partition_id, last_version, updated_at)
+            SELECT ?, ?, ?, SYSUTCDATETIME()
+            WHERE NOT EXISTS (
+                SELECT 1 FROM air_quality_partition_state WHERE partition_count = ? AND partition_id = ?
+            )
+            """,
+            missing,
+        )
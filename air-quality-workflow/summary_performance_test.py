@@ -0,0 +1,131 @@
+"""
+汇总聚合性能测试 - 比较数据库端聚合（SUMMARY_MODE=server）与 Python 端聚合（SUMMARY_MODE=python）
+在 10k / 100k / 1M 条待处理变更下的耗时与内存
+"""
+import csv
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+from unittest.mock import Mock
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+from GenerateAirQualityData import _generate_readings
+from ProcessAirQualitySummary import main as process_main
+from azure_sql import get_sql_connection
+from bulk_insert import write_readings
+
+# --- 配置 --- #
+PENDING_CHANGES = [10000, 100000, 1000000]
+MODES = ["server", "python"]
+STATION_COUNT = 15
+SEED_CHUNK_SIZE = 50000
+OUTPUT_FILE = "summary_results.csv"
+# --- END 配置 --- #
+
+
+def reset_database(conn):
+    """清空数据并返回当前 Change Tracking 版本"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM air_quality_summary")
+        cur.execute("DELETE FROM air_quality_window_summary")
+        cur.execute("DELETE FROM air_quality_contribution")
+        cur.execute("DELETE FROM air_quality_data")
+    conn.commit()
+    cur = conn.cursor()
+    cur.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()")
+    version = cur.fetchone()[0] or 0
+    cur.close()
+    return version
+
+
+def seed_changes(conn, count):
+    """写入 count 条记录作为待处理变更"""
+    written = 0
+    while written < count:
+        size = min(SEED_CHUNK_SIZE, count - written)
+        write_readings(conn, _generate_readings(size, STATION_COUNT), strategy="fast_executemany")
+        conn.commit()
+        written += size
+
+
+def rewind_sync_state(conn, version):
+    """把同步版本退回到写入前，让每种模式处理同一批变更"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM air_quality_summary")
+        cur.execute("DELETE FROM air_quality_window_summary")
+        cur.execute("DELETE FROM air_quality_contribution")
+        cur.execute("UPDATE air_quality_sync_state SET last_version = ? WHERE id = 1", version)
+    conn.commit()
+
+
+def run_mode(mode):
+    os.environ["SUMMARY_MODE"] = mode
+    mock_timer = Mock()
+    mock_timer.past_due = False
+    tracemalloc.start()
+    start = time.perf_counter()
+    process_main(mock_timer)
+    duration = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return duration, peak
+
+
+def main():
+    print("=" * 80)
+    print("汇总聚合性能测试: 数据库端聚合 vs Python 端聚合")
+    print("=" * 80)
+
+    conn = get_sql_connection()
+    results = []
+    try:
+        for pending in PENDING_CHANGES:
+            print(f"\n待处理变更: {pending:,} 条")
+            base_version = reset_database(conn)
+            print("  写入测试数据...", end=" ")
+            seed_changes(conn, pending)
+            print("✓")
+
+            for mode in MODES:
+                rewind_sync_state(conn, base_version)
+                duration, peak = run_mode(mode)
+                cur = conn.cursor()
+                cur.execute("SELECT SUM(record_count) FROM air_quality_summary")
+                row = cur.fetchone()
+                cur.close()
+                processed = row[0] or 0
+                results.append({
+                    'pending_changes': pending,
+                    'mode': mode,
+                    'duration_sec': duration,
+                    'peak_memory_mb': peak,
+                    'records_summarized': processed,
+                    'records_per_sec': processed / duration if duration > 0 else 0,
+                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                })
+                print(f"  {mode:<8} {duration:>9.3f}s  峰值内存 {peak:>9.2f} MB  汇总 {processed:,} 条")
+        reset_database(conn)
+    finally:
+        conn.close()
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+
+    print("\n" + "=" * 80)
+    for pending in PENDING_CHANGES:
+        by_mode = {r['mode']: r for r in results if r['pending_changes'] == pending}
+        if "server" in by_mode and "python" in by_mode and by_mode["server"]['duration_sec'] > 0:
+            speedup = by_mode["python"]['duration_sec'] / by_mode["server"]['duration_sec']
+            print(f"  {pending:>9,} 条变更: 数据库端聚合快 {speedup:.1f} 倍")
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
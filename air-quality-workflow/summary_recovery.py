@@ -0,0 +1,190 @@
+"""Rebuild summaries from ``air_quality_data`` when Change Tracking history is gone.
+
+If the processor falls behind ``CHANGE_TRACKING_MIN_VALID_VERSION`` the
+changes it missed were removed by retention cleanup and ``CHANGETABLE`` can
+no longer list them. ``air_quality_contribution`` still records every row
+that was summarized and the values it contributed, so the gap can be
+re-derived from the table itself:
+
+- rows with no contribution entry were never counted;
+- rows whose contribution differs from the current values, or whose row is
+  gone, need a correction.
+
+:func:`scan_gap` splits the ``recorded_at`` range into partitions and scans
+them concurrently, one connection per worker. Each scan aggregates in the
+database and returns only per ``(station_id, bucket)`` partial aggregates
+and the (usually few) rows that need a correction. The caller writes the
+merged result in a single transaction and then resumes incremental
+processing at the current version.
+"""
+
+import concurrent.futures
+import datetime
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from summary_aggregator import SummaryAccumulator, bucket_start
+
+DEFAULT_PARTITIONS = 8
+DEFAULT_WORKERS = 4
+
+# Rows never summarized. Changes after current_version (the CHANGETABLE
+# argument) are left for the next incremental run.
+_UNCOUNTED_ROWS = """
+    FROM air_quality_data AS a
+    LEFT JOIN air_quality_contribution AS l ON l.row_id = a.id
+    LEFT JOIN CHANGETABLE(CHANGES air_quality_data, ?) AS ct ON ct.id = a.id
+    WHERE l.row_id IS NULL
+      AND ct.id IS NULL
+"""
+
+
+class GapScan(NamedTuple):
+    by_station: Dict[str, SummaryAccumulator]
+    by_bucket: Dict[int, SummaryAccumulator]
+    corrections: List[Tuple]
+    partitions: int
+    duration_sec: float
+
+    @property
+    def rows(self) -> int:
+        return sum(acc.count for acc in self.by_station.values())
+
+
+def _as_datetime(value):
+    # SQLite returns MIN/MAX of a DATETIME2 column as text.
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+def time_partitions(lower: datetime.datetime, upper: datetime.datetime, count: int):
+    """Split ``[lower, upper]`` into ``count`` half-open ranges of equal width."""
+    upper = upper + datetime.timedelta(microseconds=1)
+    width = (upper - lower) / max(count, 1)
+    bounds = [lower + width * i for i in range(count)] + [upper]
+    return [(bounds[i], bounds[i + 1]) for i in range(count) if bounds[i] < bounds[i + 1]]
+
+
+def _time_range(cursor) -> Optional[Tuple[datetime.datetime, datetime.datetime]]:
+    cursor.execute(
+        """
+        SELECT MIN(recorded_at), MAX(recorded_at) FROM air_quality_data
+        UNION ALL
+        SELECT MIN(recorded_at), MAX(recorded_at) FROM air_quality_contribution
+        """
+    )
+    bounds = [(_as_datetime(lo), _as_datetime(hi)) for lo, hi in cursor.fetchall() if lo is not None]
+    if not bounds:
+        return None
+    return min(lo for lo, _ in bounds), max(hi for _, hi in bounds)
+
+
+def _scan_partition(cursor, current_version: int, lower, upper, bucket_seconds: int):
+    # Without time windows everything goes into one bucket per station.
+    cursor.execute(
+        f"""
+        SELECT b.station_id, b.bucket, COUNT(*), SUM(CAST(b.aqi AS FLOAT)), SUM(CAST(b.aqi AS FLOAT) * b.aqi),
+               MAX(b.pm25), MIN(b.o3), MIN(b.recorded_at), MAX(b.recorded_at)
+        FROM (
+            SELECT a.station_id, DATEDIFF_BIG(SECOND, '1970-01-01', a.recorded_at) / ? AS bucket,
+                   a.recorded_at, a.aqi, a.pm25, a.o3
+            {_UNCOUNTED_ROWS}
+              AND a.recorded_at >= ? AND a.recorded_at < ?
+        ) AS b
+        GROUP BY b.station_id, b.bucket
+        """,
+        bucket_seconds or 2 ** 40,
+        current_version,
+        lower,
+        upper,
+    )
+    partials = cursor.fetchall()
+
+    cursor.execute(
+        """
+        SELECT l.row_id, CASE WHEN a.id IS NULL THEN 'D' ELSE 'U' END, ?,
+               l.recorded_at, l.pm25, l.o3, l.aqi,
+               a.recorded_at, a.pm25, a.o3, a.aqi
+        FROM air_quality_contribution AS l
+        LEFT JOIN air_quality_data AS a ON a.id = l.row_id
+        WHERE l.recorded_at >= ? AND l.recorded_at < ?
+          AND (a.id IS NULL OR a.recorded_at <> l.recorded_at OR a.pm25 <> l.pm25
+               OR a.o3 <> l.o3 OR a.aqi <> l.aqi)
+        """,
+        current_version,
+        lower,
+        upper,
+    )
+    return partials, [tuple(row) for row in cursor.fetchall()]
+
+
+def scan_gap(
+    connect: Callable,
+    current_version: int,
+    bucket_seconds: Optional[int] = None,
+    partitions: int = DEFAULT_PARTITIONS,
+    workers: int = DEFAULT_WORKERS,
+) -> GapScan:
+    """Scan ``air_quality_data`` for everything the incremental path missed.
+
+    ``connect`` is a context manager factory such as
+    ``azure_sql.pooled_connection``; every worker holds its own connection
+    for one partition at a time. Nothing is written.
+    """
+    start = time.perf_counter()
+    with connect() as conn:
+        cursor = conn.cursor()
+        try:
+            time_range = _time_range(cursor)
+        finally:
+            cursor.close()
+    if time_range is None:
+        return GapScan({}, {}, [], 0, time.perf_counter() - start)
+    ranges = time_partitions(*time_range, partitions)
+
+    def scan(bounds):
+        with connect() as conn:
+            cursor = conn.cursor()
+            try:
+                return _scan_partition(cursor, current_version, *bounds, bucket_seconds)
+            finally:
+                cursor.close()
+
+    by_station: Dict[str, SummaryAccumulator] = {}
+    by_bucket: Dict[int, SummaryAccumulator] = {}
+    corrections: List[Tuple] = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for partials, partition_corrections in executor.map(scan, ranges):
+            corrections.extend(partition_corrections)
+            for station_id, bucket, count, sum_aqi, sum_sq_aqi, max_pm25, min_o3, first, last in partials:
+                partial = SummaryAccumulator.from_partial(
+                    count, sum_aqi, sum_sq_aqi, max_pm25, min_o3, _as_datetime(first), _as_datetime(last)
+                )
+                by_station.setdefault(station_id, SummaryAccumulator()).merge(partial)
+                if bucket_seconds:
+                    window = SummaryAccumulator.from_partial(
+                        count,
+                        sum_aqi,
+                        sum_sq_aqi,
+                        max_pm25,
+                        min_o3,
+                        bucket_start(bucket, bucket_seconds),
+                        bucket_start(bucket + 1, bucket_seconds),
+                    )
+                    by_bucket.setdefault(bucket, SummaryAccumulator()).merge(window)
+    return GapScan(by_station, by_bucket, corrections, len(ranges), time.perf_counter() - start)
+
+
+def record_recovered_contributions(cursor, current_version: int):
+    """Mark every row counted by :func:`scan_gap` as contributed at ``current_version``."""
+    cursor.execute(
+        f"""
+        INSERT INTO air_quality_contribution (row_id, row_version, station_id, recorded_at, pm25, o3, aqi)
+        SELECT a.id, ?, a.station_id, a.recorded_at, a.pm25, a.o3, a.aqi
+        {_UNCOUNTED_ROWS}
+          AND a.recorded_at IS NOT NULL
+        """,
+        current_version,
+        current_version,
+    )
@@ -1,4 +1,5 @@
 """完整工作流验证：多次数据生成 → Change Tracking → 汇总处理"""
+import asyncio
 import json
 import os
 import time
@@ -64,7 +65,7 @@ def main():
     # 第 1 轮：生成数据 → 处理汇总
     print_header("【第 1 轮】生成数据 → 处理汇总")
     print("步骤 1: 生成数据...", end=" ")
-    generate_main(mock_timer)
+    asyncio.run(generate_main(mock_timer))
     print("✓")
 
     data_count, summary_count, sync_version, ct_version = get_stats()
@@ -84,7 +85,7 @@ def main():
     # 第 2 轮
     print_header("【第 2 轮】生成数据 → 处理汇总")
     print("步骤 1: 生成数据...", end=" ")
-    generate_main(mock_timer)
+    asyncio.run(generate_main(mock_timer))
     print("✓")
 
     data_count_2, _, _, ct_version_2 = get_stats()
@@ -102,7 +103,7 @@ def main():
     # 第 3 轮
     print_header("【第 3 轮】生成数据 → 处理汇总")
     print("步骤 1: 生成数据...", end=" ")
-    generate_main(mock_timer)
+    asyncio.run(generate_main(mock_timer))
     print("✓")
 
     data_count_3, _, _, ct_version_3 = get_stats()
@@ -1,4 +1,5 @@
 """测试 GenerateAirQualityData 函数"""
+import asyncio
 import json
 import os
 import sys
@@ -40,7 +41,7 @@ def test_generate():
     # 调用函数
     print("\n正在生成数据...", end=" ")
     try:
-        generate_main(mock_timer)
+        asyncio.run(generate_main(mock_timer))
         print("✓")
     except Exception as e:
         print(f"✗\n错误: {e}")
@@ -0,0 +1,124 @@
+"""测试 SummaryAccumulator：单次遍历结果正确、merge 可合并、内存不随积压量增长"""
+import datetime
+import os
+import random
+import time
+import tracemalloc
+
+from summary_aggregator import SummaryAccumulator, base_bucket_seconds, bucket_index, consume_changes, rollup_windows
+
+BACKLOG_SIZES = [1000, 100000, 1000000]
+# 1000 万行的积压（tracemalloc 下约 45 秒）只在设置 SLOW_TESTS=1 时运行
+if os.getenv("SLOW_TESTS") == "1":
+    BACKLOG_SIZES.append(10000000)
+FETCH_SIZE = 5000
+
+
+class SyntheticCursor:
+    """模拟 fetchmany 分批读取大量变更：每批返回新的列表，行数据取自预先生成的模板"""
+
+    def __init__(self, total, seed=0, batch_template=FETCH_SIZE):
+        self.remaining = total
+        rng = random.Random(seed)
+        base = datetime.datetime(2025, 1, 1)
+        self.template = [
+            (
+                f"station-{rng.randint(1, 15)}",
+                base + datetime.timedelta(seconds=rng.randint(0, 86400)),
+                rng.uniform(5, 120),
+                rng.uniform(10, 150),
+                rng.uniform(5, 120),
+                rng.randint(6, 130),
+            )
+            for _ in range(batch_template)
+        ]
+
+    def fetchmany(self, size):
+        size = min(size, self.remaining, len(self.template))
+        self.remaining -= size
+        return self.template[:size]
+
+
+def naive_summary(rows):
+    """与原 _write_summary 相同的多次遍历计算"""
+    return {
+        'count': len(rows),
+        'avg_aqi': sum(r[5] for r in rows) / len(rows),
+        'max_pm25': max(r[2] for r in rows),
+        'min_o3': min(r[4] for r in rows),
+        'window_start': min(r[1] for r in rows),
+        'window_end': max(r[1] for r in rows),
+    }
+
+
+def test_matches_naive_and_merge():
+    rows = SyntheticCursor(20000, seed=42, batch_template=20000).fetchmany(20000)
+    expected = naive_summary(rows)
+
+    single = SummaryAccumulator().add_rows(rows)
+    merged = SummaryAccumulator()
+    for offset in range(0, len(rows), 3000):
+        merged.merge(SummaryAccumulator().add_rows(rows[offset:offset + 3000]))
+    merged.merge(SummaryAccumulator())
+
+    for acc in (single, merged):
+        assert acc.count == expected['count']
+        assert abs(acc.avg_aqi - expected['avg_aqi']) < 1e-9
+        assert acc.max_pm25 == expected['max_pm25']
+        assert acc.min_o3 == expected['min_o3']
+        assert acc.window_start == expected['window_start']
+        assert acc.window_end == expected['window_end']
+    print("✓ 单次遍历与 merge 结果与原多次遍历计算一致")
+
+
+def test_window_rollup():
+    rows = SyntheticCursor(20000, seed=7, batch_template=20000).fetchmany(20000)
+    sizes = [60, 300, 3600]
+    base = base_bucket_seconds(sizes)
+    cursor = SyntheticCursor(20000, seed=7, batch_template=20000)
+    _, by_bucket = consume_changes(cursor, len(rows), base)
+    windows = rollup_windows(by_bucket, base, sizes)
+
+    expected = {}
+    for row in rows:
+        for size in sizes:
+            expected.setdefault((size, bucket_index(row[1], size)), []).append(row)
+    assert set(windows) == set(expected)
+    for key, window_rows in expected.items():
+        summary = naive_summary(window_rows)
+        acc = windows[key]
+        assert acc.count == summary['count']
+        assert abs(acc.avg_aqi - summary['avg_aqi']) < 1e-9
+        assert acc.max_pm25 == summary['max_pm25']
+        assert acc.min_o3 == summary['min_o3']
+    print(f"✓ {len(windows)} 个时间窗口的汇总与逐窗口计算一致")
+
+
+def test_constant_memory():
+    print(f"\n{'积压行数':>12} {'耗时(s)':>10} {'峰值内存(MB)':>14}")
+    print("-" * 40)
+    peaks = []
+    for total in BACKLOG_SIZES:
+        cursor = SyntheticCursor(total)
+        tracemalloc.start()
+        start = time.perf_counter()
+        acc = SummaryAccumulator().consume(cursor, FETCH_SIZE)
+        duration = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+        assert acc.count == total
+        peaks.append(peak)
+        print(f"{total:>12,} {duration:>10.2f} {peak:>14.2f}")
+
+    # 峰值只取决于 fetchmany 的批大小，而不是积压总量
+    assert max(peaks) < min(peaks) * 1.5 + 0.5, peaks
+    print("✓ 峰值内存不随积压量增长")
+
+
+if __name__ == "__main__":
+    print("=" * 70)
+    print("测试 SummaryAccumulator")
+    print("=" * 70)
+    test_matches_naive_and_merge()
+    test_window_rollup()
+    test_constant_memory()
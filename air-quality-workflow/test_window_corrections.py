@@ -0,0 +1,181 @@
+"""测试窗口汇总的增量修正：已汇总的读数被更新/删除后，只按差值修正所属窗口，代价与窗口大小无关
+
+使用本地 SQLite 后端（临时数据库文件），不需要 Azure SQL。
+"""
+import datetime
+import os
+import tempfile
+import time
+from unittest.mock import Mock
+
+os.environ.update(
+    SQL_BACKEND="sqlite",
+    SQLITE_DATABASE_PATH=os.path.join(tempfile.mkdtemp(), "window_corrections.db"),
+    SQL_POOL_SIZE="1",
+    SUMMARY_WINDOW_SECONDS="3600",
+)
+
+from ProcessAirQualitySummary import main as process_main
+from azure_sql import get_connection_pool, get_sql_connection
+from bulk_insert import write_readings
+
+# --- 配置 --- #
+WINDOW_ROWS = {datetime.datetime(2025, 1, 1, 0): 1000, datetime.datetime(2025, 1, 1, 1): 100000}
+# --- END 配置 --- #
+
+
+def run_processor():
+    """运行一次汇总处理，返回 (耗时, SQLite 虚拟机指令数)"""
+    pool = get_connection_pool()
+    conn, _ = pool.acquire()
+    steps = [0]
+
+    def count_steps():
+        steps[0] += 1
+        return 0
+
+    # 每执行一条 VM 指令回调一次，用作“实际工作量”的计数
+    conn._raw.set_progress_handler(count_steps, 1)  # pylint: disable=protected-access
+    pool.release(conn)
+    timer = Mock()
+    timer.past_due = False
+    start = time.perf_counter()
+    try:
+        process_main(timer)
+    finally:
+        conn._raw.set_progress_handler(None, 0)  # pylint: disable=protected-access
+    return time.perf_counter() - start, steps[0]
+
+
+def expected_window(cursor, window_start):
+    cursor.execute(
+        """
+        SELECT COUNT(*), SUM(aqi), SUM(aqi * aqi), MAX(pm25), MIN(o3)
+        FROM air_quality_data
+        WHERE recorded_at >= ? AND recorded_at < ?
+        """,
+        window_start,
+        window_start + datetime.timedelta(hours=1),
+    )
+    return cursor.fetchone()
+
+
+def stored_window(cursor, window_start):
+    cursor.execute(
+        """
+        SELECT record_count, sum_aqi, sum_sq_aqi, max_pm25, min_o3
+        FROM air_quality_window_summary
+        WHERE window_seconds = 3600 AND window_start = ?
+        """,
+        window_start,
+    )
+    return cursor.fetchone()
+
+
+def assert_windows_match(conn):
+    cursor = conn.cursor()
+    for window_start in WINDOW_ROWS:
+        expected = expected_window(cursor, window_start)
+        stored = stored_window(cursor, window_start)
+        assert stored is not None, window_start
+        assert stored[0] == expected[0], (window_start, stored, expected)
+        assert abs(stored[1] - expected[1]) < 1e-6 and abs(stored[2] - expected[2]) < 1e-3, (stored, expected)
+        assert stored[3] == expected[3] and stored[4] == expected[4], (stored, expected)
+    cursor.close()
+
+
+def seed(conn):
+    for window_start, count in WINDOW_ROWS.items():
+        step = 3600 / count
+        rows = [
+            (
+                f"station-{i % 15 + 1}",
+                window_start + datetime.timedelta(seconds=i * step),
+                10.0 + i % 90,
+                20.0,
+                10.0 + i % 70,
+                20 + i % 80,
+            )
+            for i in range(count)
+        ]
+        write_readings(conn, rows)
+    conn.commit()
+
+
+def pick_row(conn, window_start):
+    """挑选窗口中既不是 MAX(pm25) 也不是 MIN(o3) 的一行"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, aqi FROM air_quality_data WHERE recorded_at = ? AND pm25 = 50 AND o3 = 50",
+        window_start + datetime.timedelta(seconds=3600 / WINDOW_ROWS[window_start] * 40),
+    )
+    row = cursor.fetchone()
+    cursor.close()
+    return row
+
+
+def check_update_is_constant_work(conn):
+    print(f"\n{'窗口行数':>10} {'耗时(s)':>10} {'VM 指令数':>12}")
+    print("-" * 36)
+    work = []
+    for window_start, count in WINDOW_ROWS.items():
+        row_id, aqi = pick_row(conn, window_start)
+        conn.execute("UPDATE air_quality_data SET aqi = ? WHERE id = ?", aqi + 7, row_id)
+        conn.commit()
+        duration, steps = run_processor()
+        work.append(steps)
+        print(f"{count:>10,} {duration:>10.4f} {steps:>12,}")
+        assert_windows_match(conn)
+
+    # 窗口大 100 倍，修正一行的工作量基本不变
+    assert max(work) < min(work) * 2, work
+    print("✓ 修正一条更新只做常数量的工作，结果与全量重算一致")
+
+
+def check_extremes_and_deletes(conn):
+    window_start = next(iter(WINDOW_ROWS))
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT TOP 1 id FROM air_quality_data WHERE recorded_at >= ? AND recorded_at < ? ORDER BY pm25 DESC",
+        window_start,
+        window_start + datetime.timedelta(hours=1),
+    )
+    max_row = cursor.fetchone()[0]
+    cursor.close()
+    conn.execute("UPDATE air_quality_data SET pm25 = 1 WHERE id = ?", max_row)
+    conn.execute(
+        "UPDATE air_quality_data SET recorded_at = ? WHERE id = (SELECT id FROM air_quality_data WHERE recorded_at = ?)",
+        window_start + datetime.timedelta(minutes=90),
+        window_start + datetime.timedelta(seconds=3600 / WINDOW_ROWS[window_start] * 3),
+    )
+    conn.execute(
+        "DELETE FROM air_quality_data WHERE recorded_at >= ? AND recorded_at < ?",
+        window_start + datetime.timedelta(minutes=10),
+        window_start + datetime.timedelta(minutes=20),
+    )
+    conn.commit()
+    run_processor()
+    assert_windows_match(conn)
+    print("✓ MAX 被改小、跨窗口移动、删除后窗口汇总仍与全量重算一致")
+
+
+def test_window_corrections():
+    # 各项检查依次修改同一个数据库，作为一个测试按顺序运行
+    print("=" * 70)
+    print("测试窗口汇总的增量修正")
+    print("=" * 70)
+    conn = get_sql_connection()
+    try:
+        seed(conn)
+        run_processor()
+        assert_windows_match(conn)
+        print("✓ 初始汇总与全量重算一致")
+        check_update_is_constant_work(conn)
+        check_extremes_and_deletes(conn)
+    finally:
+        conn.close()
+        get_connection_pool().close_all()
+
+
+if __name__ == "__main__":
+    test_window_corrections()
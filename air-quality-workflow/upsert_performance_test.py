@@ -0,0 +1,120 @@
+"""
+幂等写入性能测试 - 比较普通插入（fast_executemany、tvp）与按自然键 (station_id, recorded_at)
+幂等写入（upsert）在 1k/10k/100k 条时的耗时，以及把已写入的批次整批重放的耗时
+
+同时检查：重放后记录数不变；普通插入重放同一批次会被唯一索引拒绝，不会写入重复读数。
+"""
+import csv
+import datetime
+import json
+import os
+import time
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+from azure_sql import get_backend, get_sql_connection
+from bulk_insert import write_readings
+from reading_generator import generate_batch
+
+# --- 配置 --- #
+BATCH_SIZES = [1000, 10000, 100000]
+PLAIN_STRATEGIES = ["fast_executemany", "tvp"]
+STATION_COUNT = 15
+REPEATS = 3
+OUTPUT_FILE = "upsert_results.csv"
+# --- END 配置 --- #
+
+BASE_TIME = datetime.datetime(2025, 1, 1)
+
+
+def clear_data(conn):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM air_quality_data")
+    conn.commit()
+
+
+def count_rows(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM air_quality_data")
+    count = cur.fetchone()[0]
+    cur.close()
+    return count
+
+
+def timed_write(conn, rows, strategy):
+    start = time.perf_counter()
+    write_readings(conn, rows, strategy=strategy)
+    conn.commit()
+    return time.perf_counter() - start
+
+
+def median_of(conn, rows, strategy, replay=False):
+    """重复 REPEATS 次取中位数；replay 时先写入一次，再计时重放"""
+    durations = []
+    for _ in range(REPEATS):
+        clear_data(conn)
+        if replay:
+            write_readings(conn, rows, strategy=strategy)
+            conn.commit()
+        durations.append(timed_write(conn, rows, strategy))
+    return sorted(durations)[len(durations) // 2]
+
+
+def plain_replay_rejected(conn, rows):
+    clear_data(conn)
+    write_readings(conn, rows, strategy="fast_executemany")
+    conn.commit()
+    try:
+        write_readings(conn, rows, strategy="fast_executemany")
+        conn.commit()
+        return False
+    except Exception:  # pylint: disable=broad-except
+        conn.rollback()
+        return count_rows(conn) == len(rows)
+
+
+def main():
+    print("=" * 80)
+    print(f"幂等写入性能测试 ({get_backend()} 后端)")
+    print("=" * 80)
+
+    conn = get_sql_connection()
+    results = []
+    try:
+        for batch_size in BATCH_SIZES:
+            rows = generate_batch(batch_size, STATION_COUNT, recorded_at=BASE_TIME).rows()
+            print(f"\n{batch_size:,} 条")
+            timings = {strategy: median_of(conn, rows, strategy) for strategy in PLAIN_STRATEGIES}
+            timings["upsert"] = median_of(conn, rows, "upsert")
+            timings["upsert_replay"] = median_of(conn, rows, "upsert", replay=True)
+            replay_kept = count_rows(conn) == batch_size
+            rejected = plain_replay_rejected(conn, rows)
+            baseline = timings["fast_executemany"]
+            for mode, duration in timings.items():
+                results.append({
+                    'batch_size': batch_size,
+                    'mode': mode,
+                    'duration_sec': duration,
+                    'rows_per_sec': batch_size / duration if duration > 0 else 0,
+                    'overhead_vs_plain_pct': (duration / baseline - 1) * 100 if baseline > 0 else 0,
+                    'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                })
+                print(f"  {mode:<18} {duration:>8.3f}s ({batch_size / duration:>10,.0f} 条/秒)  "
+                      f"相对 fast_executemany {results[-1]['overhead_vs_plain_pct']:+6.1f}%")
+            print(f"  {'✓' if replay_kept else '✗'} upsert 重放后记录数仍为 {batch_size:,}")
+            print(f"  {'✓' if rejected else '✗'} 普通插入重放被唯一索引拒绝，没有写入重复读数")
+        clear_data(conn)
+    finally:
+        conn.close()
+
+    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\n✓ 结果已保存到: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+窗口汇总并发测试 - 多个线程各用一个连接，同时向同一批时间窗口合并与修正（_apply_window_deltas），
+模拟多个哈希分区（或多个实例）同时处理，检查新窗口不会撞上主键、修正不会覆盖其他分区已提交的合并，
+一个事务中修正一个窗口、合并另一个窗口时也不会因加锁顺序相反而死锁
+
+要验证真正的行锁与键范围锁，请在 Azure SQL（默认 READ_COMMITTED_SNAPSHOT）上运行：lease_stress_test.py 用的 SQLite
+串行化所有写事务，发现不了这类竞争；SQLite 后端上本测试只验证 WITH (UPDLOCK, HOLDLOCK) 的模拟。
+测试只使用 WINDOW_SECONDS 宽度的窗口（不在 SUMMARY_WINDOW_SECONDS 中），结束后删除这些窗口行。
+"""
+import concurrent.futures
+import datetime
+import json
+import os
+import threading
+
+# 加载配置
+cfg = json.load(open("local.settings.json", encoding="utf-8"))
+os.environ.update(cfg["Values"])
+
+from ProcessAirQualitySummary import _apply_window_deltas
+from azure_sql import get_backend, get_sql_connection
+from summary_aggregator import SummaryAccumulator, bucket_index, bucket_start
+
+# --- 配置 --- #
+THREADS = 8
+WINDOWS = 50
+WINDOW_SECONDS = 7
+ROWS_PER_MERGE = 10
+FIRST_WINDOW = datetime.datetime(2000, 1, 1)
+# --- END 配置 --- #
+
+# (pm25, o3, aqi)；修正的旧值与新值都不是窗口的 MAX/MIN，不需要重算，期望结果可以精确计算
+MERGED_VALUES = (50.0, 20.0, 10)
+OLD_VALUES = (30.0, 40.0, 10)
+NEW_VALUES = (30.0, 40.0, 14)
+
+
+def window_indexes():
+    first = bucket_index(FIRST_WINDOW, WINDOW_SECONDS)
+    return range(first, first + WINDOWS)
+
+
+def reading(index, values):
+    pm25, o3, aqi = values
+    return (None, bucket_start(index, WINDOW_SECONDS), pm25, None, o3, aqi)
+
+
+def merged(index):
+    return SummaryAccumulator().add_rows([reading(index, MERGED_VALUES)] * ROWS_PER_MERGE)
+
+
+def merge_all_windows(barrier):
+    def merge(cursor, index):
+        _apply_window_deltas(cursor, {}, {(WINDOW_SECONDS, index): merged(index)})
+
+    return run_per_window(barrier, merge)
+
+
+def correct_all_windows(barrier):
+    def correct(cursor, index):
+        added = SummaryAccumulator().add(reading(index, NEW_VALUES))
+        _apply_window_deltas(
+            cursor, {(WINDOW_SECONDS, index): [reading(index, OLD_VALUES)]}, {(WINDOW_SECONDS, index): added}
+        )
+
+    return run_per_window(barrier, correct)
+
+
+def correct_and_merge(barrier, reverse=False):
+    """每个事务修正一个窗口、合并到与之对称的另一个窗口，正序与倒序线程持有的窗口相同但先后相反"""
+    first = window_indexes()[0]
+
+    def correct_and_merge_pair(cursor, index):
+        if reverse:
+            index = first + WINDOWS - 1 - (index - first)
+        other = first + WINDOWS - 1 - (index - first)
+        removed = {(WINDOW_SECONDS, index): [reading(index, OLD_VALUES)]}
+        added = {(WINDOW_SECONDS, index): SummaryAccumulator().add(reading(index, NEW_VALUES))}
+        added.setdefault((WINDOW_SECONDS, other), SummaryAccumulator()).merge(merged(other))
+        _apply_window_deltas(cursor, removed, added)
+
+    return run_per_window(barrier, correct_and_merge_pair)
+
+
+def correct_and_merge_reversed(barrier):
+    return correct_and_merge(barrier, reverse=True)
+
+
+def run_per_window(barrier, action):
+    """每个窗口一个事务，与分区处理的提交粒度相同；返回出错次数"""
+    errors = 0
+    conn = get_sql_connection()
+    try:
+        barrier.wait()
+        for index in window_indexes():
+            try:
+                with conn.cursor() as cursor:
+                    action(cursor, index)
+                conn.commit()
+            except Exception as exc:  # pylint: disable=broad-except
+                conn.rollback()
+                errors += 1
+                print(f"  ✗ {threading.current_thread().name}: {exc}")
+    finally:
+        conn.close()
+    return errors
+
+
+def run_concurrently(tasks):
+    barrier = threading.Barrier(len(tasks))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        futures = [executor.submit(task, barrier) for task in tasks]
+        return sum(future.result() for future in futures)
+
+
+def read_windows(conn):
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT record_count, sum_aqi FROM air_quality_window_summary WHERE window_seconds = ? ORDER BY window_start",
+        WINDOW_SECONDS,
+    )
+    rows = cur.fetchall()
+    cur.close()
+    conn.commit()
+    return rows
+
+
+def clear_windows(conn):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM air_quality_window_summary WHERE window_seconds = ?", WINDOW_SECONDS)
+    conn.commit()
+
+
+def check(conn, description, expected_count, expected_sum, errors):
+    rows = read_windows(conn)
+    wrong = [row for row in rows if row[0] != expected_count or abs(row[1] - expected_sum) > 1e-6]
+    ok = not errors and len(rows) == WINDOWS and not wrong
+    print(f"  {'✓' if ok else '✗'} {description}: {len(rows)}/{WINDOWS} 个窗口, 出错 {errors} 次, "
+          f"{len(wrong)} 个窗口与期望 (record_count={expected_count}, sum_aqi={expected_sum}) 不符")
+    return ok
+
+
+def main():
+    print("=" * 80)
+    print(f"窗口汇总并发测试 ({get_backend()} 后端): {THREADS} 个线程, {WINDOWS} 个窗口")
+    print("=" * 80)
+    if get_backend() == "sqlite":
+        print("  ⚠ SQLite 后端：只验证锁提示的模拟，真正的并发行为请在 Azure SQL 上运行")
+
+    conn = get_sql_connection()
+    try:
+        clear_windows(conn)
+
+        # 1. 所有线程同时创建同样的新窗口：UPDATE 找不到行后的 INSERT 不能撞上主键
+        errors = run_concurrently([merge_all_windows] * THREADS)
+        count = THREADS * ROWS_PER_MERGE
+        total = count * MERGED_VALUES[2]
+        passed = check(conn, "并发创建窗口", count, total, errors)
+
+        # 2. 一半线程继续合并，另一半同时修正：修正写回绝对值，不能覆盖别人已提交的合并
+        mergers = THREADS // 2
+        correctors = THREADS - mergers
+        errors = run_concurrently([merge_all_windows] * mergers + [correct_all_windows] * correctors)
+        count += mergers * ROWS_PER_MERGE
+        total += mergers * ROWS_PER_MERGE * MERGED_VALUES[2] + correctors * (NEW_VALUES[2] - OLD_VALUES[2])
+        passed = check(conn, "合并与修正交错", count, total, errors) and passed
+
+        # 3. 同一事务中既修正又合并：正序线程先修正 i 再合并 N-1-i，倒序线程反过来，不能互相死锁
+        forward = THREADS // 2
+        errors = run_concurrently([correct_and_merge] * forward + [correct_and_merge_reversed] * (THREADS - forward))
+        count += THREADS * ROWS_PER_MERGE
+        total += THREADS * (ROWS_PER_MERGE * MERGED_VALUES[2] + NEW_VALUES[2] - OLD_VALUES[2])
+        passed = check(conn, "同一事务中修正与合并", count, total, errors) and passed
+    finally:
+        clear_windows(conn)
+        conn.close()
+
+    if not passed:
+        raise SystemExit("✗ 并发写窗口汇总时丢失了更新或出错")
+    print("✓ 并发合并与修正后窗口汇总正确")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""Named workload profiles for the reading generator.
+
+``uniform`` is the original workload: every reading of a batch is stamped
+with the invocation time (plus the per-station microsecond ordinal) and
+stations are picked uniformly at random. The other profiles model how a
+sensor network actually reports, each built from the same switches:
+
+- ``sampled``: every station reports at a fixed rate, its readings spread
+  evenly over the invocation period (``period_sec``, one minute for the
+  timer schedule) from a random per-station phase.
+- ``diurnal``: ``sampled`` with values following a daily curve; PM2.5/PM10
+  peak with the morning and evening rush hours, O3 in the afternoon.
+- ``zipf``: ``sampled`` with station activity Zipf-skewed, station-1 the
+  busiest, so a few stations are hot spots.
+- ``bursty``: ``sampled`` where an invocation occasionally carries
+  ``burst_factor`` times the usual readings.
+- ``late``: ``sampled`` where a fraction of readings is held back and
+  delivered one to ``max_late_batches`` invocations later with its original
+  timestamp, after the on-time readings and so out of order.
+- ``realistic``: all of the above together.
+
+A :class:`WorkloadGenerator` keeps the state these need between batches:
+the station phases, the end of the last sampling window and the held-back
+readings. Each batch covers the period before ``now``, but never starts
+before the previous window ended, so calling it faster than once a period
+(as the performance tests do) moves the windows ahead of the clock instead
+of overlapping them, and ``(station_id, recorded_at)`` stays unique for one
+generator. Held-back readings live in memory only and are lost with the
+process, like readings from a sensor that never reconnects.
+"""
+
+import datetime
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from reading_generator import (
+    O3_RANGE,
+    PM10_RANGE,
+    PM25_RANGE,
+    ReadingBatch,
+    generate_batch,
+    station_table,
+)
+
+DEFAULT_PERIOD_SEC = 60.0
+
+
+class WorkloadProfile(NamedTuple):
+    name: str
+    spread: bool = True
+    period_sec: float = DEFAULT_PERIOD_SEC
+    zipf_exponent: float = 0.0
+    diurnal_amplitude: float = 0.0
+    burst_probability: float = 0.0
+    burst_factor: int = 1
+    late_fraction: float = 0.0
+    max_late_batches: int = 0
+
+
+PROFILES: Dict[str, WorkloadProfile] = {
+    profile.name: profile
+    for profile in (
+        WorkloadProfile("uniform", spread=False),
+        WorkloadProfile("sampled"),
+        WorkloadProfile("diurnal", diurnal_amplitude=0.5),
+        WorkloadProfile("zipf", zipf_exponent=1.1),
+        WorkloadProfile("bursty", burst_probability=0.1, burst_factor=10),
+        WorkloadProfile("late", late_fraction=0.05, max_late_batches=5),
+        WorkloadProfile(
+            "realistic",
+            zipf_exponent=1.1,
+            diurnal_amplitude=0.5,
+            burst_probability=0.1,
+            burst_factor=10,
+            late_fraction=0.05,
+            max_late_batches=5,
+        ),
+    )
+}
+
+
+def get_profile(name: str, period_sec: Optional[float] = None) -> WorkloadProfile:
+    """Return the profile called ``name``, optionally with its sampling period replaced."""
+    try:
+        profile = PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown workload profile {name!r}; expected one of {tuple(PROFILES)}") from None
+    return profile._replace(period_sec=period_sec) if period_sec is not None else profile
+
+
+def station_weights(station_count: int, zipf_exponent: float) -> np.ndarray:
+    """Share of readings per station: uniform, or ``1 / rank ** zipf_exponent`` normalised."""
+    weights = 1.0 / np.arange(1, station_count + 1) ** zipf_exponent
+    return weights / weights.sum()
+
+
+def allocate(total: int, weights: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Split ``total`` readings across stations in proportion to ``weights``.
+
+    Each station gets the whole part of its share; the leftover readings go
+    to stations drawn by weight, so rounding favours no station in particular.
+    """
+    counts = np.floor(total * weights).astype(np.int64)
+    leftover = total - int(counts.sum())
+    if leftover:
+        counts += np.bincount(rng.choice(len(weights), size=leftover, p=weights), minlength=len(weights))
+    return counts
+
+
+def diurnal_factors(timestamps: np.ndarray, amplitude: float):
+    """Return ``(pm, o3)`` multipliers in ``[1 - amplitude, 1 + amplitude]`` for each UTC timestamp."""
+    day = timestamps.astype("datetime64[D]")
+    hours = (timestamps - day).astype("timedelta64[us]").astype(np.float64) / 3.6e9
+    pm = 1 + amplitude * np.cos(4 * np.pi * (hours - 8) / 24)
+    o3 = 1 + amplitude * np.cos(2 * np.pi * (hours - 15) / 24)
+    return pm, o3
+
+
+def _scaled(rng, value_range, size, factor, amplitude):
+    # A uniform draw over [0, factor / (1 + amplitude)] of the range: the mean follows the
+    # curve and the peak still spans the whole range, so nothing needs clipping.
+    low, high = value_range
+    return np.round(low + (high - low) * rng.uniform(size=size) * factor / (1 + amplitude), 2)
+
+
+def _take(batch: ReadingBatch, index) -> ReadingBatch:
+    return ReadingBatch(*(column[index] for column in batch.columns.values()))
+
+
+def _concat(batches: List[ReadingBatch]) -> ReadingBatch:
+    return ReadingBatch(*(
+        np.concatenate([batch.columns[name] for batch in batches])
+        for name in ReadingBatch.__slots__
+    ))
+
+
+class WorkloadGenerator:
+    """Produce successive batches of one profile for ``station_count`` stations.
+
+    The stations are ``station-{station_offset + 1}`` onwards; generators
+    with disjoint station ranges can run side by side without sharing a key.
+    """
+
+    def __init__(
+        self,
+        profile: WorkloadProfile,
+        station_count: int,
+        rng: Optional[np.random.Generator] = None,
+        station_offset: int = 0,
+    ):
+        self.profile = profile
+        self.station_count = station_count
+        self.station_offset = station_offset
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self._weights = station_weights(station_count, profile.zipf_exponent)
+        self._phases = self.rng.uniform(size=station_count)
+        self._window_end: Optional[np.datetime64] = None
+        self._batches = 0
+        self._held: Dict[int, List[ReadingBatch]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def held_back(self) -> int:
+        """Readings waiting to be delivered late."""
+        return sum(len(batch) for batches in self._held.values() for batch in batches)
+
+    def next_batch(self, batch_size: int, now: Optional[datetime.datetime] = None) -> ReadingBatch:
+        """Return the readings that arrive in this invocation.
+
+        That is ``batch_size`` readings (``burst_factor`` times as many in a
+        burst), less those held back, plus earlier readings now due.
+        """
+        if now is None:
+            now = datetime.datetime.utcnow()
+        with self._lock:
+            if not self.profile.spread:
+                return generate_batch(
+                    batch_size, self.station_count, rng=self.rng, recorded_at=now, station_offset=self.station_offset
+                )
+
+            self._batches += 1
+            if self.profile.burst_probability and self.rng.uniform() < self.profile.burst_probability:
+                batch_size *= self.profile.burst_factor
+            batch = self._sampled(batch_size, np.datetime64(now, "us"))
+            if self.profile.late_fraction:
+                late = self.rng.uniform(size=len(batch)) < self.profile.late_fraction
+                delays = self.rng.integers(1, self.profile.max_late_batches + 1, size=len(batch))
+                for delay in np.unique(delays[late]):
+                    self._held.setdefault(self._batches + int(delay), []).append(_take(batch, late & (delays == delay)))
+                batch = _take(batch, ~late)
+            due = self._held.pop(self._batches, [])
+            return _concat([batch] + due) if due else batch
+
+    def _sampled(self, batch_size: int, now: np.datetime64) -> ReadingBatch:
+        period = np.timedelta64(int(self.profile.period_sec * 1e6), "us")
+        start = now - period
+        if self._window_end is not None and start < self._window_end:
+            start = self._window_end
+        self._window_end = start + period
+
+        counts = allocate(batch_size, self._weights, self.rng)
+        stations = np.repeat(np.arange(self.station_count), counts)
+        ordinal = np.arange(len(stations)) - np.repeat(np.cumsum(counts) - counts, counts)
+        # Whole microseconds apart as long as a station reports at most once per microsecond.
+        interval = period.astype(np.float64) / counts[stations]
+        offsets = np.floor((self._phases[stations] + ordinal) * interval).astype(np.int64)
+        timestamps = start + offsets.astype("timedelta64[us]")
+
+        # Readings arrive roughly in the order they were taken, across all stations.
+        order = np.argsort(timestamps, kind="stable")
+        stations = stations[order]
+        timestamps = timestamps[order]
+
+        size = len(stations)
+        amplitude = self.profile.diurnal_amplitude
+        if amplitude:
+            pm_factor, o3_factor = diurnal_factors(timestamps, amplitude)
+        else:
+            pm_factor = o3_factor = 1.0
+        pm25 = _scaled(self.rng, PM25_RANGE, size, pm_factor, amplitude)
+        pm10 = _scaled(self.rng, PM10_RANGE, size, pm_factor, amplitude)
+        o3 = _scaled(self.rng, O3_RANGE, size, o3_factor, amplitude)
+        aqi = ((pm25 + pm10 + o3) / 3).astype(np.int64)
+        station_ids = station_table(self.station_offset + self.station_count)[self.station_offset + stations]
+        return ReadingBatch(station_ids, timestamps, pm25, pm10, o3, aqi)